@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# Benchmarks of the operators, of loading relations, of the optimizer and
+# of whole queries, on relations generated with the same shape as the
+# samples (people, skills, rooms, person_room) and with as many people as
+# the scale.
+#
+# The relations only depend on the scale and on the seed, so reports of
+# different runs can be compared:
+#
+#   ./benchmark.py --scale 1e3 1e5 --output new.json --compare old.json
+#
+# exits with 1 if any benchmark got slower than the threshold.
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+from math import isqrt
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from relational import parser, optimizer, executor
+from relational.relation import Relation, Header
+
+
+# Format of the report
+REPORT_VERSION = 1
+
+# Maximum amount of tuples created by products and theta joins,
+# their inputs are cut to stay below it
+PRODUCT_MAX = 10 ** 6
+
+# Benchmarks faster than this are not considered regressions,
+# their time is mostly noise
+NOISE = 0.001
+
+NAMES = ('jack', 'carl', 'john', 'dean', 'eve', 'duncan', 'paul', 'alia',
+         'leto', 'jessica', 'stilgar', 'chani', 'irulan', 'gurney', 'thufir')
+
+SKILLS = ('C', 'C++', 'Java', 'Python', 'PHP', 'Rust', 'Go', 'Haskell',
+          'Perl', 'Lisp', 'SQL', 'Ruby', 'Bash', 'Scala', 'Erlang', 'OCaml')
+
+# Queries benchmarked with the optimizer and end to end
+QUERIES = {
+    'select_join': 'π name, skill (σ age > 60 (people) ⋈ skills)',
+    'chain_join': 'π name, phone (people ⋈ person_room ⋈ rooms)',
+    'chief_skill': 'π name (σ skill == \'Rust\' (people ⋈ skills)) ∩ π name (σ chief < 10 (people))',
+    'without_skill': 'π name (people) - π name (people ⋈ σ skill == \'C\' (skills))',
+    'pushdown': 'σ age > 30 and skill == \'Python\' (people ⋈ skills ⋈ person_room)',
+    'oldest': 'people - π id,name,chief,age (σ a > age (ρ id➡i,age➡a (π id,age (people)) * people))',
+}
+
+
+# Setup, returning the arguments, and function to time
+Benchmark = Tuple[Callable[[], Tuple], Callable[..., Any]]
+
+
+def generate(scale: int, seed: int = 0) -> Dict[str, Relation]:
+    '''
+    Generates the relations for the scale.
+
+    people has scale tuples, skills about 2 per person,
+    person_room one per person and rooms one every 10 people.
+    '''
+    rng = random.Random('%d:%d' % (seed, scale))
+    nrooms = max(scale // 10, 1)
+
+    people = [
+        (i, '%s%d' % (rng.choice(NAMES), i), rng.randrange(max(i, 1)), rng.randint(18, 70))
+        for i in range(scale)
+    ]
+    skills = {
+        (rng.randrange(scale), rng.choice(SKILLS))
+        for _ in range(scale * 2)
+    }
+    rooms = [(i, 1000 + rng.randrange(9000)) for i in range(nrooms)]
+    person_room = [(i, rng.randrange(nrooms)) for i in range(scale)]
+
+    return {
+        'people': Relation(Header(('id', 'name', 'chief', 'age')), frozenset(people)),
+        'skills': Relation(Header(('id', 'skill')), frozenset(skills)),
+        'rooms': Relation(Header(('room', 'phone')), frozenset(rooms)),
+        'person_room': Relation(Header(('id', 'room')), frozenset(person_room)),
+    }
+
+
+def _sample(rel: Relation, size: int) -> Relation:
+    '''Returns a relation with size tuples of rel, always the same ones.'''
+    return Relation(rel.header, frozenset(sorted(rel.content)[:size]))
+
+
+def _arguments(*args: Any, fresh: bool = False) -> Callable[[], Tuple]:
+    '''
+    Returns the setup giving the arguments.
+
+    If fresh is True, the relations in the last argument are copied
+    every time, without the statistics and columns kept with them.
+    '''
+    if not fresh:
+        return lambda: args
+
+    def setup() -> Tuple:
+        rels: Dict[str, Relation] = args[-1]
+        return args[:-1] + ({k: Relation(v.header, v.content) for k, v in rels.items()},)
+    return setup
+
+
+def _time(function: Callable[..., Any], setup: Callable[[], Tuple] = tuple, repeat: int = 3) -> Tuple[float, Any]:
+    '''
+    Calls function repeat times, with the arguments returned by setup,
+    which is not timed.
+
+    Returns the fastest time and the result.
+    '''
+    best = None
+    result = None
+    for _ in range(repeat):
+        args = setup()
+        start = perf_counter()
+        result = function(*args)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    assert best is not None
+    return best, result
+
+
+def _optimize(tree: parser.Node, rels: Dict[str, Relation]) -> parser.Node:
+    r = optimizer.optimize_all(tree, rels, tostr=False)
+    assert isinstance(r, parser.Node)
+    return r
+
+
+def _query(query: str, rels: Dict[str, Relation]) -> Relation:
+    '''Parses, optimizes and executes the query.'''
+    return executor.execute(_optimize(parser.tree(query), rels), rels)
+
+
+def benchmarks(rels: Dict[str, Relation]) -> Dict[str, Benchmark]:
+    '''
+    Returns the benchmarks to run on the relations, by name.
+
+    Every benchmark is the setup, returning the arguments, and
+    the function to time.
+    '''
+    people = rels['people']
+    skills = rels['skills']
+    rooms = rels['rooms']
+    person_room = rels['person_room']
+
+    # Inputs of the operators
+    side = isqrt(PRODUCT_MAX)
+    small_people = _sample(people, side)
+    small_rooms = _sample(rooms, side)
+    old = people.selection('age > 40')
+    chiefs = people.selection('chief < id // 2')
+    languages = Relation(Header(('skill',)), frozenset((i,) for i in SKILLS[:2]))
+    other_room = person_room.rename({'room': 'other'})
+
+    operators: Dict[str, Tuple[Callable, Tuple]] = {
+        'selection': (Relation.selection, (people, 'age > 40')),
+        'selection_python': (Relation.selection, (people, 'name.startswith(\'j\') and age > 40')),
+        'projection': (Relation.projection, (people, 'chief', 'age')),
+        'rename': (Relation.rename, (people, {'name': 'n', 'age': 'a'})),
+        'product': (Relation.product, (small_people, small_rooms)),
+        'thetajoin': (Relation.thetajoin, (small_people, small_rooms, 'id == room and age > 30')),
+        'union': (Relation.union, (old, chiefs)),
+        'intersection': (Relation.intersection, (old, chiefs)),
+        'difference': (Relation.difference, (old, chiefs)),
+        'division': (Relation.division, (skills, languages)),
+        'join': (Relation.join, (people, skills)),
+        'outer_left': (Relation.outer_left, (people, skills)),
+        'outer_right': (Relation.outer_right, (skills, people)),
+        'outer': (Relation.outer, (person_room, other_room)),
+        'semijoin': (Relation.semijoin, (people, skills)),
+        'antijoin': (Relation.antijoin, (people, skills)),
+        'aggregate': (Relation.aggregate, (people, ['chief'], [('n', 'count', None), ('oldest', 'max', 'age')])),
+    }
+
+    r: Dict[str, Benchmark] = {}
+    for name, (method, args) in operators.items():
+        r['operator.' + name] = (_arguments(*args), method)
+
+    r['load.csv'] = (_saved(people, 'csv', Relation.save_csv), Relation.load_csv)
+    r['load.json'] = (_saved(people, 'json', Relation.save), Relation.load)
+
+    for name, query in QUERIES.items():
+        # The statistics are computed again every time
+        r['optimize.' + name] = (_arguments(parser.tree(query), rels, fresh=True), _optimize)
+        r['query.' + name] = (_arguments(query, rels, fresh=True), _query)
+    return r
+
+
+_tmpdir: Optional[str] = None
+
+
+def _path(extension: str) -> str:
+    '''Path of the temporary file used by the load benchmarks.'''
+    global _tmpdir
+    if _tmpdir is None:
+        _tmpdir = tempfile.mkdtemp(prefix='relational_benchmark')
+    return os.path.join(_tmpdir, 'people.' + extension)
+
+
+def _cleanup() -> None:
+    '''Removes the temporary files used by the load benchmarks.'''
+    global _tmpdir
+    if _tmpdir is not None:
+        shutil.rmtree(_tmpdir, ignore_errors=True)
+        _tmpdir = None
+
+
+def _saved(rel: Relation, extension: str, save: Callable[[Relation, str], None]) -> Callable[[], Tuple[str]]:
+    '''Saves the relation in a temporary file, and returns the setup to load it.'''
+    path = _path(extension)
+    save(rel, path)
+    return lambda: (path,)
+
+
+def run(scales: List[int], seed: int = 0, repeat: int = 3, only: Optional[str] = None, verbose: bool = True) -> Dict[str, Any]:
+    '''
+    Runs the benchmarks for every scale, and returns the report.
+
+    only: if set, only the benchmarks whose name contains it are run.
+    '''
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    try:
+        for scale in scales:
+            if verbose:
+                print('Generating relations with scale %d' % scale)
+            rels = generate(scale, seed)
+            results[str(scale)] = r = {}
+            for name, benchmark in benchmarks(rels).items():
+                if only is not None and only not in name:
+                    continue
+                setup, function = benchmark
+                elapsed, result = _time(function, setup, repeat)
+                r[name] = {'seconds': elapsed}
+                if isinstance(result, Relation):
+                    r[name]['rows'] = len(result)
+                if verbose:
+                    print('%-28s %12.6fs' % (name, elapsed))
+    finally:
+        _cleanup()
+
+    return {
+        'version': REPORT_VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 1.25) -> List[Tuple[str, str, float, float]]:
+    '''
+    Compares two reports and returns the regressions, as
+    (scale, name, old seconds, new seconds).
+
+    A benchmark is a regression when it takes more than
+    threshold times the time it took before.
+    Benchmarks that are missing in either report are ignored.
+    '''
+    r = []
+    for scale, results in new['results'].items():
+        previous = old['results'].get(scale, {})
+        for name, result in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]['seconds']
+            after = result['seconds']
+            if after > NOISE and after > before * threshold:
+                r.append((scale, name, before, after))
+    return r
+
+
+def main() -> int:
+    argparser = argparse.ArgumentParser(description='Benchmarks of relational')
+    argparser.add_argument('--scale', type=float, nargs='+', default=[1e3, 1e4],
+                           help='amount of people in the generated relations, from 1e3 to 1e7')
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument('--repeat', type=int, default=3,
+                           help='times every benchmark is run, the fastest is reported')
+    argparser.add_argument('--only', help='only run the benchmarks containing this string')
+    argparser.add_argument('--output', help='file where to write the json report')
+    argparser.add_argument('--compare', help='report of a previous run to compare with')
+    argparser.add_argument('--threshold', type=float, default=1.25,
+                           help='slowdown ratio considered a regression')
+    args = argparser.parse_args()
+
+    report = run([int(i) for i in args.scale], args.seed, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old.get('version') != REPORT_VERSION or old.get('seed') != args.seed:
+            print('The reports are not comparable')
+            return 2
+        regressions = compare(old, report, args.threshold)
+        for scale, name, before, after in regressions:
+            print('Regression at scale %s: %s %.6fs ➡ %.6fs (%.2fx)' % (scale, name, before, after, after / before))
+        if regressions:
+            return 1
+        print('No regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
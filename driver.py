@@ -22,7 +22,7 @@ from sys import exit
 import sys
 import traceback
 
-from relational import relation, parser, optimizer
+from relational import relation, parser, optimizer, executor
 from xtermcolor import colorize
 
 
@@ -215,6 +215,12 @@ def run_fail_test(testname):
     except:
         pass
 
+    try:
+        executor.execute(parser.tree(query), rels)
+        test_succeed = False
+    except:
+        pass
+
     if test_succeed:
         print(colorize('Test passed', COLOR_GREEN))
     else:
@@ -253,7 +259,9 @@ def run_test(testname):
         c_expr = parser.tree(query).toCode()
         c_result = eval(c_expr, rels)
 
-        if (o_result == result_rel) and (result == result_rel) and (c_result == result_rel):
+        e_result = executor.execute(parser.tree(query), rels)
+
+        if (o_result == result_rel) and (result == result_rel) and (c_result == result_rel) and (e_result == result_rel):
             print(colorize('Test passed', COLOR_GREEN))
             return True
     except Exception as inst:
@@ -0,0 +1,328 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module provides a columnar representation of relations.
+#
+# Every attribute is stored in its own column. Columns containing only
+# int, float or Rdate values are stored in arrays, so they take a few
+# bytes per value instead of a python object, and can be scanned
+# quickly.
+#
+# The conversion between a Relation and its ColumnStore is done lazily
+# and the result is kept, so it happens only once.
+
+from array import array
+from datetime import date
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from relational.relation import Relation, Header
+from relational.rtypes import Rdate, CastValue
+
+
+__all__ = [
+    'Column',
+    'ColumnStore',
+]
+
+
+# Types stored in arrays and their typecodes.
+# Rdate are stored using their ordinal.
+TYPECODES = {
+    int: 'q',
+    float: 'd',
+    Rdate: 'i',
+}
+
+
+class Column:
+    '''
+    A column of values.
+
+    The type of the column is the type of its first value that is not None.
+    If it is int, float or Rdate, the values are stored in an array,
+    otherwise in a list. If a value of a different type is added, the
+    column becomes a list of any type, whose kind is object.
+
+    None values are marked in the nulls bitmap, and in an array
+    a 0 takes their place.
+    '''
+
+    def __init__(self) -> None:
+        # None until the first value that is not None is added
+        self.kind: Optional[type] = None
+        self.values: Union[array, List[Any]] = []
+        self.nulls = bytearray()
+        self.nullcount = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self) -> Iterator[CastValue]:
+        if self.nullcount == 0 and self.kind is not Rdate:
+            return iter(self.values)
+        return (self.get(i) for i in range(len(self.values)))
+
+    def is_null(self, i: int) -> bool:
+        return bool(self.nulls[i >> 3] & (1 << (i & 7)))
+
+    def get(self, i: int) -> CastValue:
+        '''Returns the value at position i.'''
+        if self.nullcount and self.is_null(i):
+            return None
+        value = self.values[i]
+        if self.kind is Rdate and isinstance(self.values, array):
+            d = date.fromordinal(value)
+            return Rdate(d.year, d.month, d.day)
+        return value
+
+    def is_typed(self) -> bool:
+        '''True if the values are stored in an array.'''
+        return isinstance(self.values, array)
+
+    def append(self, value: CastValue) -> None:
+        i = len(self.values)
+        if i & 7 == 0:
+            self.nulls.append(0)
+
+        if value is None:
+            self.nulls[i >> 3] |= 1 << (i & 7)
+            self.nullcount += 1
+            self.values.append(0 if isinstance(self.values, array) else None)
+            return
+
+        if self.kind is None:
+            self._set_kind(type(value))
+        elif self.kind is not type(value) and self.kind is not object:
+            self._to_list()
+
+        if isinstance(self.values, array):
+            try:
+                if self.kind is Rdate:
+                    assert isinstance(value, Rdate)
+                    self.values.append(value.intdate.toordinal())
+                else:
+                    self.values.append(value)
+                return
+            except OverflowError:
+                # Does not fit in 64 bits
+                self._to_list()
+        self.values.append(value)
+
+    def extend(self, values: Tuple[CastValue, ...]) -> None:
+        '''Appends many values at once.'''
+        kinds = set(map(type, values))
+        if len(self.values) or len(kinds) != 1 or type(None) in kinds:
+            # append marks the None values
+            for v in values:
+                self.append(v)
+            return
+
+        kind = kinds.pop()
+        self.kind = kind
+        self.nulls = bytearray((len(values) + 7) >> 3)
+        try:
+            if kind is Rdate:
+                self.values = array(TYPECODES[kind], (v.intdate.toordinal() for v in values))  # type: ignore
+            elif kind in TYPECODES:
+                self.values = array(TYPECODES[kind], values)  # type: ignore
+            else:
+                self.values = list(values)
+        except OverflowError:
+            self.values = list(values)
+            self.kind = object
+
+    def take(self, positions: Iterable[int]) -> 'Column':
+        '''Returns a new column with the values at the given positions.'''
+        r = Column()
+        r.kind = self.kind
+        values = self.values
+        if self.nullcount == 0:
+            selected = [values[i] for i in positions]
+            r.values = array(values.typecode, selected) if isinstance(values, array) else selected
+            r.nulls = bytearray((len(selected) + 7) >> 3)
+            return r
+
+        r.values = array(values.typecode) if isinstance(values, array) else []
+        for i in positions:
+            j = len(r.values)
+            if j & 7 == 0:
+                r.nulls.append(0)
+            if self.is_null(i):
+                r.nulls[j >> 3] |= 1 << (j & 7)
+                r.nullcount += 1
+            r.values.append(values[i])
+        return r
+
+    def _set_kind(self, kind: type) -> None:
+        '''Sets the type, when the first value that is not None arrives.'''
+        self.kind = kind
+        if kind in TYPECODES:
+            self.values = array(TYPECODES[kind], [0] * len(self.values))
+
+    def _to_list(self) -> None:
+        '''Stores the values in a list, allowing any type.'''
+        self.values = [self.get(i) for i in range(len(self.values))]
+        self.kind = object
+
+
+class ColumnStore:
+    '''
+    Columnar representation of a relation.
+
+    It can be created from a Relation, with ColumnStore.from_relation or
+    Relation.columns(), and converted back with to_relation().
+
+    Rows can be added with add(), which uses a uniqueness index, built
+    on the first use, to keep set semantics.
+    '''
+
+    def __init__(self, header: Iterable[str]) -> None:
+        self.header = Header(header)
+        self.columns = [Column() for _ in self.header]
+        self.length = 0
+
+        # True when the rows are in the same order as the
+        # content of the relation they are linked to
+        self.ordered = False
+
+        # hash of a row -> position (or positions, in case of collisions)
+        self._index: Optional[Dict[int, Union[int, List[int]]]] = None
+        self._relation: Optional[Relation] = None
+
+    @staticmethod
+    def from_relation(rel: Relation) -> 'ColumnStore':
+        '''
+        Creates the columnar representation of a relation.
+
+        The result is kept with the relation, and the relation
+        with the result, so the conversion is not repeated.
+        '''
+        store = ColumnStore(rel.header)
+        for i, column in enumerate(store.columns):
+            column.extend(tuple(map(itemgetter(i), rel.content)))
+        store.length = len(rel.content)
+        store.ordered = True
+        store._link(rel)
+        return store
+
+    @staticmethod
+    def from_rows(header: Iterable[str], rows: Iterable[Tuple[CastValue, ...]]) -> 'ColumnStore':
+        '''
+        Creates a columnar relation from the rows, skipping
+        the duplicates.
+        '''
+        store = ColumnStore(header)
+        for row in rows:
+            store.add(row)
+        return store
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        return zip(*self.columns)
+
+    def __contains__(self, row: Tuple[CastValue, ...]) -> bool:
+        return self._find(row) is not None
+
+    def row(self, i: int) -> Tuple[CastValue, ...]:
+        '''Returns the tuple at position i.'''
+        return tuple(c.get(i) for c in self.columns)
+
+    def column(self, attribute: str) -> Column:
+        '''Returns the column of an attribute.'''
+        return self.columns[self.header.getAttributesId((attribute, ))[0]]
+
+    def add(self, row: Tuple[CastValue, ...]) -> bool:
+        '''
+        Adds a tuple, unless it is already present.
+
+        Returns True if the tuple was added.
+        '''
+        if len(row) != len(self.header):
+            raise ValueError('Tuple %s has an incorrect amount of values' % repr(row))
+        if self._find(row) is not None:
+            return False
+
+        if self._relation is not None:
+            # The relation is immutable, it no longer represents this
+            object.__setattr__(self._relation, '_columns', None)
+            self._relation = None
+            self.ordered = False
+
+        h = hash(row)
+        position = self.length
+        self._append(row)
+
+        assert self._index is not None
+        prev = self._index.get(h)
+        if prev is None:
+            self._index[h] = position
+        elif isinstance(prev, list):
+            prev.append(position)
+        else:
+            self._index[h] = [prev, position]
+        return True
+
+    def take(self, positions: List[int]) -> 'ColumnStore':
+        '''Returns a new store with the tuples at the given positions.'''
+        r = ColumnStore(self.header)
+        r.columns = [c.take(positions) for c in self.columns]
+        r.length = len(positions)
+        return r
+
+    def to_relation(self) -> Relation:
+        '''Returns the relation with the same content.'''
+        if self._relation is None:
+            self._link(Relation(self.header, frozenset(self)))
+        assert self._relation is not None
+        return self._relation
+
+    def _append(self, row: Tuple[CastValue, ...]) -> None:
+        for c, v in zip(self.columns, row):
+            c.append(v)
+        self.length += 1
+
+    def _link(self, rel: Relation) -> None:
+        self._relation = rel
+        object.__setattr__(rel, '_columns', self)
+
+    def _find(self, row: Tuple[CastValue, ...]) -> Optional[int]:
+        '''Returns the position of the tuple, if present.'''
+        if self._index is None:
+            self._index = {}
+            for i, t in enumerate(self):
+                h = hash(t)
+                prev = self._index.get(h)
+                if prev is None:
+                    self._index[h] = i
+                elif isinstance(prev, list):
+                    prev.append(i)
+                else:
+                    self._index[h] = [prev, i]
+
+        positions = self._index.get(hash(row))
+        if positions is None:
+            return None
+        if not isinstance(positions, list):
+            positions = [positions]
+        for i in positions:
+            if self.row(i) == row:
+                return i
+        return None
@@ -0,0 +1,275 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module executes the parse trees of the queries, by walking them
+# and choosing a physical operator for every node.
+#
+# The Executor class has hooks that are called for every node, and can be
+# overridden by subclasses to measure, cache, or use different operators.
+
+import ast
+import builtins
+from gettext import gettext as _
+from typing import Dict, List, Optional, Set, Tuple
+
+from relational.relation import Relation, VECTORIZED_SELECTION_MIN
+from relational.parser import Node, Variable, Unary, Binary, op_functions, \
+    PRODUCT, DIFFERENCE, INTERSECTION, DIVISION, JOIN, JOIN_LEFT, JOIN_RIGHT, \
+    SEMIJOIN, ANTIJOIN, PROJECTION, SELECTION, RENAME, GROUP
+from relational.physical import Operator, Scan, Selection, Projection, \
+    Rename, HashJoin, IndexSelection, IndexJoin, SemiJoin, Materialize, Empty, is_empty
+from relational import index, vectorized
+
+
+__all__ = [
+    'Executor',
+    'execute',
+    'is_false',
+]
+
+
+# Operators whose result is empty when the left operand is
+_EMPTY_LEFT = {PRODUCT, DIFFERENCE, INTERSECTION, DIVISION, JOIN, JOIN_LEFT, SEMIJOIN, ANTIJOIN}
+# Operators whose result is empty when the right operand is
+_EMPTY_RIGHT = {PRODUCT, INTERSECTION, JOIN, JOIN_RIGHT, SEMIJOIN}
+
+
+class Executor:
+    '''
+    Executes expression trees on a dictionary of relations.
+
+    evaluate() is called on every node, and it calls these hooks:
+
+    before(node): can return an operator to use for the node
+        instead of evaluating it.
+    inputs(node): returns the nodes whose results are
+        the input of the node.
+    operator(node, inputs): chooses the physical operator for the
+        node, given the operators of its inputs.
+    after(node, op): can replace the operator of the node, for
+        example to wrap it.
+    '''
+
+    # Whether the inputs that don't change an empty result are skipped
+    skip_empty = True
+
+    def __init__(self, rels: Dict[str, Relation]) -> None:
+        self.rels = rels
+
+    def execute(self, node: Node) -> Relation:
+        '''Executes the expression and returns the result.'''
+        return self.evaluate(node).relation()
+
+    def evaluate(self, node: Node) -> Operator:
+        '''
+        Returns the operator that computes the node.
+
+        When the result is known to be empty, because of σ False or
+        because an input is empty, the remaining inputs are not
+        evaluated and the operator of the node is not used.
+
+        The tree is walked with a stack instead of recursion, so
+        deep trees can be executed.
+        '''
+        # The nodes whose inputs are being evaluated, with their
+        # inputs and the operators of the ones evaluated so far
+        stack: List[Tuple[Node, List[Node], List[Operator]]] = []
+        while True:
+            op = self.before(node)
+            if op is None and self.skip_empty and is_false(node):
+                op = self.empty(node, [])
+            if op is None:
+                children = self.inputs(node)
+                if children:
+                    stack.append((node, children, []))
+                    node = children[0]
+                    continue
+                op = self.operator(node, [])
+            op = self.after(node, op)
+
+            # Gives the operator to the parents that have all their inputs
+            while stack:
+                parent, children, inputs = stack[-1]
+                inputs.append(op)
+                if self.skip_empty and is_empty(op) and _empty_input(parent, len(inputs) - 1):
+                    op = self.empty(parent, inputs)
+                elif len(inputs) < len(children):
+                    node = children[len(inputs)]
+                    break
+                else:
+                    op = self.operator(parent, inputs)
+                stack.pop()
+                op = self.after(parent, op)
+            else:
+                return op
+
+    def empty(self, node: Node, inputs: List[Operator]) -> Empty:
+        '''
+        Returns the result of the node, known to be empty, given the
+        operators of the inputs that were evaluated.
+
+        The other inputs and the node are executed on empty relations,
+        so unknown relations and operands that are not compatible
+        fail like they would when computing them.
+        '''
+        validator = _Validator(self.rels)
+        ops: List[Operator] = [Empty(i.header) for i in inputs]
+        ops.extend(validator.evaluate(i) for i in self.inputs(node)[len(inputs):])
+        return Empty(validator.operator(node, ops).header)
+
+    def before(self, node: Node) -> Optional[Operator]:
+        return None
+
+    def after(self, node: Node, op: Operator) -> Operator:
+        return op
+
+    def inputs(self, node: Node) -> List[Node]:
+        if isinstance(node, Unary):
+            if is_thetajoin(node):
+                assert isinstance(node.child, Binary)
+                return [node.child.left, node.child.right]
+            return [node.child]
+        elif isinstance(node, Binary):
+            return [node.left, node.right]
+        return []
+
+    def operator(self, node: Node, inputs: List[Operator]) -> Operator:
+        if isinstance(node, Variable):
+            if node.name not in self.rels:
+                raise NameError('Unknown relation: %s' % node.name)
+            return Scan(self.rels[node.name])
+        elif isinstance(node, Unary):
+            if is_thetajoin(node):
+                return Materialize('thetajoin', inputs, node.prop)
+
+            child = inputs[0]
+            if node.name == SELECTION:
+                found = index.candidates(child.rel, node.prop) if isinstance(child, Scan) else None
+                if found is not None:
+                    assert isinstance(child, Scan)
+                    return IndexSelection(child, node.prop, *found)
+                if isinstance(child, Scan) and len(child.rel) >= VECTORIZED_SELECTION_MIN and \
+                        vectorized.supported(child.rel, node.prop):
+                    # Done on the columns of the relation
+                    return Materialize('selection', inputs, node.prop)
+                return Selection(child, node.prop)
+            elif node.name == PROJECTION:
+                return Projection(child, node.get_projection_prop())
+            elif node.name == RENAME:
+                return Rename(child, node.get_rename_prop())
+            elif node.name == GROUP:
+                return Materialize('aggregate', inputs, *node.get_aggregate_prop())
+        elif isinstance(node, Binary):
+            if node.name == JOIN:
+                shared = inputs[0].header.intersection(inputs[1].header)
+                for i, op in enumerate(inputs):
+                    hashed = _hash_index(op, shared)
+                    if hashed is not None:
+                        return IndexJoin(inputs[0], inputs[1], hashed, i == 0)
+                return HashJoin(inputs[0], inputs[1])
+            elif node.name in (SEMIJOIN, ANTIJOIN):
+                return SemiJoin(inputs[0], inputs[1], node.name == ANTIJOIN)
+            return Materialize(op_functions[node.name], inputs)
+        raise ValueError('What kind of alien object is this?')
+
+
+class _Validator(Executor):
+    '''
+    Executor where every relation is empty, used to find the errors
+    of a query without computing it.
+    '''
+
+    skip_empty = False
+
+    def operator(self, node: Node, inputs: List[Operator]) -> Operator:
+        if isinstance(node, Variable) and node.name in self.rels:
+            return Empty(self.rels[node.name].header)
+        return super().operator(node, inputs)
+
+    def after(self, node: Node, op: Operator) -> Operator:
+        # On empty relations the condition is never evaluated, but it
+        # would be on the relations of the inputs that are not computed
+        if isinstance(node, Unary) and node.name == SELECTION:
+            _check_names(node.prop, set(op.header))
+        return op
+
+
+def _check_names(expr: str, attributes: Set[str]) -> None:
+    '''
+    Raises NameError if the python expression of a selection uses
+    a name that is not an attribute, a builtin or a name that it
+    defines itself.
+
+    This is stricter than evaluating it, where a name is not needed
+    if the other operand of an and/or already decides the value.
+    '''
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        raise Exception(_('Failed to compile expression: %s') % expr)
+    names = [i for i in ast.walk(tree) if isinstance(i, (ast.Name, ast.arg))]
+    # Names defined by comprehensions and lambdas
+    defined = {i.id for i in names if isinstance(i, ast.Name) and not isinstance(i.ctx, ast.Load)}
+    defined.update(i.arg for i in names if isinstance(i, ast.arg))
+    for i in names:
+        if isinstance(i, ast.Name) and i.id not in attributes and \
+                i.id not in defined and not hasattr(builtins, i.id):
+            raise NameError('name %r is not defined' % i.id)
+
+
+def is_thetajoin(node: Node) -> bool:
+    '''True if the node is a selection on a product, which is done as a theta join.'''
+    return isinstance(node, Unary) and \
+        node.name == SELECTION and \
+        isinstance(node.child, Binary) and \
+        node.child.name == PRODUCT
+
+
+def is_false(node: Node) -> bool:
+    '''True if the node is σ False, whose result is empty.'''
+    return isinstance(node, Unary) and \
+        node.name == SELECTION and \
+        node.prop.strip() == 'False'
+
+
+def _hash_index(op: Operator, attributes: Set[str]) -> Optional[index.HashIndex]:
+    '''Returns a hash index on one of the attributes, if the operator scans a relation that has one.'''
+    if not isinstance(op, Scan):
+        return None
+    for i in sorted(attributes):
+        r = index.find(op.rel, i, index.HASH)
+        if isinstance(r, index.HashIndex):
+            return r
+    return None
+
+
+def _empty_input(node: Node, i: int) -> bool:
+    '''True if the result of the node is empty when its input i is.'''
+    if isinstance(node, Unary):
+        # Theta joins have two inputs, and are empty if either is
+        return True
+    elif isinstance(node, Binary):
+        if i == 0:
+            return node.name in _EMPTY_LEFT
+        return node.name in _EMPTY_RIGHT
+    return False
+
+
+def execute(node: Node, rels: Dict[str, Relation]) -> Relation:
+    '''Executes the expression and returns the result.'''
+    return Executor(rels).execute(node)
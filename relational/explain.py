@@ -0,0 +1,242 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module explains how queries are executed.
+#
+# explain() returns a Plan, which has a Step for every operation with its
+# estimated amount of tuples. When analyzing, the query is also executed,
+# and every step reports the physical operator that was used, the amount
+# of tuples that it received and returned, and the time spent in it.
+#
+# The time of a step is the time spent creating its operator, which is
+# when the materializing operators compute their result, plus the time
+# spent iterating over it. Streaming operators are wrapped to count their
+# tuples and measure that.
+
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from relational.relation import Relation
+from relational.rtypes import CastValue
+from relational.parser import Node, Variable, Unary
+from relational.executor import Executor
+from relational.physical import Operator, Scan, Materialize, Empty, IndexSelection, IndexJoin
+from relational.statistics import CostModel
+
+
+__all__ = [
+    'Step',
+    'Plan',
+    'explain',
+]
+
+
+@dataclass
+class Step:
+    '''
+    An operation of the plan.
+
+    rows, time and operator are only known after analyzing.
+    time includes the time spent in the inputs.
+    '''
+    node: Node
+    estimated: Optional[float] = None
+    operator: Optional[str] = None
+    rows: Optional[int] = None
+    time: float = 0.0
+    inputs: List['Step'] = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        if isinstance(self.node, Unary):
+            return '%s %s' % (self.node.name, self.node.prop.strip())
+        return self.node.name
+
+    @property
+    def input_rows(self) -> List[Optional[int]]:
+        return [i.rows for i in self.inputs]
+
+    @property
+    def own_time(self) -> float:
+        '''Time spent in this step, without the inputs.'''
+        return max(self.time - sum(i.time for i in self.inputs), 0.0)
+
+    @property
+    def throughput(self) -> Optional[float]:
+        '''
+        Tuples per second: the tuples received by the step, or the
+        returned ones if it has no inputs, divided by its own time.
+        '''
+        if self.rows is None or self.own_time == 0:
+            return None
+        tuples = sum(i or 0 for i in self.input_rows) if self.inputs else self.rows
+        return tuples / self.own_time
+
+    def walk(self, depth: int = 0) -> Iterator[Tuple[int, 'Step']]:
+        '''Iterates over the steps, with their depth in the plan.'''
+        # With a stack, so deep plans don't need recursion
+        stack = [(depth, self)]
+        while stack:
+            depth, step = stack.pop()
+            yield depth, step
+            stack.extend((depth + 1, i) for i in reversed(step.inputs))
+
+    def describe(self) -> str:
+        '''Returns the description of the step, in one line.'''
+        r = self.label
+        if self.operator is not None:
+            r += ' [%s]' % self.operator
+        if self.estimated is not None:
+            r += '  estimated: %d' % round(self.estimated)
+        if self.rows is not None:
+            r += '  rows: %d' % self.rows
+            if self.inputs:
+                r += '  input: %s' % ', '.join('?' if i is None else str(i) for i in self.input_rows)
+            r += '  time: %.3fms' % (self.own_time * 1000)
+            throughput = self.throughput
+            if throughput is not None:
+                r += '  %d tuples/s' % throughput
+        return r
+
+
+@dataclass
+class Plan:
+    '''
+    The steps to execute a query.
+
+    When analyzing, result is the result of the query and
+    time the total time to compute it.
+    '''
+    root: Step
+    analyzed: bool
+    result: Optional[Relation] = None
+    time: float = 0.0
+
+    def __iter__(self) -> Iterator[Step]:
+        return (step for _, step in self.root.walk())
+
+    def __str__(self) -> str:
+        lines = ['  ' * depth + step.describe() for depth, step in self.root.walk()]
+        if self.analyzed:
+            lines.append('Total time: %.3fms' % (self.time * 1000))
+        return '\n'.join(lines)
+
+
+class _Profiled(Operator):
+    '''Counts the tuples produced by a streaming operator, and the time it takes.'''
+
+    def __init__(self, op: Operator, step: Step) -> None:
+        self.op = op
+        self.step = step
+        self.header = op.header
+        step.rows = 0
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        step = self.step
+        it = iter(self.op)
+        while True:
+            start = perf_counter()
+            try:
+                row = next(it)
+            except StopIteration:
+                step.time += perf_counter() - start
+                return
+            step.time += perf_counter() - start
+            assert step.rows is not None
+            step.rows += 1
+            yield row
+
+
+class _Analyzer(Executor):
+    '''Executor that creates the steps of the plan while executing.'''
+
+    def __init__(self, rels: Dict[str, Relation], model: CostModel) -> None:
+        super().__init__(rels)
+        self.model = model
+        self.root: Optional[Step] = None
+        # Steps being evaluated, and when they started
+        self._stack: List[Tuple[Step, float]] = []
+
+    def before(self, node: Node) -> Optional[Operator]:
+        step = _step(node, self.model)
+        if self._stack:
+            self._stack[-1][0].inputs.append(step)
+        else:
+            self.root = step
+        self._stack.append((step, perf_counter()))
+        return None
+
+    def after(self, node: Node, op: Operator) -> Operator:
+        step, start = self._stack.pop()
+        step.operator = op.__class__.__name__
+        if isinstance(op, Materialize):
+            step.operator += ' (%s)' % op.method
+        elif isinstance(op, (IndexSelection, IndexJoin)):
+            step.operator += ' (%s index on %s)' % (op.index.kind, op.index.attribute)
+        if isinstance(op, (Scan, Materialize, Empty)):
+            # The result is already there, and the other
+            # operators check for these classes
+            step.rows = len(op.relation())
+        else:
+            op = _Profiled(op, step)
+        step.time += perf_counter() - start
+        return op
+
+
+def _step(node: Node, model: CostModel) -> Step:
+    step = Step(node)
+    try:
+        step.estimated = model.estimate(node).rows
+    except Exception:
+        # Invalid query, it fails when executing it
+        pass
+    return step
+
+
+def _estimate(node: Node, model: CostModel, executor: Executor) -> Step:
+    '''Creates the steps of the plan without executing it.'''
+    root = _step(node, model)
+    # The steps whose inputs must be created
+    stack = [root]
+    while stack:
+        step = stack.pop()
+        if not isinstance(step.node, Variable):
+            step.inputs = [_step(i, model) for i in executor.inputs(step.node)]
+            stack.extend(step.inputs)
+    return root
+
+
+def explain(node: Node, rels: Dict[str, Relation], analyze: bool = True) -> Plan:
+    '''
+    Returns the plan of the query, with the estimated amount
+    of tuples of every step.
+
+    If analyze is True, the query is also executed and the
+    actual amounts and times are reported.
+    '''
+    model = CostModel(rels)
+    if not analyze:
+        return Plan(_estimate(node, model, Executor(rels)), False)
+
+    analyzer = _Analyzer(rels, model)
+    start = perf_counter()
+    result = analyzer.execute(node)
+    elapsed = perf_counter() - start
+    assert analyzer.root is not None
+    return Plan(analyzer.root, True, result, elapsed)
@@ -0,0 +1,282 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module provides indexes on the attributes of relations.
+#
+# A hash index finds the tuples with a given value, a sorted index also
+# finds the ones in a range of values. They are created on request and
+# kept with the relation, so they are gone when a name is assigned to a
+# different relation. Relations are immutable, so an index is never out
+# of date.
+#
+# The executor uses them for selections whose condition compares an
+# attribute with a constant, and for the natural joins on an indexed
+# attribute.
+
+import ast
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+from relational.relation import Relation
+from relational.rtypes import CastValue, Rdate
+from gettext import gettext as _
+
+
+__all__ = [
+    'HASH',
+    'SORTED',
+    'HashIndex',
+    'SortedIndex',
+    'Index',
+    'create',
+    'drop',
+    'of',
+    'find',
+    'candidates',
+]
+
+
+HASH = 'hash'
+SORTED = 'sorted'
+
+
+class HashIndex:
+    '''
+    The tuples of a relation grouped by the value of an attribute.
+
+    It finds the tuples with a value equal to a given one.
+    '''
+    kind = HASH
+
+    def __init__(self, rel: Relation, attribute: str) -> None:
+        self.attribute = attribute
+        self.position = _position(rel, attribute)
+        self.table: Dict[CastValue, List[Tuple[CastValue, ...]]] = {}
+        position = self.position
+        for i in rel.content:
+            self.table.setdefault(i[position], []).append(i)
+
+    def __repr__(self) -> str:
+        return '%s(%r)' % (self.__class__.__name__, self.attribute)
+
+    def equal(self, value: CastValue) -> List[Tuple[CastValue, ...]]:
+        '''Returns the tuples where the attribute is equal to value.'''
+        return self.table.get(value, [])
+
+
+class SortedIndex:
+    '''
+    The tuples of a relation sorted by the value of an attribute.
+
+    It finds the tuples with a value equal to a given one, or in a
+    range. The values must be all int and float, or all Rdate, and
+    can't be None.
+
+    Selections can't contain dates, so the indexes on Rdate are only
+    used by calling range() and equal() directly.
+    '''
+    kind = SORTED
+
+    def __init__(self, rel: Relation, attribute: str) -> None:
+        self.attribute = attribute
+        self.position = _position(rel, attribute)
+        position = self.position
+
+        kinds = {type(i[position]) for i in rel.content}
+        if not (kinds.issubset((int, float)) or kinds == {Rdate}):
+            raise Exception(_('Sorted indexes are only possible on attributes with all int, float or date values'))
+        self.numeric = Rdate not in kinds
+
+        self.tuples = sorted(rel.content, key=itemgetter(position))
+        self.keys: List[Any] = [i[position] for i in self.tuples]
+
+    def __repr__(self) -> str:
+        return '%s(%r)' % (self.__class__.__name__, self.attribute)
+
+    def equal(self, value: CastValue) -> List[Tuple[CastValue, ...]]:
+        '''Returns the tuples where the attribute is equal to value.'''
+        return self.range(value, True, value, True)
+
+    def range(self, low: Optional[CastValue] = None, low_inclusive: bool = True,
+              high: Optional[CastValue] = None, high_inclusive: bool = True) -> List[Tuple[CastValue, ...]]:
+        '''
+        Returns the tuples where the attribute is between low and high.
+
+        A bound that is None is not checked.
+        '''
+        start = 0
+        end = len(self.keys)
+        if low is not None:
+            start = (bisect_left if low_inclusive else bisect_right)(self.keys, low)
+        if high is not None:
+            end = (bisect_right if high_inclusive else bisect_left)(self.keys, high)
+        return self.tuples[start:end] if start < end else []
+
+
+Index = Union[HashIndex, SortedIndex]
+
+_KINDS: Dict[str, Type[Index]] = {
+    HASH: HashIndex,
+    SORTED: SortedIndex,
+}
+
+
+def _position(rel: Relation, attribute: str) -> int:
+    if attribute not in rel.header:
+        raise Exception(_('Field not found: %s') % attribute)
+    return rel.header.index(attribute)
+
+
+def _indexes(rel: Relation) -> Dict[Tuple[str, str], Index]:
+    '''The indexes kept with the relation, by attribute and kind.'''
+    r = getattr(rel, '_indexes', None)
+    if r is None:
+        r = {}
+        object.__setattr__(rel, '_indexes', r)
+    return r
+
+
+def create(rel: Relation, attribute: str, kind: str = HASH) -> Index:
+    '''
+    Creates an index of the given kind on the attribute, and
+    keeps it with the relation. If it already exists, it is
+    returned.
+    '''
+    if kind not in _KINDS:
+        raise Exception(_('Unknown kind of index: %s') % kind)
+    indexes = _indexes(rel)
+    r = indexes.get((attribute, kind))
+    if r is None:
+        r = indexes[(attribute, kind)] = _KINDS[kind](rel, attribute)
+    return r
+
+
+def drop(rel: Relation, attribute: Optional[str] = None) -> None:
+    '''Removes the indexes on the attribute, or all of them if it is None.'''
+    indexes = _indexes(rel)
+    for key in list(indexes):
+        if attribute is None or key[0] == attribute:
+            del indexes[key]
+
+
+def of(rel: Relation) -> List[Index]:
+    '''Returns the indexes of the relation.'''
+    return list(getattr(rel, '_indexes', {}).values())
+
+
+def find(rel: Relation, attribute: str, kind: Optional[str] = None) -> Optional[Index]:
+    '''
+    Returns an index on the attribute, of the given kind if it is
+    not None. Hash indexes are preferred.
+    '''
+    indexes = getattr(rel, '_indexes', None)
+    if not indexes:
+        return None
+    for k in ((kind, ) if kind is not None else (HASH, SORTED)):
+        r = indexes.get((attribute, k))
+        if r is not None:
+            return r
+    return None
+
+
+def candidates(rel: Relation, expr: str) -> Optional[Tuple[Index, List[Tuple[CastValue, ...]]]]:
+    '''
+    Finds, using an index, the tuples of the relation that can
+    satisfy the condition of a selection.
+
+    Returns the index and the tuples, which must still be checked with
+    the whole condition, or None if no index can be used.
+    '''
+    if not getattr(rel, '_indexes', None):
+        return None
+    conditions = _conditions(expr, tuple(rel.header))
+
+    # Sorted indexes are only searched for numbers, otherwise
+    # the selection compares the values, and fails if it has to
+    for attribute, op, value in conditions:
+        if op != '==':
+            continue
+        index = find(rel, attribute)
+        if isinstance(index, HashIndex):
+            return index, index.equal(value)
+        elif isinstance(index, SortedIndex) and index.numeric and isinstance(value, (int, float)):
+            return index, index.equal(value)
+
+    # All the bounds on the same attribute
+    for attribute in dict.fromkeys(i[0] for i in conditions if i[1] != '=='):
+        index = find(rel, attribute, SORTED)
+        if not isinstance(index, SortedIndex):
+            continue
+        low: Optional[float] = None
+        high: Optional[float] = None
+        low_inclusive = high_inclusive = True
+        for a, op, value in conditions:
+            if a != attribute or op == '==' or not index.numeric or not isinstance(value, (int, float)):
+                continue
+            if op in ('>', '>='):
+                if low is None or value > low or (value == low and op == '>'):
+                    low, low_inclusive = value, op == '>='
+            elif high is None or value < high or (value == high and op == '<'):
+                high, high_inclusive = value, op == '<='
+        if low is not None or high is not None:
+            return index, index.range(low, low_inclusive, high, high_inclusive)
+    return None
+
+
+_OPERATORS = {ast.Eq: '==', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>='}
+# The comparison with the operands swapped
+_SWAPPED = {'==': '==', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+
+@lru_cache(maxsize=256)
+def _conditions(expr: str, header: Tuple[str, ...]) -> Tuple[Tuple[str, str, CastValue], ...]:
+    '''
+    Returns the comparisons between an attribute and a constant that
+    must hold for the condition to be true, as (attribute, operator,
+    value), with the attribute always on the left.
+
+    Only int, float and str constants are considered.
+    '''
+    try:
+        tree = ast.parse(expr.strip(), mode='eval').body
+    except SyntaxError:
+        return ()
+    conjunction = tree.values if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) else [tree]
+
+    r = []
+    for condition in conjunction:
+        if not isinstance(condition, ast.Compare):
+            continue
+        operands = [condition.left] + condition.comparators
+        for op, left, right in zip(condition.ops, operands, operands[1:]):
+            if type(op) not in _OPERATORS:
+                continue
+            name = _OPERATORS[type(op)]
+            if isinstance(right, ast.Name):
+                left, right = right, left
+                name = _SWAPPED[name]
+            if isinstance(left, ast.Name) and left.id in header and \
+                    isinstance(right, ast.Constant) and \
+                    not isinstance(right.value, bool) and \
+                    isinstance(right.value, (int, float, str)):
+                r.append((left.id, name, right.value))
+    # Equalities first, they find less tuples
+    r.sort(key=lambda i: i[1] != '==')
+    return tuple(r)
@@ -21,11 +21,17 @@
 import os.path
 import pickle
 import base64
-from typing import Optional, Tuple
+import sys
+import weakref
+from collections import Counter, OrderedDict
+from itertools import islice
+from typing import Dict, List, Optional, Set, Tuple
 from gettext import gettext as _
 
 from relational.relation import Relation
-from relational import parser
+from relational import explain, index, parser, statistics
+from relational.executor import Executor
+from relational.physical import Operator, Scan, Materialize, Empty
 from relational.rtypes import is_valid_relation_name
 
 
@@ -87,6 +93,261 @@ def check_latest_version() -> Optional[str]:
         return None
 
 
+class QueryCache:
+    '''
+    Least recently used cache of the parsed queries.
+
+    It keeps the trees of the last size queries, keyed by
+    their text, so running the same query again does not
+    parse it again.
+    '''
+
+    def __init__(self, size: int = 128) -> None:
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._trees: OrderedDict[str, parser.Node] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def tree(self, query: str) -> parser.Node:
+        '''Returns the tree of the query, parsing it if needed.'''
+        query = query.strip()
+        try:
+            node = self._trees[query]
+        except KeyError:
+            self.misses += 1
+            node = parser.tree(query)
+            self._trees[query] = node
+            if len(self._trees) > self.size:
+                self._trees.popitem(last=False)
+            return node
+        self.hits += 1
+        self._trees.move_to_end(query)
+        return node
+
+    def clear(self) -> None:
+        self._trees.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Tree of a query and identities of the relations it uses
+ResultKey = Tuple[parser.Node, Tuple[int, ...]]
+
+
+class ResultCache:
+    '''
+    Least recently used cache of the results of queries.
+
+    A result is keyed by the tree of the query, which is the same
+    object for equal queries, and by the identities of the relations
+    it uses. Relations are immutable, so the result is valid as long
+    as the same relation objects are used. A weak reference to them
+    is kept, to check that they are still the same objects and not
+    new ones that got the same id.
+
+    The results of subqueries are kept too, when they are computed
+    anyway by a materializing operator, or when the same subquery
+    appears twice in a query or was already seen in a previous one.
+
+    When the estimated size of the results exceeds max_bytes, the
+    least recently used ones are dropped.
+
+    hits and misses count the lookups of queries and subqueries,
+    bytes_saved is the estimated size of the results that were
+    found instead of being computed again.
+    '''
+
+    def __init__(self, max_bytes: int = 64 * 2 ** 20, seen_size: int = 1024) -> None:
+        self.max_bytes = max_bytes
+        self.seen_size = seen_size
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+        self._results: OrderedDict[ResultKey, Tuple[Relation, int, Tuple['weakref.ref[Relation]', ...]]] = OrderedDict()
+        self._seen: OrderedDict[ResultKey, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def execute(self, node: parser.Node, rels: Dict[str, Relation]) -> Relation:
+        '''Executes the query, using and storing the cached results.'''
+        return _CachingExecutor(rels, self).execute(node)
+
+    def get(self, key: ResultKey, inputs: Tuple[Relation, ...]) -> Optional[Relation]:
+        '''
+        Returns the result with the given key, if it is cached
+        and was computed from the same input relations.
+        '''
+        entry = self._results.get(key)
+        if entry is not None and any(ref() is not i for ref, i in zip(entry[2], inputs)):
+            # Another relation got the id of one that is gone
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        rel, size, _ = entry
+        self.hits += 1
+        self.bytes_saved += size
+        self._results.move_to_end(key)
+        return rel
+
+    def put(self, key: ResultKey, inputs: Tuple[Relation, ...], rel: Relation) -> None:
+        '''Stores a result, unless it alone is larger than max_bytes.'''
+        if key in self._results:
+            return
+        size = _size(rel)
+        if size > self.max_bytes:
+            return
+        while self._results and self.bytes + size > self.max_bytes:
+            self._drop(next(iter(self._results)))
+            self.evictions += 1
+        self._results[key] = rel, size, tuple(weakref.ref(i) for i in inputs)
+        self.bytes += size
+
+    def _drop(self, key: ResultKey) -> None:
+        self.bytes -= self._results.pop(key)[1]
+
+    def seen(self, key: ResultKey) -> bool:
+        '''
+        Returns True if the subquery was already seen, and
+        remembers it for the next time.
+        '''
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self.seen_size:
+            self._seen.popitem(last=False)
+        return False
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._seen.clear()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+
+class _CachingExecutor(Executor):
+    '''Executor that looks up the nodes in a ResultCache and stores their results.'''
+
+    def __init__(self, rels: Dict[str, Relation], cache: ResultCache) -> None:
+        super().__init__(rels)
+        self.cache = cache
+        self._root: Optional[parser.Node] = None
+        self._shared: Set[parser.Node] = set()
+        self._found: Set[parser.Node] = set()
+
+    def execute(self, node: parser.Node) -> Relation:
+        self._root = node
+        self._shared = _repeated(node)
+        return super().execute(node)
+
+    def key(self, node: parser.Node) -> Optional[Tuple[ResultKey, Tuple[Relation, ...]]]:
+        '''
+        Returns the key of the node and the relations it uses, or None
+        if it is a relation, which is not cached, or uses unknown
+        relations.
+        '''
+        if isinstance(node, parser.Variable):
+            return None
+        names = _variables(node)
+        if not all(i in self.rels for i in names):
+            return None
+        inputs = tuple(self.rels[i] for i in names)
+        return (node, tuple(map(id, inputs))), inputs
+
+    def before(self, node: parser.Node) -> Optional[Operator]:
+        key = self.key(node)
+        if key is None:
+            return None
+        rel = self.cache.get(*key)
+        if rel is None:
+            return None
+        self._found.add(node)
+        return Scan(rel)
+
+    def after(self, node: parser.Node, op: Operator) -> Operator:
+        key = self.key(node)
+        if key is None or node in self._found:
+            return op
+        if isinstance(op, (Scan, Materialize, Empty)):
+            # The result is already there
+            self.cache.put(*key, op.relation())
+            return op
+        if node is self._root or node in self._shared or self.cache.seen(key[0]):
+            rel = op.relation()
+            self.cache.put(*key, rel)
+            return Scan(rel)
+        return op
+
+
+# Names of the relations used by the nodes, see _variables
+_variables_of: 'weakref.WeakKeyDictionary[parser.Node, Tuple[str, ...]]' = weakref.WeakKeyDictionary()
+
+
+def _variables(node: parser.Node) -> Tuple[str, ...]:
+    '''Names of the relations used by the node, sorted.'''
+    # The children first, without recursion, so deep trees work
+    stack = [node]
+    while stack:
+        i = stack[-1]
+        if i in _variables_of:
+            stack.pop()
+            continue
+        children: Tuple[parser.Node, ...] = ()
+        if isinstance(i, parser.Unary):
+            children = (i.child, )
+        elif isinstance(i, parser.Binary):
+            children = (i.left, i.right)
+        pending = [j for j in children if j not in _variables_of]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        if isinstance(i, parser.Variable):
+            _variables_of[i] = (i.name, )
+        else:
+            _variables_of[i] = tuple(sorted(set().union(*(_variables_of[j] for j in children))))
+    return _variables_of[node]
+
+
+def _repeated(node: parser.Node) -> Set[parser.Node]:
+    '''The subtrees that appear more than once in the tree.'''
+    count: Counter[parser.Node] = Counter()
+    stack = [node]
+    while stack:
+        i = stack.pop()
+        count[i] += 1
+        if count[i] > 1:
+            # Its children are counted already
+            continue
+        if isinstance(i, parser.Unary):
+            stack.append(i.child)
+        elif isinstance(i, parser.Binary):
+            stack.extend((i.left, i.right))
+    return {i for i, c in count.items() if c > 1}
+
+
+def _size(rel: Relation) -> int:
+    '''Estimated memory used by the relation, from a sample of its tuples.'''
+    content = rel.content
+    r = sys.getsizeof(content)
+    sample = list(islice(content, 64))
+    if sample:
+        per_tuple = sum(sys.getsizeof(i) + sum(map(sys.getsizeof, i)) for i in sample) / len(sample)
+        r += int(per_tuple * len(content))
+    return r
+
+
 class UserInterface:
 
     '''It is used to provide services to the user interfaces, in order to
@@ -94,6 +355,8 @@ class UserInterface:
     '''
 
     def __init__(self) -> None:
+        self.query_cache = QueryCache()
+        self.result_cache = ResultCache()
         self.session_reset()
 
     def load(self, filename: str, name: str) -> None:
@@ -165,8 +428,32 @@ class UserInterface:
         '''Sets the relation corresponding to name.'''
         if not is_valid_relation_name(name):
             raise Exception(_('Invalid name for destination relation'))
+        # The statistics are used by the optimizer, computing
+        # them now avoids doing it while optimizing
+        statistics.of(rel)
         self.relations[name] = rel
 
+    def create_index(self, name: str, attribute: str, kind: str = index.HASH) -> index.Index:
+        '''
+        Creates an index on an attribute of a relation, that the
+        selections and joins on the relation will use.
+
+        kind is index.HASH, for equality, or index.SORTED, also
+        for ranges.
+
+        The index is kept with the relation, so it is no longer used
+        when the name is given to a different relation.
+        '''
+        return index.create(self.get_relation(name), attribute, kind)
+
+    def drop_index(self, name: str, attribute: Optional[str] = None) -> None:
+        '''Removes the indexes on an attribute of a relation, or all of them.'''
+        index.drop(self.get_relation(name), attribute)
+
+    def indexes(self, name: str) -> List[index.Index]:
+        '''Returns the indexes of a relation.'''
+        return index.of(self.get_relation(name))
+
     def suggest_name(self, filename: str) -> Optional[str]:
         '''
         Returns a possible name for a relation, given
@@ -197,11 +484,22 @@ class UserInterface:
         if not is_valid_relation_name(relname):
             raise Exception(_('Invalid name for destination relation'))
 
-        expr = parser.parse(query)
-        result = expr(self.relations)
+        # Queries already executed on the same relations are not computed again
+        result = self.result_cache.execute(self.query_cache.tree(query), self.relations)
         self.relations[relname] = result
         return result
 
+    def explain(self, query: str, analyze: bool = True) -> explain.Plan:
+        '''
+        Returns the plan of a query, with the estimated amount of
+        tuples of every operation.
+
+        If analyze is True, the query is executed, and the plan also
+        contains the actual amounts, the time spent in every operation
+        and the result, which is not added to the relations.
+        '''
+        return explain.explain(self.query_cache.tree(query), self.relations, analyze)
+
     @staticmethod
     def split_query(query: str, default_name='last_') -> Tuple[str, str]:
         '''
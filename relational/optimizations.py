@@ -27,17 +27,23 @@
 # A function will have one parameter, which is the root node of the tree describing the expression.
 # The class used is defined in optimizer module.
 # A function will have to return the number of changes performed on the tree.
+#
+# The functions in early_optimizations are applied to a node before its
+# children are optimized, because they look for whole expressions that
+# the other optimizations would change.
 
+import ast
+from collections import Counter
 from io import StringIO
 from tokenize import generate_tokens
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, List, Optional, Set
 
 from relational.relation import Relation
 from relational import parser
 from relational.parser import Binary, Unary, Node, PRODUCT, \
     DIFFERENCE, UNION, INTERSECTION, DIVISION, JOIN, \
-    JOIN_LEFT, JOIN_RIGHT, JOIN_FULL, PROJECTION, \
-    SELECTION, RENAME, ARROW
+    JOIN_LEFT, JOIN_RIGHT, JOIN_FULL, SEMIJOIN, ANTIJOIN, \
+    PROJECTION, SELECTION, RENAME, ARROW
 
 sel_op = (
     '//=', '**=', 'and', 'not', 'in', '//', '**', '<<', '>>', '==', '!=', '>=', '<=', '+=', '-=',
@@ -51,7 +57,7 @@ def find_duplicates(node, dups=None):
     '''
     if dups is None:
         dups = {}
-    dups[str(node)] = node
+    dups[node] = node
 
 
 def duplicated_select(n: parser.Node) -> Tuple[parser.Node, int]:
@@ -67,10 +73,12 @@ def duplicated_select(n: parser.Node) -> Tuple[parser.Node, int]:
         prop = n.prop
 
         if n.prop != n.child.prop:  # Nested but different, joining them
-            prop = n.prop + " and " + n.child.prop
+            # The inner condition first, so the outer one is
+            # evaluated only on the tuples that passed it, as before
+            prop = _bool_operand(n.child.prop, 'and') + " and " + _bool_operand(n.prop, 'and')
 
             # This adds parenthesis if they are needed
-            if n.child.prop.startswith('(') or n.prop.startswith('('):
+            if '(' in prop:
                 prop = '(%s)' % prop
         n = Unary(
             SELECTION,
@@ -132,7 +140,7 @@ def futile_union_intersection_subtraction(n: parser.Node) -> Tuple[parser.Node,
         return Unary(
             SELECTION,
             'False',
-            n.get_left_leaf()
+            n.right
         ), 1
     return n, 0
 
@@ -217,8 +225,8 @@ def futile_renames(n: parser.Node) -> Tuple[parser.Node, int]:
         if len(renames) == 0: # Nothing to rename, removing the rename
             return n.child, 1
         elif changes:
-            # Changing the node in place, no need to return to cause a recursive step
-            n.set_rename_prop(renames)
+            # Same operation with less parameters, no need to cause a recursive step
+            return Unary.rename(renames, n.child), 0
 
     return n, 0
 
@@ -257,12 +265,27 @@ def subsequent_renames(n: parser.Node) -> Tuple[parser.Node, int]:
         if len(renames) == 0:  # Nothing to rename, removing the rename op
             return n.child, 1
         else:
-            n.set_rename_prop(renames)
-            return n, 1
+            return Unary.rename(renames, n.child), 1
 
     return n, 0
 
 
+def _bool_operand(expression: str, op: str) -> str:
+    '''
+    Returns the python expression, in parenthesis if they
+    are needed to use it as operand of the boolean operator
+    op, which is 'and', 'or' or 'not'.
+    '''
+    try:
+        node = ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError:
+        return '(%s)' % expression
+    if isinstance(node, (ast.IfExp, ast.Lambda, ast.NamedExpr)) or \
+            (isinstance(node, ast.BoolOp) and (op == 'not' or (op == 'and' and isinstance(node.op, ast.Or)))):
+        return '(%s)' % expression
+    return expression
+
+
 class LevelString(str):
     level = 0
 
@@ -319,24 +342,20 @@ def swap_rename_projection(n: parser.Node) -> Tuple[parser.Node, int]:
             n.child.name == RENAME:
         # π index,name(ρ id➡index(R))
         renames = n.child.get_rename_prop()
-        projections = set(n.get_projection_prop())
+        inverse = {v: k for k, v in renames.items()}
 
         # Use pre-rename names in the projection
-        for k, v in renames.items():
-            if v in projections:
-                projections.remove(v)
-                projections.add(k)
+        projections = [inverse.get(i, i) for i in n.get_projection_prop()]
 
         # Eliminate fields
         for i in list(renames.keys()):
             if i not in projections:
                 del renames[i]
 
-        child = Unary(PROJECTION,'' , n.child.child)
-        child.set_projection_prop(list(projections))
-        n = Unary(RENAME, '', child)
-        n.set_rename_prop(renames)
-        return n, 1
+        child = Unary.projection(projections, n.child.child)
+        if not renames:
+            return child, 1
+        return Unary.rename(renames, child), 1
 
     return n, 0
 
@@ -388,22 +407,11 @@ def select_union_intersect_subtract(n: parser.Node) -> Tuple[parser.Node, int]:
         d = {UNION: 'or', INTERSECTION: 'and', DIFFERENCE: 'and not'}
         op = d[n.name]
 
-        if n.left.prop.startswith('(') or n.right.prop.startswith('('):
-            t_str = '('
-            if n.left.prop.startswith('('):
-                t_str += '(%s)'
-            else:
-                t_str += '%s'
-            t_str += ' %s '
-            if n.right.prop.startswith('('):
-                t_str += '(%s)'
-            else:
-                t_str += '%s'
-            t_str += ')'
-
-            prop = t_str % (n.left.prop, op, n.right.prop)
-        else:
-            prop = '%s %s %s' % (n.left.prop, op, n.right.prop)
+        l_prop = _bool_operand(n.left.prop, op.split()[0])
+        r_prop = _bool_operand(n.right.prop, op.split()[-1])
+        prop = '%s %s %s' % (l_prop, op, r_prop)
+        if '(' in prop:
+            prop = '(%s)' % prop
         return Unary(SELECTION, prop, n.left.child), 1
     return n, 0
 
@@ -433,26 +441,89 @@ def union_and_product(n: parser.Node) -> Tuple[parser.Node, int]:
     return n, 0
 
 
-def projection_and_union(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+def selection_and_semijoin(n: parser.Node) -> Tuple[parser.Node, int]:
     '''
     Turns
-        π a,b,c(A) ∪ π a,b,c(B)
+        σ k (A ⋉ B)
+    into
+        σ k (A) ⋉ B
+
+    The result only has the attributes of A, so the selection can only
+    use those. Same thing with the anti join.
+    '''
+    if isinstance(n, Unary) and n.name == SELECTION and \
+            isinstance(n.child, Binary) and \
+            n.child.name in (SEMIJOIN, ANTIJOIN):
+        return Binary(n.child.name, Unary(SELECTION, n.prop, n.child.left), n.child.right), 1
+    return n, 0
 
+
+def _valid_projections(n: parser.Node, rels: Dict[str, Relation]) -> bool:
+    '''
+    True if the projections on top of n only keep attributes
+    that their operands have.
+
+    The schema of a projection is its attributes, even if they
+    are missing, and a projection on top of it would replace it
+    with duplicated_projection, hiding the error.
+    '''
+    while isinstance(n, Unary) and n.name == PROJECTION:
+        if not set(n.get_projection_prop()).issubset(n.child.result_format(rels)):
+            return False
+        n = n.child
+    return True
+
+
+def projection_and_join(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+    '''
+    Turns
+        π a,b (A ⋈ B)
     into
-        π a,b,c(A ∪ B)
+        π a,b (A ⋉ B)
 
-    if A and B are union compatible
+    if a and b are attributes of A. So the join is not built, and
+    only the values of the shared attributes of B are kept in memory.
     '''
-    changes = 0
-    if n.name == UNION and \
-            isinstance(n, Binary) and \
-            n.left.name == PROJECTION and \
-            isinstance(n.left, Unary) and \
-            n.right.name == PROJECTION and \
-            isinstance(n.right, Unary) and \
-            set(n.left.child.result_format(rels)) == set(n.right.child.result_format(rels)):
-        child = Binary(UNION, n.left.child, n.right.child)
-        return Unary(PROJECTION, n.right.prop, child), 0
+    if isinstance(n, Unary) and n.name == PROJECTION and \
+            isinstance(n.child, Binary) and \
+            n.child.name == JOIN:
+        if not _valid_projections(n.child.left, rels) or not _valid_projections(n.child.right, rels):
+            # Let it fail
+            return n, 0
+        attributes = set(n.get_projection_prop())
+        if attributes.issubset(n.child.left.result_format(rels)):
+            return Unary(PROJECTION, n.prop, Binary(SEMIJOIN, n.child.left, n.child.right)), 1
+        elif attributes.issubset(n.child.right.result_format(rels)):
+            return Unary(PROJECTION, n.prop, Binary(SEMIJOIN, n.child.right, n.child.left)), 1
+    return n, 0
+
+
+def difference_and_semijoin(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+    '''
+    Turns
+        A - (A ⋉ B)
+    and
+        A - π attributes of A (A ⋈ B)
+    into
+        A ▷ B
+
+    Does the same with the intersection, which gives A ⋉ B.
+    '''
+    if not isinstance(n, Binary) or n.name not in (DIFFERENCE, INTERSECTION):
+        return n, 0
+    op = ANTIJOIN if n.name == DIFFERENCE else SEMIJOIN
+
+    right = n.right
+    if isinstance(right, Binary) and right.name == SEMIJOIN and right.left == n.left:
+        return Binary(op, n.left, right.right), 1
+
+    if isinstance(right, Unary) and right.name == PROJECTION and \
+            isinstance(right.child, Binary) and \
+            right.child.name == JOIN and \
+            n.left in (right.child.left, right.child.right) and \
+            set(right.get_projection_prop()) == set(n.left.result_format(rels)):
+        other = right.child.right if right.child.left == n.left else right.child.left
+        return Binary(op, n.left, other), 1
     return n, 0
 
 
@@ -546,6 +617,345 @@ def useless_projection(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parse
 
     return n, 0
 
+def _selection_attributes(expression: str) -> Optional[Set[str]]:
+    '''
+    Returns the names used in the python expression of a selection,
+    or None if it is not valid.
+    '''
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    return {i.id for i in ast.walk(tree) if isinstance(i, ast.Name)}
+
+
+def projection_pushdown(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+    '''
+    Turns
+        π a,b (σ k (A ⋈ B))
+    into
+        π a,b (σ k (π a,c (A) ⋈ π b,c (B)))
+
+    So that the operands only keep the attributes that are
+    projected, used by the selections in between, or needed
+    for the join. Same thing with products, outer joins,
+    semi joins and anti joins.
+
+    Also turns
+        π a,b (A ∪ B)
+    into
+        π a,b (A) ∪ π a,b (B)
+
+    Renames are already handled by swap_rename_projection.
+    '''
+    if not isinstance(n, Unary) or n.name != PROJECTION:
+        return n, 0
+
+    needed = set(n.get_projection_prop())
+    selections = []
+    child = n.child
+    while isinstance(child, Unary) and child.name == SELECTION:
+        names = _selection_attributes(child.prop)
+        if names is None:
+            return n, 0
+        needed.update(names)
+        selections.append(child.prop)
+        child = child.child
+
+    if not isinstance(child, Binary):
+        return n, 0
+
+    if child.name == UNION and not selections:
+        attributes = n.get_projection_prop()
+        if not set(attributes).issubset(child.result_format(rels)) or \
+                not _compatible(child, rels) or \
+                not _valid_projections(child.left, rels) or \
+                not _valid_projections(child.right, rels):
+            # Let it fail
+            return n, 0
+        return Binary(
+            UNION,
+            Unary.projection(attributes, child.left),
+            Unary.projection(attributes, child.right),
+        ), 1
+
+    if child.name not in (JOIN, PRODUCT, JOIN_LEFT, JOIN_RIGHT, JOIN_FULL, SEMIJOIN, ANTIJOIN):
+        return n, 0
+
+    l_attr = child.left.result_format(rels)
+    r_attr = child.right.result_format(rels)
+    if not set(n.get_projection_prop()).issubset(l_attr + r_attr) or \
+            not _valid_projections(child.left, rels) or \
+            not _valid_projections(child.right, rels):
+        # Let it fail
+        return n, 0
+    # Attributes of the join
+    needed.update(set(l_attr).intersection(r_attr))
+
+    changes = 0
+    sides = []
+    for side, attributes in ((child.left, l_attr), (child.right, r_attr)):
+        kept = [i for i in attributes if i in needed]
+        if kept and len(kept) < len(attributes):
+            side = Unary.projection(kept, side)
+            changes += 1
+        sides.append(side)
+    if not changes:
+        return n, 0
+
+    r: Node = Binary(child.name, sides[0], sides[1])
+    for prop in reversed(selections):
+        r = Unary(SELECTION, prop, r)
+    return Unary(PROJECTION, n.prop, r), changes
+
+
+# Nodes of the python expressions that can be part of a constant
+_CONSTANT_NODES = (ast.Constant, ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Compare,
+                   ast.boolop, ast.unaryop, ast.operator, ast.cmpop)
+
+
+def _constant_value(node: ast.expr) -> Tuple[bool, object]:
+    '''
+    Returns True and the value of the python expression, if it
+    does not depend on the attributes. False otherwise.
+    '''
+    if not all(isinstance(i, _CONSTANT_NODES) for i in ast.walk(node)):
+        return False, None
+    try:
+        code = compile(ast.Expression(node), '<selection>', 'eval')
+        return True, eval(code, {'__builtins__': {}})
+    except Exception:
+        # Left to fail when the selection is done
+        return False, None
+
+
+def fold_constants(expression: str) -> str:
+    '''
+    Returns the expression of a selection, with the constant
+    parts evaluated.
+
+    If the whole expression is constant, it becomes 'True' or
+    'False'. Constant operands of and/or at the top level are
+    either removed, or decide the value of the whole expression.
+    In that case the operands before them are still evaluated,
+    and can fail, so only the ones after them are removed.
+    '''
+    stripped = expression.strip()
+    try:
+        tree = ast.parse(stripped, mode='eval').body
+    except SyntaxError:
+        return expression
+
+    constant, value = _constant_value(tree)
+    if constant:
+        return 'True' if value else 'False'
+
+    if not isinstance(tree, ast.BoolOp):
+        return expression
+    # A value that decides the result: False for and, True for or
+    decisive = isinstance(tree.op, ast.Or)
+    values = [_constant_value(i) for i in tree.values]
+    if not any(constant for constant, _ in values):
+        return expression
+    operands = []
+    for i, (constant, value) in zip(tree.values, values):
+        if not constant:
+            segment = ast.get_source_segment(stripped, i)
+            if segment is None:
+                return expression
+            operands.append(segment)
+        elif bool(value) == decisive:
+            if not operands:
+                return 'True' if decisive else 'False'
+            operands.append('True' if decisive else 'False')
+            break
+    if not operands:
+        return 'False' if decisive else 'True'
+    op = 'or' if decisive else 'and'
+    return (' %s ' % op).join(_bool_operand(i, op) for i in operands)
+
+
+def constant_selection(n: parser.Node) -> Tuple[parser.Node, int]:
+    '''
+    Evaluates the constant parts of the conditions of the selections.
+
+    σ True (R) becomes R, and the selections that are always false
+    become σ False (R), which is known to be empty.
+    '''
+    if isinstance(n, Unary) and n.name == SELECTION:
+        prop = fold_constants(n.prop)
+        if prop == 'True':
+            return n.child, 1
+        elif prop != n.prop:
+            return Unary(SELECTION, prop, n.child), 1
+    return n, 0
+
+
+def _is_empty(n: parser.Node) -> bool:
+    '''True if the node is σ False, maybe under projections or renames.'''
+    while isinstance(n, Unary):
+        if n.name == SELECTION:
+            return n.prop.strip() == 'False'
+        n = n.child
+    return False
+
+
+def _without_empty(n: parser.Node) -> parser.Node:
+    '''Removes the σ False found by _is_empty.'''
+    assert isinstance(n, Unary)
+    if n.name == SELECTION:
+        return n.child
+    return Unary(n.name, n.prop, _without_empty(n.child))
+
+
+def _compatible(n: Binary, rels: Dict[str, Relation]) -> bool:
+    '''
+    False if the operator fails because of the attributes of its
+    operands, so it must not be removed.
+    '''
+    left = set(n.left.result_format(rels))
+    right = set(n.right.result_format(rels))
+    if n.name in (UNION, DIFFERENCE, INTERSECTION):
+        return left == right
+    elif n.name == DIVISION:
+        return right < left
+    elif n.name == PRODUCT:
+        return not left & right
+    return True
+
+
+def empty_relations(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+    '''
+    Propagates the results known to be empty, which are σ False (R).
+
+    X ∪ σ False (R) --> X
+    X - σ False (R) --> X
+    X ∩ σ False (R) --> σ False (R)
+    X ▷ σ False (R) --> X
+    X ⋉ σ False (R) --> σ False (X)
+    σ False (R) ⋈ X --> σ False (R ⋈ X)
+
+    The same for the other operators whose result is empty when
+    one of the operands is. The σ False moves up, so the operands
+    are not computed at all.
+
+    Operators whose operands are not compatible are left alone,
+    so they still fail.
+    '''
+    if not isinstance(n, Binary):
+        return n, 0
+    left = _is_empty(n.left)
+    right = _is_empty(n.right)
+    if not left and not right:
+        return n, 0
+
+    if not _compatible(n, rels):
+        # Let it fail
+        return n, 0
+
+    if n.name in (UNION, DIFFERENCE, INTERSECTION):
+        if n.name == UNION:
+            return (n.right if left else n.left), 1
+        elif n.name == INTERSECTION:
+            return (n.left if left else n.right), 1
+        return n.left, 1
+
+    if n.name == ANTIJOIN or (n.name == SEMIJOIN and left):
+        return n.left, 1
+    elif n.name == SEMIJOIN:
+        return Unary(SELECTION, 'False', n.left), 1
+
+    if (left and n.name in (JOIN, PRODUCT, DIVISION, JOIN_LEFT)) or \
+            (right and n.name in (JOIN, PRODUCT, JOIN_RIGHT)) or \
+            (left and right and n.name == JOIN_FULL):
+        l = _without_empty(n.left) if left else n.left
+        r = _without_empty(n.right) if right else n.right
+        return Unary(SELECTION, 'False', Binary(n.name, l, r)), 1
+    return n, 0
+
+
+def _chain_operands(n: parser.Node) -> List[parser.Node]:
+    '''Returns the operands of a chain of joins and products.'''
+    if isinstance(n, Binary) and n.name in (JOIN, PRODUCT):
+        return _chain_operands(n.left) + _chain_operands(n.right)
+    return [n]
+
+
+def max_and_min(n: parser.Node, rels: Dict[str, Relation]) -> Tuple[parser.Node, int]:
+    '''
+    Turns
+        A - π attributes of A (σ b > a (ρ a➡b (B) * A))
+    into
+        A ⋈ γ max(a)➡a (A)
+
+    where B is A or a projection of A that has a. The product can
+    also be in a chain of joins with the operands of A, when A is one. It finds the tuples
+    of A with the highest value of a, which without γ is done by
+    removing the ones that have a lower value than another tuple, but
+    that needs the product of A with itself.
+
+    With b < a it is the lowest value, and min is used. The operands of
+    the product and of the comparison can be swapped. If a is the only
+    attribute of A, the result is just γ max(a)➡a (A).
+    '''
+    if not isinstance(n, Binary) or n.name != DIFFERENCE:
+        return n, 0
+    left = n.left
+    right = n.right
+    if not isinstance(right, Unary) or right.name != PROJECTION or \
+            not isinstance(right.child, Unary) or right.child.name != SELECTION:
+        return n, 0
+
+    # The product can be part of a chain of joins, when A is a join
+    operands = _chain_operands(right.child.child)
+    for renamed in operands:
+        if isinstance(renamed, Unary) and renamed.name == RENAME:
+            other = renamed.child
+            if isinstance(other, Unary) and other.name == PROJECTION:
+                other = other.child
+            if other == left:
+                break
+    else:
+        return n, 0
+    operands.remove(renamed)
+    if Counter(operands) != Counter(_chain_operands(left)):
+        return n, 0
+
+    try:
+        condition = ast.parse(right.child.prop.strip(), mode='eval').body
+    except SyntaxError:
+        return n, 0
+    if not isinstance(condition, ast.Compare) or \
+            len(condition.ops) != 1 or \
+            not isinstance(condition.ops[0], (ast.Lt, ast.Gt)) or \
+            not isinstance(condition.left, ast.Name) or \
+            not isinstance(condition.comparators[0], ast.Name):
+        return n, 0
+    # The condition as b > a
+    bigger = condition.left.id
+    smaller = condition.comparators[0].id
+    if isinstance(condition.ops[0], ast.Lt):
+        bigger, smaller = smaller, bigger
+
+    attributes = left.result_format(rels)
+    renames = renamed.get_rename_prop()
+    if renames.get(smaller) == bigger and smaller in renamed.child.result_format(rels):
+        function, attribute = 'max', smaller
+    elif renames.get(bigger) == smaller and bigger in renamed.child.result_format(rels):
+        function, attribute = 'min', bigger
+    else:
+        return n, 0
+    if set(right.get_projection_prop()) != set(attributes) or \
+            not set(renamed.result_format(rels)).isdisjoint(attributes):
+        # Let it fail
+        return n, 0
+
+    group = Unary.aggregate([], [(attribute, function, attribute)], left)
+    if attributes == [attribute]:
+        return group, 1
+    return Binary(JOIN, left, group), 1
+
+
 general_optimizations = [
     duplicated_select,
     down_to_unions_subtractions_intersections,
@@ -559,9 +969,18 @@ general_optimizations = [
     swap_rename_projection,
     select_union_intersect_subtract,
     union_and_product,
+    selection_and_semijoin,
+    constant_selection,
+]
+# Applied before the others, see optimizer.optimize_all
+early_optimizations = [
+    max_and_min,
 ]
 specific_optimizations = [
     selection_and_product,
-    projection_and_union,
+    empty_relations,
+    projection_and_join,
+    difference_and_semijoin,
+    projection_pushdown,
     useless_projection,
 ]
@@ -20,16 +20,23 @@
 #
 # expression: In all the functions expression can be either an UTF-8 encoded string, containing a valid
 # relational query, or it can be a parse tree for a relational expression (ie: class parser.node).
-# The functions will always return a string with the optimized query, but if a parse tree was provided,
-# the parse tree itself will be modified accordingly.
-from typing import Union, Optional, Dict, Any, Tuple
+# The functions will return a string with the optimized query. Parse trees are immutable, so
+# a parse tree that was provided is never modified.
+import time
+from typing import Callable, Union, Optional, Dict, Iterator, List, Tuple
 
 from relational.relation import Relation
 from relational import optimizations
-from relational.parser import Node, Variable, Unary, Binary, op_functions, tokenize, tree
+from relational.parser import Node, Variable, Unary, Binary, Relations, op_functions, tokenize, tree, \
+    JOIN, PRODUCT, ParserException
 from relational import querysplit
+from relational.statistics import CostModel
 from relational.maintenance import UserInterface
 
+# Errors of the estimations on unknown relations or invalid
+# parameters, when the cost can't be estimated
+_ESTIMATE_ERRORS = (KeyError, IndexError, ValueError, ParserException)
+
 
 def optimize_program(code: str, rels: Dict[str, Relation]) -> str:
     '''
@@ -49,9 +56,7 @@ def optimize_program(code: str, rels: Dict[str, Relation]) -> str:
 
         res, query = UserInterface.split_query(line)
         last_res = res
-        parsed = tree(query)
-        _replace_leaves(parsed, context)
-        context[res] = parsed
+        context[res] = _replace_leaves(tree(query), context)
 
     if last_res is None:
         return ''
@@ -59,28 +64,27 @@ def optimize_program(code: str, rels: Dict[str, Relation]) -> str:
     return querysplit.split(node, rels)
 
 
-def _replace_leaves(node: Node, context: Dict[str, Node]) -> None:
+def _replace_leaves(node: Node, context: Dict[str, Node]) -> Node:
     '''
     If a name appearing in node appears
-    also in context, the parse tree is
-    modified to replace the node with the
+    also in context, returns the parse tree
+    where the node is replaced with the
     subtree found in context.
     '''
-    if isinstance(node, Unary):
-        _replace_leaves(node.child, context)
-
-        if isinstance(node.child, Variable) and node.child.name in context:
-            node.child = context[node.child.name]
+    if isinstance(node, Variable):
+        return context.get(node.name, node)
+    elif isinstance(node, Unary):
+        return Unary(node.name, node.prop, _replace_leaves(node.child, context))
     elif isinstance(node, Binary):
-        _replace_leaves(node.left, context)
-        _replace_leaves(node.right, context)
-        if isinstance(node.left, Variable) and node.left.name in context:
-            node.left = context[node.left.name]
-        if isinstance(node.right, Variable) and node.right.name in context:
-            node.right = context[node.right.name]
+        return Binary(
+            node.name,
+            _replace_leaves(node.left, context),
+            _replace_leaves(node.right, context)
+        )
+    return node
 
 
-def optimize_all(expression: Union[str, Node], rels: Dict[str, Relation], specific: bool = True, general: bool = True, debug: Optional[list] = None, tostr: bool = True) -> Union[str, Node]:
+def optimize_all(expression: Union[str, Node], rels: Dict[str, Relation], specific: bool = True, general: bool = True, debug: Optional[list] = None, tostr: bool = True, max_passes: int = 100, timeout: Optional[float] = None, stats: Optional[dict] = None, cost_based: bool = True) -> Union[str, Node]:
     '''This function performs all the available optimizations.
 
     expression : see documentation of this module
@@ -88,8 +92,17 @@ def optimize_all(expression: Union[str, Node], rels: Dict[str, Relation], specif
     specific: True if it has to perform specific optimizations
     general: True if it has to perform general optimizations
     debug: if a list is provided here, after the end of the function, it
-        will contain the query repeated many times to show the performed
-        steps.
+        will contain the performed steps.
+    max_passes: maximum amount of times that the optimizations are
+        applied to the same node
+    timeout: maximum time in seconds to spend optimizing
+    stats: if a dictionary is provided here, after the end of the
+        function, it will contain the amount of applied optimizations,
+        the time spent, and if the optimization was completed within
+        the limits.
+    cost_based: True if the optimizations that increase the estimated
+        cost of the expression must not be done, and the chains of
+        joins must be reordered according to the estimated cost
 
     Return value: this will return an optimized version of the expression'''
     if isinstance(expression, str):
@@ -99,54 +112,416 @@ def optimize_all(expression: Union[str, Node], rels: Dict[str, Relation], specif
     else:
         raise TypeError('expression must be a string or a node')
 
-    total = 1
-    while total != 0:
-        total = 0
-        if specific:
-            for i in optimizations.specific_optimizations:
-                n, c = _recursive_scan(i, n, rels)
-                if c != 0 and isinstance(debug, list):
-                    debug.append(str(n))
-                total += c
-        if general:
-            for j in optimizations.general_optimizations:
-                n, c = _recursive_scan(j, n, None)
-                if c != 0 and isinstance(debug, list):
-                    debug.append(str(n))
-                total += c
+    # The relations don't change while optimizing, so the
+    # schemas of the nodes are computed only once
+    if not isinstance(rels, Relations):
+        rels = Relations(rels)
+
+    start = time.monotonic()
+    model = CostModel(rels)
+    cost = model.cost if cost_based else None
+    applications = 0
+    complete = True
+
+    if specific:
+        # They look for expressions that the other optimizations change
+        early = Rewriter([(i, (rels, )) for i in optimizations.early_optimizations], max_passes, timeout, debug, cost, top_down=True)
+        n = early.rewrite(n)
+        applications += early.applications
+        complete = early.complete
+        if timeout is not None:
+            timeout -= time.monotonic() - start
+
+    rules: List[Tuple[Callable, tuple]] = []
+    if specific:
+        rules.extend((i, (rels, )) for i in optimizations.specific_optimizations)
+    if general:
+        rules.extend((i, ()) for i in optimizations.general_optimizations)
+
+    rewriter = Rewriter(rules, max_passes, timeout, debug, cost)
+    n = rewriter.rewrite(n)
+
+    applications += rewriter.applications
+    if specific and cost_based and not rewriter.expired():
+        join_order = JoinOrder(rels, model, debug)
+        n = join_order.reorder(n)
+        applications += join_order.applications
+
+    if isinstance(stats, dict):
+        stats['applications'] = applications
+        stats['time'] = time.monotonic() - start
+        stats['complete'] = complete and rewriter.complete
+
     if tostr:
         return str(n)
     else:
         return n
 
 
-def _recursive_scan(function, node: Node, rels: Optional[Dict[str, Any]]) -> Tuple[Node, int]:
-    '''Does a recursive optimization on the tree.
+class Rewriter:
+    '''
+    Applies optimizations to a tree, until none of them
+    changes it.
 
-    This function will recursively execute the function given
-    as "function" parameter starting from node to all the tree.
-    if rels is provided it will be passed as argument to the function.
-    Otherwise the function will be called just on the node.
+    The children of a node are rewritten before the node. Then the
+    optimizations are applied in order to the node, and if any of them
+    changed it, the children of the new node are rewritten and the
+    optimizations are applied again, at most max_passes times.
 
-    Result value: function is supposed to return the amount of changes
-    it has performed on the tree.
-    The various result will be added up and this final value will be the
-    returned value.'''
+    The result for every node is remembered. Nodes are interned, so
+    subtrees that were already rewritten, or that appear more than
+    once, are not rewritten again.
 
-    args = []
-    if rels is not None:
-        args.append(rels)
+    When the time exceeds timeout, the rewriting stops and the tree
+    is returned as it is, which is still equivalent to the original.
 
-    changes = 0
-    node, c = function(node, *args)
-    changes += c
+    If a cost function is given, the changes that increase the cost
+    are discarded. Changes that keep the same cost are done, because
+    they can allow other optimizations.
 
-    if isinstance(node, Unary):
-        node.child, c = _recursive_scan(function, node.child, rels)
-        changes += c
-    elif isinstance(node, Binary):
-        node.left, c = _recursive_scan(function, node.left, rels)
-        changes += c
-        node.right, c = _recursive_scan(function, node.right, rels)
-        changes += c
-    return node, changes
+    With top_down, the optimizations are applied to a node before
+    its children are rewritten, and not again after that.
+    '''
+
+    def __init__(self, rules: List[Tuple[Callable, tuple]], max_passes: int = 100, timeout: Optional[float] = None, debug: Optional[list] = None, cost: Optional[Callable[[Node], float]] = None, top_down: bool = False) -> None:
+        '''
+        rules contains the optimization functions and the extra
+        arguments to pass to them.
+        '''
+        self.rules = rules
+        self.cost = cost
+        self.top_down = top_down
+        self.max_passes = max_passes
+        self.debug = debug
+        self.start = time.monotonic()
+        self.deadline = None if timeout is None else self.start + timeout
+
+        # Amount of times that an optimization changed a node
+        self.applications = 0
+        # False if a limit was reached
+        self.complete = True
+
+        self._done: Dict[Node, Node] = {}
+
+    def rewrite(self, node: Node) -> Node:
+        '''Returns the optimized tree.'''
+        r = self._done.get(node)
+        if r is not None:
+            return r
+
+        # The nodes are rewritten after the nodes that they need, so
+        # those are found in self._done and deep trees don't need
+        # recursion
+        if not self.top_down:
+            for i in node._walk(self._done.__contains__):
+                if i not in self._done:
+                    self._remember(i, self._apply(self._rewrite_children(i)))
+            return self._done[node]
+
+        # The optimizations are applied to a node, and then its
+        # children are rewritten before the node is rebuilt
+        stack: List[Tuple[Node, Optional[Node]]] = [(node, None)]
+        while stack:
+            original, n = stack.pop()
+            if original in self._done:
+                continue
+            if n is None:
+                n = self._apply(original)
+                stack.append((original, n))
+                stack.extend((i, None) for i in n._children() if i not in self._done)
+            else:
+                self._remember(original, self._rewrite_children(n))
+        return self._done[node]
+
+    def _apply(self, node: Node) -> Node:
+        '''
+        Applies the optimizations to the node, until none of
+        them changes it.
+        '''
+        for _ in range(self.max_passes):
+            if self.expired():
+                self.complete = False
+                break
+
+            changed = False
+            for function, args in self.rules:
+                n, _ = function(node, *args)
+                if n is not node and not self._costlier(n, node):
+                    self.applications += 1
+                    if isinstance(self.debug, list):
+                        self.debug.append('%s: %s ➡ %s' % (function.__name__, node, n))
+                    node = n
+                    changed = True
+            if not changed:
+                break
+            if not self.top_down:
+                node = self._rewrite_children(node)
+        else:
+            self.complete = False
+        return node
+
+    def _remember(self, original: Node, node: Node) -> None:
+        self._done[original] = node
+        self._done[node] = node
+
+    def expired(self) -> bool:
+        '''True if the timeout was reached.'''
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def _costlier(self, new: Node, old: Node) -> bool:
+        '''True if the new node has a higher estimated cost.'''
+        if self.cost is None:
+            return False
+        try:
+            return self.cost(new) > self.cost(old)
+        except _ESTIMATE_ERRORS:
+            return False
+
+    def _rewrite_children(self, node: Node) -> Node:
+        '''Returns the node with the optimized children.'''
+        if isinstance(node, Unary):
+            child = self.rewrite(node.child)
+            if child is not node.child:
+                node = Unary(node.name, node.prop, child)
+        elif isinstance(node, Binary):
+            left = self.rewrite(node.left)
+            right = self.rewrite(node.right)
+            if left is not node.left or right is not node.right:
+                node = Binary(node.name, left, right)
+        return node
+
+
+# Chains of joins with up to this amount of operands are ordered
+# trying all the possible orders, longer ones greedily
+JOIN_DP_LIMIT = 8
+
+
+class JoinOrder:
+    '''
+    Reorders the chains of joins and products.
+
+    A chain is a tree of ⋈ and * whose operands are the other
+    subexpressions. Two parts of the chain are connected when they
+    have some attribute in common, so joining them is not a product.
+
+    For chains with up to JOIN_DP_LIMIT operands, the cheapest order
+    is found with dynamic programming on the connected subsets of the
+    operands. Longer chains are ordered greedily, joining every time
+    the two connected parts with the smallest estimated result.
+
+    Parts that are not connected are multiplied only at the end,
+    so the products are the ones that were already in the chain.
+
+    The new order is used only if its estimated cost is lower.
+    '''
+
+    def __init__(self, rels: Relations, model: CostModel, debug: Optional[list] = None) -> None:
+        self.rels = rels
+        self.model = model
+        self.debug = debug
+
+        # Amount of reordered chains
+        self.applications = 0
+
+        self._done: Dict[Node, Node] = {}
+
+    def reorder(self, node: Node) -> Node:
+        '''Returns the tree with the chains reordered.'''
+        r = self._done.get(node)
+        if r is not None:
+            return r
+
+        # The nodes are reordered after the nodes that they need,
+        # which are the operands for the chains, so deep trees don't
+        # need recursion
+        stack: List[Tuple[Node, bool]] = [(node, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if n in self._done:
+                continue
+            if expanded:
+                self._done[n] = self._reorder(n)
+                continue
+            stack.append((n, True))
+            if isinstance(n, Binary) and n.name in (JOIN, PRODUCT):
+                operands: List[Node] = []
+                self._flatten(n, operands)
+                stack.extend((i, False) for i in operands)
+            else:
+                stack.extend((i, False) for i in n._children())
+        return self._done[node]
+
+    def _reorder(self, node: Node) -> Node:
+        if isinstance(node, Binary) and node.name in (JOIN, PRODUCT):
+            return self._reorder_chain(node)
+        elif isinstance(node, Unary):
+            child = self.reorder(node.child)
+            return node if child is node.child else Unary(node.name, node.prop, child)
+        elif isinstance(node, Binary):
+            left = self.reorder(node.left)
+            right = self.reorder(node.right)
+            if left is node.left and right is node.right:
+                return node
+            return Binary(node.name, left, right)
+        return node
+
+    def _reorder_chain(self, node: Binary) -> Node:
+        found: List[Node] = []
+        products_ok = self._flatten(node, found)
+        operands = [self.reorder(i) for i in found]
+
+        original: Node = node
+        if any(a is not b for a, b in zip(operands, found)):
+            original = self._rebuild(node, iter(operands))
+
+        if len(operands) < 3 or not products_ok:
+            return original
+
+        try:
+            attributes = [frozenset(i.schema(self.rels).attributes) for i in operands]
+            if len(operands) <= JOIN_DP_LIMIT:
+                parts = self._dynamic(operands, attributes)
+            else:
+                parts = self._greedy(operands, attributes)
+            r = self._product(parts)
+            if self.model.cost(r) >= self.model.cost(original):
+                return original
+        except _ESTIMATE_ERRORS:
+            return original
+
+        self.applications += 1
+        if isinstance(self.debug, list):
+            self.debug.append('%s: %s ➡ %s' % ('join_order', original, r))
+        return r
+
+    def _flatten(self, node: Node, operands: List[Node]) -> bool:
+        '''
+        Puts in operands the operands of the chain.
+
+        Returns False if a product has attributes in common on both
+        sides. That fails, and the error must not be changed into a join.
+        '''
+        ok = True
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if not isinstance(n, Binary) or n.name not in (JOIN, PRODUCT):
+                operands.append(n)
+                continue
+            if ok and n.name == PRODUCT:
+                try:
+                    left = n.left.schema(self.rels).attributes
+                    right = n.right.schema(self.rels).attributes
+                except _ESTIMATE_ERRORS:
+                    ok = False
+                else:
+                    ok = not set(left).intersection(right)
+            stack.append(n.right)
+            stack.append(n.left)
+        return ok
+
+    def _rebuild(self, node: Node, operands: Iterator[Node]) -> Node:
+        '''Returns the chain, with the same shape, on different operands.'''
+        results: List[Node] = []
+        stack: List[Tuple[Node, bool]] = [(node, False)]
+        while stack:
+            n, expanded = stack.pop()
+            if expanded:
+                right = results.pop()
+                left = results.pop()
+                results.append(Binary(n.name, left, right))
+            elif isinstance(n, Binary) and n.name in (JOIN, PRODUCT):
+                stack.append((n, True))
+                stack.append((n.right, False))
+                stack.append((n.left, False))
+            else:
+                results.append(next(operands))
+        return results[0]
+
+    def _join(self, a: Node, b: Node) -> Node:
+        '''
+        Joins two connected parts. The smaller one goes on the right,
+        where the hash table of the join is built.
+        '''
+        if self.model.estimate(a).rows < self.model.estimate(b).rows:
+            a, b = b, a
+        return Binary(JOIN, a, b)
+
+    def _product(self, parts: List[Node]) -> Node:
+        '''Multiplies parts that are not connected, the smaller first.'''
+        parts = sorted(parts, key=lambda i: self.model.estimate(i).rows)
+        r = parts[0]
+        for i in parts[1:]:
+            r = Binary(PRODUCT, r, i)
+        return r
+
+    def _dynamic(self, operands: List[Node], attributes: List[frozenset]) -> List[Node]:
+        '''
+        Finds the cheapest order for every connected subset of the
+        operands, represented as a bitmask, starting from the smallest.
+
+        Returns the best plans for the connected components.
+        '''
+        best: Dict[int, Node] = {1 << i: n for i, n in enumerate(operands)}
+        shared: Dict[int, frozenset] = {1 << i: a for i, a in enumerate(attributes)}
+
+        for mask in range(1, 1 << len(operands)):
+            if mask & (mask - 1) == 0:
+                continue
+            low = mask & -mask
+            shared[mask] = shared[low].union(shared[mask ^ low])
+
+            plan = None
+            cost = 0.0
+            # Every split is considered once, with the lowest
+            # operand in the first part
+            sub = (mask - 1) & mask
+            while sub:
+                if sub & low:
+                    rest = mask ^ sub
+                    if sub in best and rest in best and shared[sub] & shared[rest]:
+                        n = self._join(best[sub], best[rest])
+                        c = self.model.cost(n)
+                        if plan is None or c < cost:
+                            plan = n
+                            cost = c
+                sub = (sub - 1) & mask
+            if plan is not None:
+                best[mask] = plan
+
+        parts = []
+        remaining = (1 << len(operands)) - 1
+        while remaining:
+            # Largest connected subset containing the lowest operand
+            low = remaining & -remaining
+            component = max(
+                (m for m in best if m & low and m & remaining == m),
+                key=lambda m: bin(m).count('1')
+            )
+            parts.append(best[component])
+            remaining ^= component
+        return parts
+
+    def _greedy(self, operands: List[Node], attributes: List[frozenset]) -> List[Node]:
+        '''
+        Joins the two connected parts with the smallest estimated
+        result, until no part is connected to another.
+        '''
+        parts = list(zip(operands, attributes))
+        while True:
+            choice = None
+            rows = 0.0
+            for i in range(len(parts)):
+                for j in range(i + 1, len(parts)):
+                    if parts[i][1] & parts[j][1]:
+                        n = self._join(parts[i][0], parts[j][0])
+                        r = self.model.estimate(n).rows
+                        if choice is None or r < rows:
+                            choice = (i, j, n)
+                            rows = r
+            if choice is None:
+                return [i for i, _ in parts]
+            i, j, n = choice
+            merged = (n, parts[i][1].union(parts[j][1]))
+            del parts[j]
+            parts[i] = merged
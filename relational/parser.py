@@ -24,7 +24,9 @@
 #
 # Language definition here:
 # http://ltworf.github.io/relational/grammar.html
-from typing import Optional, Union, List, Any, Dict, Literal
+import re
+import weakref
+from typing import Optional, Union, List, Any, Dict, Literal, Tuple, Callable
 from dataclasses import dataclass
 from gettext import gettext as _
 
@@ -41,10 +43,14 @@ __all__ = [
     'JOIN_LEFT',
     'JOIN_RIGHT',
     'JOIN_FULL',
+    'SEMIJOIN',
+    'ANTIJOIN',
     'PROJECTION',
     'SELECTION',
     'RENAME',
+    'GROUP',
     'ARROW',
+    'Token',
     'TokenizerException',
     'ParserException',
     'CallableString',
@@ -52,6 +58,8 @@ __all__ = [
     'Unary',
     'Binary',
     'Variable',
+    'Schema',
+    'Relations',
     'tree',
     'parse',
 ]
@@ -66,20 +74,24 @@ JOIN = '⋈'
 JOIN_LEFT = '⧑'
 JOIN_RIGHT = '⧒'
 JOIN_FULL = '⧓'
+SEMIJOIN = '⋉'
+ANTIJOIN = '▷'
 PROJECTION = 'π'
 SELECTION = 'σ'
 RENAME = 'ρ'
+GROUP = 'γ'
 ARROW = '➡'
 
 
 b_operators = (PRODUCT, DIFFERENCE, UNION, INTERSECTION, DIVISION,
-               JOIN, JOIN_LEFT, JOIN_RIGHT, JOIN_FULL)  # List of binary operators
-u_operators = (PROJECTION, SELECTION, RENAME)  # List of unary operators
+               JOIN, JOIN_LEFT, JOIN_RIGHT, JOIN_FULL, SEMIJOIN, ANTIJOIN)  # List of binary operators
+u_operators = (PROJECTION, SELECTION, RENAME, GROUP)  # List of unary operators
+aggregate_functions = ('count', 'sum', 'min', 'max', 'avg')  # Functions of the grouping
 
 # Associates operator with python method
 op_functions = {
     PRODUCT: 'product', DIFFERENCE: 'difference', UNION: 'union', INTERSECTION: 'intersection', DIVISION: 'division', JOIN: 'join',
-    JOIN_LEFT: 'outer_left', JOIN_RIGHT: 'outer_right', JOIN_FULL: 'outer', PROJECTION: 'projection', SELECTION: 'selection', RENAME: 'rename'}
+    JOIN_LEFT: 'outer_left', JOIN_RIGHT: 'outer_right', JOIN_FULL: 'outer', SEMIJOIN: 'semijoin', ANTIJOIN: 'antijoin', PROJECTION: 'projection', SELECTION: 'selection', RENAME: 'rename', GROUP: 'aggregate'}
 
 
 class TokenizerException (Exception):
@@ -110,7 +122,6 @@ class CallableString(str):
         '''
         return eval(self, context)
 
-@dataclass
 class Node:
     '''This class is a node of a relational expression. Leaves are relations
     and internal nodes are operations.
@@ -126,12 +137,79 @@ class Node:
     child node and a property containing the string with the props of the
     operation.
 
+    Nodes are immutable and interned: creating a node equal to an
+    existing one returns the existing one. So equal subtrees are the
+    same object, and comparing or hashing them takes constant time.
+
     This class is used to convert an expression into python code.'''
+    __slots__ = ('name', '_hash', '_str', '_schema', '__weakref__')
     name: str
+    _hash: int
+    _str: Optional[str]
+    _schema: Optional[Tuple['weakref.ref[Relations]', 'Schema']]
 
-    def __init__(self, name: str) -> None:
+    def __new__(cls, *args, **kwargs):
         raise NotImplementedError('This is supposed to be an abstract class')
 
+    @classmethod
+    def _intern(cls, key: tuple, **fields: Any) -> Any:
+        '''
+        Returns the node with the given key, creating it
+        with the given fields if it does not exist.
+
+        The key contains the children, which are interned,
+        so comparing keys does not compare whole trees.
+        '''
+        node = _nodes.get(key)
+        if node is None:
+            node = object.__new__(cls)
+            for k, v in fields.items():
+                object.__setattr__(node, k, v)
+            object.__setattr__(node, '_hash', hash(key))
+            object.__setattr__(node, '_str', None)
+            object.__setattr__(node, '_schema', None)
+            _nodes[key] = node
+        return node
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError('Nodes are immutable')
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError('Nodes are immutable')
+
+    # Equal nodes are the same object, so __eq__ is the identity
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __str__(self) -> str:
+        r = self._str
+        if r is None:
+            # The children are formatted first, with a stack instead
+            # of recursion, so deep trees can be printed
+            stack: List[Node] = [self]
+            while stack:
+                node = stack[-1]
+                pending = [i for i in node._children() if i._str is None]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                if node._str is None:
+                    object.__setattr__(node, '_str', node._format())
+            r = self._str
+            assert r is not None
+        return r
+
+    def _children(self) -> Tuple['Node', ...]:
+        if isinstance(self, Unary):
+            return (self.child, )
+        elif isinstance(self, Binary):
+            return (self.left, self.right)
+        return ()
+
+    def _format(self) -> str:
+        raise NotImplementedError()
+
     def toCode(self): #FIXME return type
         '''This method converts the AST into a python code object'''
         code = self._toPython()
@@ -146,93 +224,240 @@ class Node:
         return CallableString(self._toPython())
 
     def _toPython(self) -> str:
+        # The children first, so deep trees don't need recursion
+        code: Dict[Node, str] = {}
+        for node in self._walk():
+            code[node] = node._python(code)
+        return code[self]
+
+    def _python(self, code: Dict['Node', str]) -> str:
+        '''Returns the python code of the node, given the code of its children.'''
         raise NotImplementedError()
 
+    def _walk(self, done: Optional[Callable[['Node'], bool]] = None) -> List['Node']:
+        '''
+        Returns the nodes of the tree, every one after its children,
+        without recursion.
+
+        The nodes for which done returns True are not returned, and
+        neither are their children, unless they appear elsewhere.
+        '''
+        r: List[Node] = []
+        seen = set()
+        stack: List[Tuple[Node, bool]] = [(self, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                r.append(node)
+                continue
+            if node in seen or (done is not None and done(node)):
+                continue
+            seen.add(node)
+            stack.append((node, True))
+            stack.extend((i, False) for i in reversed(node._children()))
+        return r
+
     def printtree(self, level: int = 0) -> str:
         '''returns a representation of the tree using indentation'''
-        r = '  ' * level + self.name
-        if self.name in b_operators and isinstance(self, Binary):
-            r += self.left.printtree(level + 1)
-            r += self.right.printtree(level + 1)
-        elif self.name in u_operators and isinstance(self, Unary):
-            r += '\t%s\n' % self.prop
-            r += self.child.printtree(level + 1)
-        return '\n' + r
+        r = []
+        stack: List[Tuple[Node, int]] = [(self, level)]
+        while stack:
+            node, depth = stack.pop()
+            r.append('\n' + '  ' * depth + node.name)
+            if node.name in b_operators and isinstance(node, Binary):
+                stack.append((node.right, depth + 1))
+                stack.append((node.left, depth + 1))
+            elif node.name in u_operators and isinstance(node, Unary):
+                r.append('\t%s\n' % node.prop)
+                stack.append((node.child, depth + 1))
+        return ''.join(r)
 
     def get_left_leaf(self) -> 'Node':
-        raise NotImplementedError()
+        node = self
+        while True:
+            if isinstance(node, Unary):
+                node = node.child
+            elif isinstance(node, Binary):
+                node = node.left
+            else:
+                return node
 
     def result_format(self, rels: dict) -> list: #FIXME types
         '''This function returns a list containing the fields that the resulting relation will have.
         It requires a dictionary where keys are the names of the relations and the values are
         the relation objects.'''
+        return list(self.schema(rels).attributes)
+
+    def schema(self, rels: dict) -> 'Schema':
+        '''
+        Returns the attributes that the resulting relation will
+        have, and their types.
+
+        If rels is a Relations dictionary, the result is kept in
+        the node and reused while the same dictionary is used.
+        '''
         if not isinstance(rels, dict):
             raise TypeError('Can\'t be of None type')
 
+        cached = self._cached_schema(rels)
+        if cached is not None:
+            return cached
+
+        # The children first, so deep trees don't need recursion
+        schemas: Dict[Node, Schema] = {}
+        for node in self._walk(lambda n: n._cached_schema(rels) is not None):
+            r = node._compute_schema(rels, schemas)
+            schemas[node] = r
+            if isinstance(rels, Relations):
+                object.__setattr__(node, '_schema', (weakref.ref(rels), r))
+        return schemas[self]
+
+    def _cached_schema(self, rels: dict) -> Optional['Schema']:
+        cached = self._schema
+        if cached is not None and cached[0]() is rels:
+            return cached[1]
+        return None
+
+    def _compute_schema(self, rels: dict, schemas: Dict['Node', 'Schema']) -> 'Schema':
+        '''
+        Returns the schema of the node. The schemas of the children
+        are in schemas, or are kept in the children.
+        '''
+        def of(node: Node) -> Schema:
+            r = schemas.get(node)
+            return node.schema(rels) if r is None else r
+
         if isinstance(self, Variable):  #FIXME this is ugly
-            return list(rels[self.name].header)
+            rel = rels[self.name]
+            return Schema(tuple(rel.header), rel.types())
         elif isinstance(self, Binary):
-            if self.name in (DIFFERENCE, UNION, INTERSECTION):
-                return self.left.result_format(rels)
-            elif self.name == DIVISION:
-                return list(set(self.left.result_format(rels)) - set(self.right.result_format(rels)))
+            left = of(self.left)
+            if self.name in (DIFFERENCE, UNION, INTERSECTION, SEMIJOIN, ANTIJOIN):
+                if self.name == UNION:
+                    right = of(self.right)
+                    return Schema(left.attributes, tuple(
+                        t if t == right.type_of(a) else None
+                        for a, t in zip(left.attributes, left.types)
+                    ))
+                return left
+            right = of(self.right)
+            if self.name == DIVISION:
+                return left.without(right.attributes)
             elif self.name == PRODUCT:
-                return self.left.result_format(rels) + self.right.result_format(rels)
+                return Schema(left.attributes + right.attributes, left.types + right.types)
             elif self.name in (JOIN, JOIN_LEFT, JOIN_RIGHT, JOIN_FULL):
-                return list(set(self.left.result_format(rels)).union(set(self.right.result_format(rels))))
+                rest = right.without(left.attributes)
+                return Schema(left.attributes + rest.attributes, left.types + rest.types)
         elif isinstance(self, Unary):
+            child = of(self.child)
             if self.name == PROJECTION:
-                return self.get_projection_prop()
+                attributes = tuple(self.get_projection_prop())
+                return Schema(attributes, tuple(child.type_of(a) for a in attributes))
             elif self.name == SELECTION:
-                return self.child.result_format(rels)
+                return child
             elif self.name == RENAME:
                 _vars = self.get_rename_prop()
-                _fields = self.child.result_format(rels)
-                for i in range(len(_fields)):
-                    if _fields[i] in _vars:
-                        _fields[i] = _vars[_fields[i]]
-                return _fields
+                return Schema(tuple(_vars.get(a, a) for a in child.attributes), child.types)
+            elif self.name == GROUP:
+                groups, aggregates = self.get_aggregate_prop()
+                types = [child.type_of(a) for a in groups]
+                for _, function, attribute in aggregates:
+                    t = None if attribute is None else child.type_of(attribute)
+                    if function == 'count':
+                        t = int
+                    elif function == 'avg':
+                        t = float
+                    elif function == 'sum' and t not in (int, float):
+                        t = None
+                    types.append(t)
+                return Schema(tuple(groups) + tuple(i[0] for i in aggregates), tuple(types))
 
         raise ValueError('What kind of alien object is this?')
 
-    def __eq__(self, other): #FIXME
-        if not (isinstance(other, node) and self.name == other.name and self.kind == other.kind):
-            return False
 
-        if self.kind == UNARY:
-            if other.prop != self.prop:
-                return False
-            return self.child == other.child
-        if self.kind == BINARY:
-            return self.left == other.left and self.right == other.right
-        return True
+@dataclass(frozen=True)
+class Schema:
+    '''
+    The attributes of the result of an expression, and
+    the type of their values.
+
+    The type is None when it is not known or the values
+    have different types.
+    '''
+    attributes: Tuple[str, ...]
+    types: Tuple[Optional[type], ...]
+
+    def type_of(self, attribute: str) -> Optional[type]:
+        try:
+            return self.types[self.attributes.index(attribute)]
+        except ValueError:
+            return None
+
+    def without(self, attributes: Tuple[str, ...]) -> 'Schema':
+        '''Returns the schema without some attributes'''
+        kept = [i for i, a in enumerate(self.attributes) if a not in attributes]
+        return Schema(
+            tuple(self.attributes[i] for i in kept),
+            tuple(self.types[i] for i in kept)
+        )
+
+
+# An aggregate of the grouping: name of the result, function, attribute
+Aggregate = Tuple[str, str, Optional[str]]
+
+# Aggregate in the prop of the grouping
+_AGGREGATE_REGEXP = re.compile(r'([_a-z][_a-z0-9]*)\(\s*(\*|[_a-z][_a-z0-9]*)\s*\)\s*(?:%s\s*(\S+))?$' % ARROW, re.IGNORECASE)
+
+
+class Relations(dict):
+    '''
+    A dictionary of relations, to be used when it is not
+    going to change. Nodes keep the schemas computed on it,
+    so they are computed only once.
+    '''
+
+
+# Existing nodes, see Node._intern
+_nodes: 'weakref.WeakValueDictionary[tuple, Node]' = weakref.WeakValueDictionary()
 
 
-@dataclass
 class Variable(Node):
-    def _toPython(self) -> str:
-        return self.name
+    __slots__ = ()
+
+    def __new__(cls, name: str) -> 'Variable':
+        return cls._intern((cls, name), name=name)
+
+    def __reduce__(self):
+        return (Variable, (self.name, ))
+
+    def __repr__(self) -> str:
+        return 'Variable(name=%r)' % self.name
 
-    def __str__(self):
+    def _python(self, code: Dict[Node, str]) -> str:
         return self.name
 
-    def get_left_leaf(self) -> Node:
-        return self
+    def _format(self) -> str:
+        return self.name
 
 
-@dataclass
 class Binary(Node):
-    name: str
+    __slots__ = ('left', 'right')
     left: Node
     right: Node
 
-    def get_left_leaf(self) -> Node:
-        return self.left.get_left_leaf()
+    def __new__(cls, name: str, left: Node, right: Node) -> 'Binary':
+        return cls._intern((cls, name, left, right), name=name, left=left, right=right)
 
-    def _toPython(self) -> str:
-        return '%s.%s(%s)' % (self.left._toPython(), op_functions[self.name], self.right._toPython())
+    def __reduce__(self):
+        return (Binary, (self.name, self.left, self.right))
 
-    def __str__(self):
+    def __repr__(self) -> str:
+        return 'Binary(name=%r, left=%r, right=%r)' % (self.name, self.left, self.right)
+
+    def _python(self, code: Dict[Node, str]) -> str:
+        return '%s.%s(%s)' % (code[self.left], op_functions[self.name], code[self.right])
+
+    def _format(self) -> str:
         le = self.left.__str__()
         if isinstance(self.right, Binary):
             re = "(" + self.right.__str__() + ")"
@@ -241,19 +466,41 @@ class Binary(Node):
         return (le + self.name + re) #TODO use fstrings
 
 
-@dataclass
 class Unary(Node):
-    name: str
+    __slots__ = ('prop', 'child')
     prop: str
     child: Node
 
-    def get_left_leaf(self) -> Node:
-        return self.child.get_left_leaf()
+    def __new__(cls, name: str, prop: str, child: Node) -> 'Unary':
+        return cls._intern((cls, name, prop, child), name=name, prop=prop, child=child)
 
-    def __str__(self):
+    def __reduce__(self):
+        return (Unary, (self.name, self.prop, self.child))
+
+    def __repr__(self) -> str:
+        return 'Unary(name=%r, prop=%r, child=%r)' % (self.name, self.prop, self.child)
+
+    @staticmethod
+    def projection(attributes: List[str], child: Node) -> 'Unary':
+        '''Returns the projection of child on the attributes'''
+        return Unary(PROJECTION, ','.join(attributes), child)
+
+    @staticmethod
+    def rename(renames: Dict[str, str], child: Node) -> 'Unary':
+        '''Returns the rename of child, based on the dictionary for renames'''
+        return Unary(RENAME, ','.join(f'{k}{ARROW}{v}' for k, v in renames.items()), child)
+
+    @staticmethod
+    def aggregate(groups: List[str], aggregates: List[Aggregate], child: Node) -> 'Unary':
+        '''Returns the grouping of child, see get_aggregate_prop'''
+        return Unary(GROUP, ','.join(groups + [
+            f'{function}({attribute or "*"}){ARROW}{name}' for name, function, attribute in aggregates
+        ]), child)
+
+    def _format(self) -> str:
         return self.name + " " + self.prop + " (" + self.child.__str__() + ")" #TODO use fstrings
 
-    def _toPython(self) -> str:
+    def _python(self, code: Dict[Node, str]) -> str:
         prop = self.prop
 
         # Converting parameters
@@ -261,21 +508,22 @@ class Unary(Node):
             prop = repr(self.get_projection_prop())
         elif self.name == RENAME:
             prop = repr(self.get_rename_prop())
+        elif self.name == GROUP:
+            prop = '%r, %r' % self.get_aggregate_prop()
         else:  # Selection
             prop = repr(prop)
 
-        return '%s.%s(%s)' % (self.child._toPython(), op_functions[self.name], prop)
+            # Selection on a product is executed as a theta join
+            if isinstance(self.child, Binary) and self.child.name == PRODUCT:
+                return '%s.thetajoin(%s, %s)' % (code[self.child.left], code[self.child.right], prop)
+
+        return '%s.%s(%s)' % (code[self.child], op_functions[self.name], prop)
 
     def get_projection_prop(self) -> List[str]:
         if self.name != PROJECTION:
             raise ValueError('This is only supported on projection nodes')
         return [i.strip() for i in self.prop.split(',')]
 
-    def set_projection_prop(self, p: List[str]) -> None:
-        if self.name != PROJECTION:
-            raise ValueError('This is only supported on projection nodes')
-        self.prop = ','.join(p)
-
     def get_rename_prop(self) -> Dict[str, str]:
         '''
         Returns the dictionary that the rename operation wants
@@ -288,72 +536,141 @@ class Unary(Node):
             r[q[0].strip()] = q[1].strip()
         return r
 
-    def set_rename_prop(self, renames: Dict[str, str]) -> None:
+    def get_aggregate_prop(self) -> Tuple[List[str], List[Aggregate]]:
         '''
-        Sets the prop field based on the dictionary for renames
+        Returns the attributes to group by, and the aggregates,
+        which the grouping operation wants.
+
+        The prop is like
+            id, max(rating)➡top, count(*)➡n
+        the aggregates are (name, function, attribute), where
+        attribute is None for count(*). Without a name, it is
+        the function followed by the attribute, like max_rating.
         '''
-        if self.name != RENAME:
-            raise ValueError('This is only supported on rename nodes')
-        self.prop = ','.join(f'{k}{ARROW}{v}' for k, v in renames.items())
+        if self.name != GROUP:
+            raise ValueError('This is only supported on grouping nodes')
+        groups = []
+        aggregates: List[Aggregate] = []
+        for i in self.prop.split(','):
+            i = i.strip()
+            m = _AGGREGATE_REGEXP.match(i)
+            if m is None:
+                groups.append(i)
+                continue
+            function, attribute, name = m.groups()
+            if function not in aggregate_functions:
+                raise ParserException(_('Unknown aggregate function: %s') % function)
+            if attribute == '*':
+                if function != 'count':
+                    raise ParserException(_('Only count can be used on *'))
+                attribute = None
+            if name is None:
+                name = function if attribute is None else f'{function}_{attribute}'
+            aggregates.append((name, function, attribute))
+        return groups, aggregates
+
+
+class _Sequence:
+    '''
+    A list of tokens being parsed by parse_tokens.
+
+    It keeps the tree built so far and the operators
+    waiting for their operand.
+    '''
+
+    def __init__(self, tokens: List[Union[list, str]]) -> None:
+        self.tokens = tokens
+        self.position = 0
+        self.left: Optional[Node] = None
+        self.binary: Optional[str] = None
+        self.unary: Optional[Tuple[str, str]] = None
+
+    def operand(self, node: Node) -> None:
+        '''Adds an operand, completing the waiting operators.'''
+        if self.unary is not None:
+            name, prop = self.unary
+            self.unary = None
+            node = Unary(name, prop=prop, child=node)
+
+        if self.left is None:
+            self.left = node
+        elif self.binary is not None:
+            self.left = Binary(self.binary, self.left, node)
+            self.binary = None
+        else:
+            raise ParserException(
+                _('Expected operator before %s') % repr(self.tokens[self.position - 1]))
+
+    def end(self) -> Node:
+        '''Returns the tree of the whole sequence.'''
+        if self.unary is not None:
+            raise ParserException(
+                _('Expected more tokens in %s') % repr(self.unary[0]))
+        if self.binary is not None:
+            raise ParserException(
+                _('Expected right operand for %s') % repr(self.binary))
+        if self.left is None:
+            raise ParserException(_('Failed to parse empty expression'))
+        return self.left
 
 
 def parse_tokens(expression: List[Union[list, str]]) -> Node:
     '''Generates the tree from the tokenized expression
-    If no expression is specified then it will create an empty node'''
-
-    # If the list contains only a list, it will consider the lower level list.
-    # This will allow things like ((((((a))))) to work
-    while len(expression) == 1 and isinstance(expression[0], list):
-        expression = expression[0]
+    If no expression is specified then it will create an empty node
+
+    Binary operators all have the same priority and are left
+    associative, unary operators apply to the parenthesis
+    following their parameters.
+
+    The tokens are read only once, from left to right, and
+    the sub-lists are parsed using a stack rather than recursion,
+    so very long or nested expressions can be parsed.'''
+
+    stack = [_Sequence(expression)]
+
+    while True:
+        sequence = stack[-1]
+        if sequence.position == len(sequence.tokens):
+            node = sequence.end()
+            stack.pop()
+            if not stack:
+                return node
+            stack[-1].operand(node)
+            continue
 
-    if len(expression) == 0:
-        raise ParserException(_('Failed to parse empty expression'))
+        token = sequence.tokens[sequence.position]
+        sequence.position += 1
 
-    # The list contains only 1 string. Means it is the name of a relation
-    if len(expression) == 1:
-        assert isinstance(expression[0], str)
-        if not rtypes.is_valid_relation_name(expression[0]):
+        if isinstance(token, list):
+            # Expressions into parenthesis have highest priority
+            stack.append(_Sequence(token))
+        elif sequence.unary is not None:
             raise ParserException(
-                f'{expression[0]!r} is not a valid relation name')
-        return Variable(expression[0]) #FIXME Move validation in the object
-
-    # Expression from right to left, searching for binary operators
-    # this means that binary operators have lesser priority than
-    # unary operators.
-    # It finds the operator with lesser priority, uses it as root of this
-    # (sub)tree using everything on its left as left parameter (so building
-    # a left subtree with the part of the list located on left) and doing
-    # the same on right.
-    # Since it searches for strings, and expressions into parenthesis are
-    # within sub-lists, they won't be found here, ensuring that they will
-    # have highest priority.
-    for i in range(len(expression) - 1, -1, -1):
-        if expression[i] in b_operators:  # Binary operator
-
-            if len(expression[:i]) == 0:
+                _('Expected more tokens in %s') % repr(sequence.unary[0]))
+        elif token in b_operators:  # Binary operator
+            if sequence.left is None:
                 raise ParserException(
-                    _('Expected left operand for %s') % repr(expression[i]))
-
-            if len(expression[i + 1:]) == 0:
+                    _('Expected left operand for %s') % repr(token))
+            if sequence.binary is not None:
                 raise ParserException(
-                    _('Expected right operand for %s') % repr(expression[i]))
-            return Binary(expression[i], parse_tokens(expression[:i]), parse_tokens(expression[i + 1:]))  # type: ignore
-    '''Searches for unary operators, parsing from right to left'''
-    for i in range(len(expression)):
-        if expression[i] in u_operators:  # Unary operator
-            if len(expression) <= i + 2:
+                    _('Expected right operand for %s') % repr(sequence.binary))
+            sequence.binary = str(token)
+        elif token in u_operators:  # Unary operator
+            if len(sequence.tokens) <= sequence.position + 1:
                 raise ParserException(
-                    _('Expected more tokens in %s') % repr(expression[i]))
-            elif len(expression) > i + 3:
+                    _('Expected more tokens in %s') % repr(token))
+            prop = sequence.tokens[sequence.position]
+            if not isinstance(prop, str):
                 raise ParserException(
-                    _('Too many tokens in %s') % repr(expression[i]))
-
-            return Unary(
-                expression[i],  # type: ignore
-                prop=expression[1 + i].strip(),  # type: ignore
-                child=parse_tokens(expression[2 + i])  # type: ignore
-            )
-    raise ParserException(_('Parse error on %s') % repr(expression))
+                    _('Parse error on %s') % repr(token))
+            sequence.unary = (str(token), prop.strip())
+            sequence.position += 1
+        else:
+            # Name of a relation
+            if not rtypes.is_valid_relation_name(token):
+                raise ParserException(
+                    f'{token!r} is not a valid relation name')
+            sequence.operand(Variable(str(token))) #FIXME Move validation in the object
 
 
 def _find_matching_parenthesis(expression: str, start=0, openpar='(', closepar=')') -> Optional[int]:
@@ -383,17 +700,19 @@ def _find_matching_parenthesis(expression: str, start=0, openpar='(', closepar='
                 return i  # Closing parenthesis of the parameter
     return None
 
-def _find_token(haystack: str, needle: str) -> int:
+def _find_token(haystack: str, needle: str, start=0, stop: Optional[str] = None) -> int:
     '''
     Like the string function find, but
     ignores tokens that are within a string
     literal.
+
+    If stop is found before needle, returns -1.
     '''
     r = -1
     string = False
     escape = False
 
-    for i in range(len(haystack)):
+    for i in range(start, len(haystack)):
         if haystack[i] == '\'' and not escape:
             string = not string
         if haystack[i] == '\\' and not escape:
@@ -403,58 +722,122 @@ def _find_token(haystack: str, needle: str) -> int:
         if string:
             continue
 
-        if haystack[i:].startswith(needle):
+        if haystack.startswith(needle, i):
             return i
+        if stop is not None and haystack.startswith(stop, i):
+            return r
     return r
 
 
+class Token(str):
+    '''
+    A token of an expression.
+
+    It is a string, that also knows its offset in the
+    expression.
+    '''
+    offset: int
+
+    def __new__(cls, value: str, offset: int) -> 'Token':
+        r = super().__new__(cls, value)
+        r.offset = offset
+        return r
+
+
+_NAME_REGEXP = re.compile(r'[_a-z][_a-z0-9]*', re.IGNORECASE)
+# Name right before the end
+_FUNCTION_REGEXP = re.compile(r'(?<![_a-z0-9])[_a-z][_a-z0-9]*$', re.IGNORECASE)
+
+
+def _skip_spaces(expression: str, i: int) -> int:
+    '''Returns the position of the first character that is not a space.'''
+    while i < len(expression) and expression[i].isspace():
+        i += 1
+    return i
+
+
+def _find_group_end(expression: str, start: int, stop: Optional[str]) -> int:
+    '''
+    Like _find_token for '(', but skips the parenthesis following
+    the name of an aggregate function, like max(a).
+    '''
+    while True:
+        par = _find_token(expression, '(', start, stop)
+        if par == -1:
+            return par
+        m = _FUNCTION_REGEXP.search(expression, start, par)
+        if m is None or m.group() not in aggregate_functions:
+            return par
+        end = _find_matching_parenthesis(expression, par)
+        if end is None:
+            return -1
+        start = end + 1
+
+
 def tokenize(expression: str) -> list:
     '''This function converts a relational expression into a list where
     every token of the expression is an item of a list. Expressions into
-    parenthesis will be converted into sublists.'''
+    parenthesis will be converted into sublists.
+
+    The tokens are Token objects, containing their offset in the
+    expression.
+
+    The expression is scanned only once, from left to right.'''
 
     # List for the tokens
     items = [] #  type: List[Union[str,list]]
 
-    expression = expression.strip()  # Removes initial and ending spaces
-
-    while len(expression) > 0:
-        if expression.startswith('('):  # Parenthesis state
-            end = _find_matching_parenthesis(expression)
-            if end is None:
+    # Lists of the open parenthesis, and where they were opened
+    stack = [items]
+    opened = [] #  type: List[int]
+
+    i = _skip_spaces(expression, 0)
+    while i < len(expression):
+        c = expression[i]
+        if c == '(':  # Parenthesis state
+            sublist = [] #  type: List[Union[str,list]]
+            stack[-1].append(sublist)
+            stack.append(sublist)
+            opened.append(i)
+            i += 1
+        elif c == ')':
+            if not opened:
                 raise TokenizerException(
-                    _('Missing matching \')\' in \'%s\'') % expression)
-            # Appends the tokenization of the content of the parenthesis
-            items.append(tokenize(expression[1:end]))
-            # Removes the entire parentesis and content from the expression
-            expression = expression[end + 1:].strip()
-
-        elif expression.startswith((SELECTION, RENAME, PROJECTION)):  # Unary operators
-            items.append(expression[0:1])
-                         # Adding operator in the top of the list
-            expression = expression[
-                1:].strip()  # Removing operator from the expression
-
-            if expression.startswith('('):  # Expression with parenthesis, so adding what's between open and close without tokenization
-                par = expression.find(
-                    '(', _find_matching_parenthesis(expression))
+                    _('Unexpected \')\' at position %d') % i)
+            stack.pop()
+            opened.pop()
+            i += 1
+        elif c in u_operators:  # Unary operators
+            stack[-1].append(Token(c, i))
+            i = _skip_spaces(expression, i + 1)
+
+            if expression.startswith('(', i):  # Expression with parenthesis, so adding what's between open and close without tokenization
+                end = _find_matching_parenthesis(expression, i)
+                if end is None:
+                    raise TokenizerException(
+                        _('Missing matching \')\' in \'%s\'') % expression[i:])
+                par = _find_token(expression, '(', end + 1, ')' if opened else None)
+            elif c == GROUP:  # The parenthesis of the aggregate functions are part of the parameter
+                par = _find_group_end(expression, i, ')' if opened else None)
             else:  # Expression without parenthesis, so adding what's between start and parenthesis as whole
-                par = _find_token(expression, '(')
+                par = _find_token(expression, '(', i, ')' if opened else None)
+            if par == -1:
+                raise TokenizerException(
+                    _('Expected \'(\' after the parameters of %s') % repr(c))
 
-            items.append(expression[:par].strip())
-                         # Inserting parameter of the operator
-            expression = expression[
-                par:].strip()  # Removing parameter from the expression
+            # Inserting parameter of the operator
+            stack[-1].append(Token(expression[i:par].strip(), i))
+            i = par
         else:  # Relation (hopefully)
-            expression += ' '  # To avoid the special case of the ending
-
-            # Initial part is a relation, stop when the name of the relation is
-            # over
-            for r in range(1, len(expression)):
-                if rtypes.RELATION_NAME_REGEXP.match(expression[:r + 1]) is None:
-                    break
-            items.append(expression[:r])
-            expression = expression[r:].strip()
+            m = _NAME_REGEXP.match(expression, i)
+            token = m.group() if m else c
+            stack[-1].append(Token(token, i))
+            i += len(token)
+        i = _skip_spaces(expression, i)
+
+    if opened:
+        raise TokenizerException(
+            _('Missing matching \')\' in \'%s\'') % expression[opened[0]:])
     return items
 
 
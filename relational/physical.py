@@ -0,0 +1,319 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module provides physical operators that stream tuples.
+#
+# The methods of Relation create a whole new relation for every operation.
+# Here selection, projection, rename and the probe side of the join are
+# iterators instead, so a chain of them never keeps the intermediate
+# results in memory.
+#
+# When a relation has indexes (see the index module), selections and joins
+# on it can look up the tuples instead of scanning them.
+#
+# Operators that need their whole input (union, difference, division...)
+# use the methods of Relation on the materialized input.
+#
+# The operators are chosen by the executor module.
+
+from itertools import chain
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from relational.relation import Relation, Header, _compile_selection, _hash_table, _tuple_getter
+from relational.rtypes import CastValue
+from relational.index import Index, HashIndex
+from gettext import gettext as _
+
+
+__all__ = [
+    'Operator',
+    'Scan',
+    'Selection',
+    'Projection',
+    'Rename',
+    'HashJoin',
+    'IndexSelection',
+    'IndexJoin',
+    'SemiJoin',
+    'Materialize',
+    'Empty',
+    'is_empty',
+]
+
+
+class Operator:
+    '''
+    A physical operator.
+
+    Iterating over it gives the tuples of the result, and
+    relation() returns the result as Relation.
+    '''
+    header: Header
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        raise NotImplementedError()
+
+    def relation(self) -> Relation:
+        '''Materializes the result.'''
+        return Relation(self.header, frozenset(self))
+
+
+class Scan(Operator):
+    '''Iterates over an existing relation.'''
+
+    def __init__(self, rel: Relation) -> None:
+        self.rel = rel
+        self.header = rel.header
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        return iter(self.rel.content)
+
+    def relation(self) -> Relation:
+        return self.rel
+
+
+class Selection(Operator):
+    '''Selection, see Relation.selection.'''
+
+    def __init__(self, child: Operator, expr: str) -> None:
+        self.child = child
+        self.expr = expr
+        self.header = child.header
+        try:
+            self.predicate = _compile_selection(expr, tuple(self.header))
+        except:
+            raise Exception(_('Failed to compile expression: %s') % expr)
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        predicate = self.predicate
+        i = None
+        try:
+            for i in self.child:
+                if predicate(*i):
+                    yield i
+        except Exception as e:
+            raise Exception(_('Failed to evaluate {expr} with {i}\n{e}').format(expr=self.expr, i=i, e=e))
+
+
+class Projection(Operator):
+    '''
+    Projection, see Relation.projection.
+
+    This is where duplicates appear, so they are removed here.
+    '''
+
+    def __init__(self, child: Operator, attributes: List[str]) -> None:
+        self.child = child
+        ids = child.header.getAttributesId(attributes)
+        if len(ids) == 0:
+            raise Exception(_('Invalid attributes for projection'))
+        self.header = Header(child.header[i] for i in ids)
+        self.getter = _tuple_getter(ids)
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        seen = set()
+        getter = self.getter
+        for i in self.child:
+            t = getter(i)
+            if t not in seen:
+                seen.add(t)
+                yield t
+
+
+class Rename(Operator):
+    '''Rename, see Relation.rename.'''
+
+    def __init__(self, child: Operator, params: Dict[str, str]) -> None:
+        self.child = child
+        self.header = child.header.rename(params)
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        return iter(self.child)
+
+
+class HashJoin(Operator):
+    '''
+    Natural join, see Relation.join.
+
+    The hash table is built on one side and the other side is
+    streamed. If only one side is already a relation, the table
+    is built on it, if both are, on the smaller one, otherwise
+    on the right side.
+    '''
+
+    def __init__(self, left: Operator, right: Operator) -> None:
+        self.left = left
+        self.right = right
+
+        shared = left.header.intersection(right.header)
+        self.header = Header(chain(left.header, (i for i in right.header if i not in shared)))
+
+        lid = left.header.getAttributesId(shared)
+        rid = right.header.getAttributesId(shared)
+        self.lkey = _tuple_getter(lid)
+        self.rkey = _tuple_getter(rid)
+        self.rrest = _tuple_getter([i for i in range(len(right.header)) if i not in rid])
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        if isinstance(self.left, Scan) and \
+                (not isinstance(self.right, Scan) or len(self.left.rel) <= len(self.right.rel)):
+            ltable = _hash_table(self.left, self.lkey, None)
+            for j in self.right:
+                rest = self.rrest(j)
+                for i in ltable.get(self.rkey(j), ()):
+                    yield i + rest
+        else:
+            rtable = _hash_table(self.right, self.rkey, self.rrest)
+            for i in self.left:
+                for rest in rtable.get(self.lkey(i), ()):
+                    yield i + rest
+
+
+class IndexSelection(Selection):
+    '''
+    Selection on the tuples of a relation that were found with an
+    index. They might not satisfy the whole condition, so it is
+    checked on them.
+    '''
+
+    def __init__(self, child: Scan, expr: str, index: Index, tuples: List[Tuple[CastValue, ...]]) -> None:
+        super().__init__(child, expr)
+        self.index = index
+        self.tuples = tuples
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        predicate = self.predicate
+        i = None
+        try:
+            for i in self.tuples:
+                if predicate(*i):
+                    yield i
+        except Exception as e:
+            raise Exception(_('Failed to evaluate {expr} with {i}\n{e}').format(expr=self.expr, i=i, e=e))
+
+
+class IndexJoin(HashJoin):
+    '''
+    Natural join, where one side is a relation with a hash index on
+    one of the shared attributes. The index is used instead of
+    building the hash table, and the other side is streamed.
+
+    If the join is on more attributes, the others are checked on
+    the tuples found.
+    '''
+
+    def __init__(self, left: Operator, right: Operator, index: HashIndex, indexed_left: bool) -> None:
+        super().__init__(left, right)
+        self.index = index
+        self.indexed_left = indexed_left
+        other = right if indexed_left else left
+        self.probe = other.header.index(index.attribute)
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        table = self.index.table
+        probe = self.probe
+        lkey = self.lkey
+        rkey = self.rkey
+        rrest = self.rrest
+        if self.indexed_left:
+            for j in self.right:
+                key = rkey(j)
+                rest = rrest(j)
+                for i in table.get(j[probe], ()):
+                    if lkey(i) == key:
+                        yield i + rest
+        else:
+            for i in self.left:
+                key = lkey(i)
+                for j in table.get(i[probe], ()):
+                    if rkey(j) == key:
+                        yield i + rrest(j)
+
+
+class SemiJoin(Operator):
+    '''
+    Semi join and anti join, see Relation.semijoin and Relation.antijoin.
+
+    Only the set of the keys of the right side is kept in memory,
+    and the tuples of the left side are streamed.
+    '''
+
+    def __init__(self, left: Operator, right: Operator, anti: bool = False) -> None:
+        self.left = left
+        self.right = right
+        self.anti = anti
+        self.header = left.header
+
+        shared = left.header.intersection(right.header)
+        self.lkey = _tuple_getter(left.header.getAttributesId(shared))
+        self.rkey = _tuple_getter(right.header.getAttributesId(shared))
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        keys = set(map(self.rkey, self.right))
+        lkey = self.lkey
+        anti = self.anti
+        for i in self.left:
+            if (lkey(i) in keys) is not anti:
+                yield i
+
+
+class Materialize(Operator):
+    '''
+    Any other operation, done by calling the method of Relation
+    on the materialized inputs.
+    '''
+
+    def __init__(self, method: str, children: List[Operator], *args: Any) -> None:
+        self.method = method
+        self.children = children
+        self.args = args
+        self.result: Optional[Relation] = None
+
+        # The header is only known by computing the result
+        self.header = self.relation().header
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        return iter(self.relation().content)
+
+    def relation(self) -> Relation:
+        if self.result is None:
+            rels = [i.relation() for i in self.children]
+            self.result = getattr(rels[0], self.method)(*rels[1:], *self.args)
+        return self.result
+
+
+class Empty(Operator):
+    '''A result that is known to be empty, without computing it.'''
+
+    def __init__(self, header: Header) -> None:
+        self.header = header
+
+    def __iter__(self) -> Iterator[Tuple[CastValue, ...]]:
+        return iter(())
+
+
+def is_empty(op: Operator) -> bool:
+    '''
+    True if the result of the operator is known to be empty,
+    without consuming it.
+    '''
+    if isinstance(op, Empty):
+        return True
+    elif isinstance(op, (Scan, Materialize)):
+        return len(op.relation().content) == 0
+    return False
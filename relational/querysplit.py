@@ -29,7 +29,7 @@ __all__ = ['split']
 class Program:
     def __init__(self, rels) -> None:
         self.queries: List[Tuple[str, Node]] = []
-        self.dictionary: Dict[str, Node] = {} # Key is the query, value is the relation
+        self.dictionary: Dict[Node, Node] = {} # Key is the query, value is the relation
         self.vgen = _vargen(rels, 'optm_')
 
     def __str__(self):
@@ -39,34 +39,33 @@ class Program:
         return r.rstrip()
 
     def append_query(self, node: Node) -> Node:
-        strnode = str(node)
-
-        rel = self.dictionary.get(strnode)
+        rel = self.dictionary.get(node)
         if rel:
             return rel
 
         qname = next(self.vgen)
         self.queries.append((qname, node))
         n = Variable(qname)
-        self.dictionary[strnode] = n
+        self.dictionary[node] = n
         return n
 
 
-def _separate(node: Node, program: Program) -> None:
+def _separate(node: Node, program: Program) -> Node:
+    '''
+    Adds the queries of the subtrees to the program and
+    returns the variable containing the result of node.
+    '''
     if isinstance(node, Unary) and isinstance(node.child, Variable):
-        _separate(node.child, program)
-        rel = program.append_query(node.child)
-        node.child = rel
+        node = Unary(node.name, node.prop, _separate(node.child, program))
     elif isinstance(node, Binary):
-        if not isinstance(node.left, Variable):
-            _separate(node.left, program)
-            rel = program.append_query(node.left)
-            node.left = rel
-        if not isinstance(node.right, Variable):
-            _separate(node.right, program)
-            rel = program.append_query(node.right)
-            node.right = rel
-    program.append_query(node)
+        left = node.left
+        right = node.right
+        if not isinstance(left, Variable):
+            left = _separate(left, program)
+        if not isinstance(right, Variable):
+            right = _separate(right, program)
+        node = Binary(node.name, left, right)
+    return program.append_query(node)
 
 
 def _vargen(avoid: str, prefix: str=''):
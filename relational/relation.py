@@ -21,19 +21,28 @@
 
 from itertools import chain, repeat, product as iproduct
 from collections import deque
-from typing import FrozenSet, Iterable, List, Dict, Tuple, Optional
+from operator import itemgetter
+from typing import FrozenSet, Iterable, List, Dict, Tuple, Optional, Callable, Any, TYPE_CHECKING
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from gettext import gettext as _
 
 from relational.rtypes import *
 
+if TYPE_CHECKING:
+    from relational.columnar import ColumnStore
+
 
 __all__ = [
     'Relation',
     'Header',
 ]
 
+
+# Minimum amount of tuples for a selection to be attempted using numpy
+VECTORIZED_SELECTION_MIN = 10000
+
 @dataclass(repr=True, unsafe_hash=False, frozen=True)
 class Relation:
     '''
@@ -152,6 +161,47 @@ class Relation:
         return Relation(header, frozenset(typed_content))
 
 
+    def columns(self) -> 'ColumnStore':
+        '''
+        Returns the columnar representation of the relation.
+
+        It is created on the first call and then kept with
+        the relation.
+        '''
+        store = getattr(self, '_columns', None)
+        if store is None:
+            from relational.columnar import ColumnStore
+            store = ColumnStore.from_relation(self)
+        return store
+
+    def types(self) -> Tuple[Optional[type], ...]:
+        '''
+        Returns the type of the values of every attribute.
+
+        None values are ignored. If an attribute has values of
+        different types, or has no values, its type is None.
+
+        The result is computed on the first call and then kept with
+        the relation.
+        '''
+        types = getattr(self, '_types', None)
+        if types is None:
+            types = []
+            for i in range(len(self.header)):
+                kinds = set(map(type, map(itemgetter(i), self.content)))
+                kinds.discard(type(None))
+                types.append(kinds.pop() if len(kinds) == 1 else None)
+            types = tuple(types)
+            object.__setattr__(self, '_types', types)
+        return types
+
+    def __getstate__(self):
+        # The caches are not saved, they are computed again when needed
+        state = self.__dict__.copy()
+        for i in ('_columns', '_indexes', '_statistics', '_types'):
+            state.pop(i, None)
+        return state
+
     def __iter__(self):
         return iter(self.content)
 
@@ -177,24 +227,29 @@ class Relation:
     def selection(self, expr: str) -> 'Relation':
         '''
         Selection, expr must be a valid Python expression; can contain field names.
+
+        On large relations, if numpy is available, simple expressions
+        are evaluated on whole columns. The columnar representation
+        (see columns()) is created the first time it is needed.
         '''
+        if len(self.content) >= VECTORIZED_SELECTION_MIN:
+            from relational import vectorized
+            r = vectorized.selection(self, expr)
+            if r is not None:
+                return r
+
         try:
-            c_expr = compile(expr, 'selection', 'eval')
+            predicate = _compile_selection(expr, tuple(self.header))
         except:
             raise Exception(_('Failed to compile expression: %s') % expr)
 
         content = []
-        for i in self.content:
-            # Fills the attributes dictionary with the values of the tuple
-            attributes = {attr: i[j]
-                          for j, attr in enumerate(self.header)
-                          }
-
-            try:
-                if eval(c_expr, attributes):
+        try:
+            for i in self.content:
+                if predicate(*i):
                     content.append(i)
-            except Exception as e:
-                raise Exception(_('Failed to evaluate {expr} with {i}\n{e}').format(expr=expr, i=i, e=e))
+        except Exception as e:
+            raise Exception(_('Failed to evaluate {expr} with {i}\n{e}').format(expr=expr, i=i, e=e))
         return Relation(self.header, frozenset(content))
 
     def product(self, other: 'Relation') -> 'Relation':
@@ -274,6 +329,41 @@ class Relation:
         attribute names unique to R, i.e., in the header of R but not in the
         header of S, for which it holds that all their combinations with tuples
         in S are present in R.
+
+        The tuples of R are grouped on the attributes unique to R, counting
+        how many tuples of S each group contains.
+        '''
+        # d_headers are the headers from self that aren't also headers in other
+        d_headers = [i for i in self.header if i not in other.header]
+        if len(d_headers) == 0:
+            raise Exception(_('Invalid attributes for projection'))
+        if not set(other.header).issubset(self.header):
+            raise TypeError(_('Relations differ: [%s] [%s]') % (
+                ','.join(self.header), ','.join(other.header)
+            ))
+
+        quotient = _tuple_getter(self.header.getAttributesId(d_headers))
+        # Restriction of the tuples of self to the attributes of other, in the same order
+        divisor = _tuple_getter(self.header.getAttributesId(other.header))
+
+        # Since self is a set, every tuple of other can only be
+        # counted once for each group
+        counts: Dict[Tuple, int] = {}
+        for i in self.content:
+            q = quotient(i)
+            if q not in counts:
+                counts[q] = 0
+            if divisor(i) in other.content:
+                counts[q] += 1
+
+        content = frozenset(q for q, count in counts.items() if count == len(other.content))
+        return Relation(Header(d_headers), content)
+
+    def _division_reference(self, other: 'Relation') -> 'Relation':
+        '''
+        Division, as defined using the other operators.
+
+        Much slower than division(), it is used to test it.
         '''
 
         # d_headers are the headers from self that aren't also headers in other
@@ -300,16 +390,87 @@ class Relation:
         other = self._rearrange(other)  # Rearranges attributes' order
         return Relation(self.header, self.content.union(other.content))
 
+    def aggregate(self, groups: List[str], aggregates: List[Tuple[str, str, Optional[str]]]) -> 'Relation':
+        '''
+        Grouping, γ in the extended relational algebra.
+
+        The tuples are grouped by the values of the attributes in groups,
+        and there is one tuple for every group, with those values followed
+        by the aggregates.
+
+        Every aggregate is (name, function, attribute), and function is
+        one of count, sum, min, max, avg. For count, attribute can be None
+        to count the tuples. None values are ignored, and the functions
+        give None when there are no values, count gives 0.
+
+        The groups are found with a hash table. With no groups, the
+        result has one tuple, unless the relation is empty.
+        '''
+        gids = self.header.getAttributesId(groups)
+        header = Header(chain(groups, (i[0] for i in aggregates)))
+
+        functions = []
+        for name, function, attribute in aggregates:
+            if function not in _AGGREGATES:
+                raise Exception(_('Unknown aggregate function: %s') % function)
+            if attribute is None and function != 'count':
+                raise Exception(_('Only count can be used on *'))
+            column = None if attribute is None else self.header.getAttributesId((attribute, ))[0]
+            functions.append((_AGGREGATES[function], column))
+
+        content = []
+        for key, rows in _hash_table(self.content, _tuple_getter(gids), None).items():
+            values = []
+            for f, column in functions:
+                if column is None:
+                    values.append(len(rows))
+                    continue
+                try:
+                    values.append(f([i[column] for i in rows if i[column] is not None]))
+                except Exception as e:
+                    raise Exception(_('Failed to compute the aggregate on {key}\n{e}').format(key=key, e=e))
+            content.append(key + tuple(values))
+        return Relation(header, frozenset(content))
+
     def thetajoin(self, other: 'Relation', expr: str) -> 'Relation':
-        '''Defined as product and then selection with the given expression.'''
-        return self.product(other).selection(expr)
+        '''Defined as product and then selection with the given expression.
+
+        The equalities between an attribute of self and an attribute of
+        other that are in "and" with the rest of the expression are
+        executed as a hash join, and the rest of the expression is
+        evaluated only on the matching tuples.'''
+        if (not isinstance(other, Relation)):
+            raise Exception('Operand must be a relation')
+        keys, residual = _split_equijoin(expr, self.header, other.header)
+        if not keys:
+            return self.product(other).selection(expr)
+        if self.header.sharedAttributes(other.header) != 0:
+            raise Exception(
+                _('Unable to perform product on relations with colliding attributes')
+            )
+        header = Header(self.header + other.header)
+
+        skey = _tuple_getter(self.header.getAttributesId(i[0] for i in keys))
+        okey = _tuple_getter(other.header.getAttributesId(i[1] for i in keys))
+
+        if len(self.content) <= len(other.content):
+            table = _hash_table(self.content, skey, None)
+            content = [i + j for j in other.content for i in table.get(okey(j), ())]
+        else:
+            table = _hash_table(other.content, okey, None)
+            content = [i + j for i in self.content for j in table.get(skey(i), ())]
+
+        r = Relation(header, frozenset(content))
+        if residual is None:
+            return r
+        return r.selection(residual)
 
     def outer(self, other: 'Relation') -> 'Relation':
-        '''Does a left and a right outer join and returns their union.'''
-        a = self.outer_right(other)
-        b = self.outer_left(other)
+        '''Does a left and a right outer join and returns their union.
 
-        return a.union(b)
+        It is done in one pass, keeping the tuples of both relations
+        that have no corrispondence.'''
+        return other._hash_join(self, keep_left=True, keep_right=True)
 
     def outer_right(self, other: 'Relation') -> 'Relation':
         '''
@@ -323,48 +484,56 @@ class Relation:
         '''
         See documentation for outer_right
         '''
-        shared = self.header.intersection(other.header)
-
-        # Creating the header with all the fields, done like that because order is
-        # needed
-        h = (i for i in other.header if i not in shared)
-        header = Header(chain(self.header, h))
+        return self._hash_join(other, keep_left=True, keep_right=False)
 
-        # Shared ids of self
-        sid = self.header.getAttributesId(shared)
-        # Shared ids of the other relation
-        oid = other.header.getAttributesId(shared)
+    def join(self, other: 'Relation') -> 'Relation':
+        '''
+        Natural join, joins on shared attributes (one or more). If there are no
+        shared attributes, it will behave as the cartesian product.
+        '''
+        return self._hash_join(other, keep_left=False, keep_right=False)
 
-        # Non shared ids of the other relation
-        noid = [i for i in range(len(other.header)) if i not in oid]
+    def semijoin(self, other: 'Relation') -> 'Relation':
+        '''
+        Semi join, keeps the tuples of self that would be joined with
+        some tuple of other. It is the same as projecting the natural
+        join on the attributes of self, without building it.
+        '''
+        return self._probe_keys(other, anti=False)
 
-        content = []
-        for i in self.content:
-            # Tuple partecipated to the join?
-            added = False
-            for j in other.content:
-                match = True
-                for k in range(len(sid)):
-                    match = match and (i[sid[k]] == j[oid[k]])
+    def antijoin(self, other: 'Relation') -> 'Relation':
+        '''
+        Anti join, keeps the tuples of self that would not be joined
+        with any tuple of other.
+        '''
+        return self._probe_keys(other, anti=True)
 
-                if match:
-                    item = chain(i, (j[l] for l in noid))
+    def _probe_keys(self, other: 'Relation', anti: bool) -> 'Relation':
+        '''
+        Builds the set of the values of the shared attributes in
+        other, and keeps the tuples of self whose values are
+        in it, or not in it if anti is True.
+        '''
+        shared = self.header.intersection(other.header)
+        skey = _tuple_getter(self.header.getAttributesId(shared))
+        keys = set(map(_tuple_getter(other.header.getAttributesId(shared)), other.content))
+        return Relation(
+            self.header,
+            frozenset(i for i in self.content if (skey(i) in keys) is not anti)
+        )
 
-                    content.append(tuple(item))
-                    added = True
-            # If it didn't partecipate, adds it
-            if not added:
-                item = chain(i, repeat(None, len(noid)))
-                content.append(tuple(item))
+    def _hash_join(self, other: 'Relation', keep_left: bool, keep_right: bool) -> 'Relation':
+        '''
+        Joins self and other on their shared attributes.
 
-        return Relation(header, frozenset(content))
+        A hash table is built on the key of the smaller relation
+        and probed with the tuples of the other one.
 
-    def join(self, other: 'Relation') -> 'Relation':
+        If keep_left is True, the tuples of self that have no
+        corrispondence are kept, and the attributes coming from
+        other are filled with None.
+        keep_right does the same for the tuples of other.
         '''
-        Natural join, joins on shared attributes (one or more). If there are no
-        shared attributes, it will behave as the cartesian product.
-        '''
-
         # List of attributes in common between the relations
         shared = self.header.intersection(other.header)
 
@@ -377,20 +546,58 @@ class Relation:
         sid = self.header.getAttributesId(shared)
         # Shared ids of the other relation
         oid = other.header.getAttributesId(shared)
-
         # Non shared ids of the other relation
         noid = [i for i in range(len(other.header)) if i not in oid]
 
-        content = []
-        for i in self.content:
-            for j in other.content:
-                match = True
-                for k in range(len(sid)):
-                    match = match and (i[sid[k]] == j[oid[k]])
+        # With no shared attributes, all the keys are () and
+        # the join behaves as the cartesian product
+        skey = _tuple_getter(sid)
+        okey = _tuple_getter(oid)
+        orest = _tuple_getter(noid)
+        padding = (None, ) * len(noid)
 
-                if match:
-                    item = chain(i, (j[l] for l in noid))
-                    content.append(tuple(item))
+        # Position in the key of every attribute of self, None if not shared
+        positions = [sid.index(i) if i in sid else None for i in range(len(self.header))]
+
+        def left_padding(key: Tuple) -> Tuple:
+            '''Values for the attributes of self, for a tuple of other without corrispondence'''
+            return tuple(None if p is None else key[p] for p in positions)
+
+        content: List[Tuple[CastValue, ...]] = []
+        matched = set()
+        if len(self.content) <= len(other.content):
+            stable = _hash_table(self.content, skey, None)
+            for j in other.content:
+                key = okey(j)
+                rows = stable.get(key)
+                if rows is None:
+                    if keep_right:
+                        content.append(left_padding(key) + orest(j))
+                    continue
+                if keep_left:
+                    matched.add(key)
+                rest = orest(j)
+                content.extend(i + rest for i in rows)
+            if keep_left:
+                for key, rows in stable.items():
+                    if key not in matched:
+                        content.extend(i + padding for i in rows)
+        else:
+            otable = _hash_table(other.content, okey, orest)
+            for i in self.content:
+                key = skey(i)
+                rows = otable.get(key)
+                if rows is not None:
+                    if keep_right:
+                        matched.add(key)
+                    content.extend(i + rest for rest in rows)
+                elif keep_left:
+                    content.append(i + padding)
+            if keep_right:
+                for key, rows in otable.items():
+                    if key not in matched:
+                        lpad = left_padding(key)
+                        content.extend(lpad + rest for rest in rows)
 
         return Relation(header, frozenset(content))
 
@@ -460,6 +667,118 @@ class Relation:
         return res
 
 
+@lru_cache(maxsize=256)
+def _compile_selection(expr: str, header: Tuple[str, ...]) -> Callable[..., Any]:
+    '''
+    Compiles the expression of a selection into a function that
+    takes the values of a tuple as positional parameters, named
+    like the attributes in the header.
+
+    The values are then local variables of the function, so no
+    dictionary is created for every tuple.
+    '''
+    import ast
+    module = ast.parse('def selection(): pass')
+    function = module.body[0]
+    assert isinstance(function, ast.FunctionDef)
+    function.args.args = [ast.arg(arg=i) for i in header]
+    function.body = [ast.Return(ast.parse(expr, mode='eval').body)]
+    ast.fix_missing_locations(module)
+
+    namespace: Dict[str, Any] = {}
+    exec(compile(module, 'selection', 'exec'), namespace)
+    return namespace['selection']
+
+
+def _split_equijoin(expr: str, left: 'Header', right: 'Header') -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    '''
+    Finds the conditions like a == b in the expression, where a is an
+    attribute of left and b an attribute of right (or the opposite),
+    that must hold for the whole expression to be true.
+
+    Returns the list of (left attribute, right attribute) and the
+    expression with the remaining conditions, or None if nothing
+    remains.
+
+    If the expression can't be parsed, no condition is found.
+    '''
+    import ast
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return [], expr
+
+    # Flattens a and (b and c) into [a, b, c]
+    conjuncts = []
+    todo = [tree.body]
+    while todo:
+        n = todo.pop(0)
+        if isinstance(n, ast.BoolOp) and isinstance(n.op, ast.And):
+            todo = n.values + todo
+        else:
+            conjuncts.append(n)
+
+    keys = []
+    rest = []
+    for n in conjuncts:
+        if isinstance(n, ast.Compare) and \
+                len(n.ops) == 1 and \
+                isinstance(n.ops[0], ast.Eq) and \
+                isinstance(n.left, ast.Name) and \
+                isinstance(n.comparators[0], ast.Name):
+            a = n.left.id
+            b = n.comparators[0].id
+            if a in left and b in right:
+                keys.append((a, b))
+                continue
+            elif b in left and a in right:
+                keys.append((b, a))
+                continue
+        rest.append(n)
+
+    if not rest:
+        return keys, None
+    elif len(rest) == 1:
+        return keys, ast.unparse(rest[0])
+    return keys, ast.unparse(ast.BoolOp(ast.And(), rest))
+
+
+# Aggregate functions of the grouping, they get the values that are not None
+_AGGREGATES: Dict[str, Callable[[List[Any]], Any]] = {
+    'count': len,
+    'sum': lambda v: sum(v) if v else None,
+    'min': lambda v: min(v) if v else None,
+    'max': lambda v: max(v) if v else None,
+    'avg': lambda v: sum(v) / len(v) if v else None,
+}
+
+
+def _tuple_getter(ids: List[int]) -> Callable[[Tuple], Tuple]:
+    '''
+    Returns a function that extracts the values at the given
+    positions of a tuple, always as a tuple.
+    '''
+    if len(ids) == 0:
+        return lambda t: ()
+    elif len(ids) == 1:
+        i = ids[0]
+        return lambda t: (t[i], )
+    return itemgetter(*ids)
+
+
+def _hash_table(content: Iterable[Tuple], key: Callable[[Tuple], Tuple], value: Optional[Callable[[Tuple], Tuple]]) -> Dict[Tuple, List[Tuple]]:
+    '''
+    Groups the tuples by key.
+
+    If value is not None, it is applied to the tuples
+    before storing them.
+    '''
+    table: Dict[Tuple, List[Tuple]] = {}
+    for t in content:
+        table.setdefault(key(t), []).append(t if value is None else value(t))
+    return table
+
+
 class Header(tuple):
 
     '''This class defines the header of a relation.
@@ -0,0 +1,380 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module computes statistics on relations, and uses them to
+# estimate the size of the results of expressions.
+#
+# The cost of an expression is the sum of the estimated sizes of all
+# the intermediate results, counted in values, so between equivalent
+# expressions the one producing less and narrower tuples is preferred.
+
+import ast
+from bisect import bisect_left
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Dict, Optional, Tuple
+
+from relational.relation import Relation
+from relational.rtypes import CastValue
+from relational.executor import is_false
+from relational.parser import Node, Variable, Unary, Binary, \
+    PRODUCT, DIFFERENCE, UNION, INTERSECTION, DIVISION, JOIN, \
+    JOIN_LEFT, JOIN_RIGHT, JOIN_FULL, SEMIJOIN, ANTIJOIN, PROJECTION, SELECTION, RENAME, GROUP
+
+
+__all__ = [
+    'ColumnStatistics',
+    'Statistics',
+    'compute',
+    'of',
+    'CostModel',
+]
+
+
+# Amount of buckets in the histograms
+HISTOGRAM_BUCKETS = 10
+
+# Selectivity of conditions that can't be estimated
+DEFAULT_SELECTIVITY = 1 / 3
+
+
+@dataclass(frozen=True)
+class ColumnStatistics:
+    '''
+    Statistics on the values of an attribute.
+
+    distinct is the amount of different values, not counting None,
+    nulls the amount of None values.
+
+    histogram is only present for int and float attributes. It
+    contains the bounds of buckets containing the same amount of
+    values, so the first one is the minimum and the last one the
+    maximum.
+    '''
+    distinct: float
+    nulls: float
+    min: Optional[CastValue] = None
+    max: Optional[CastValue] = None
+    histogram: Optional[Tuple[float, ...]] = None
+
+    def fraction_below(self, value: float) -> Optional[float]:
+        '''
+        Returns the estimated fraction of the values that are
+        lower than value, or None if it can't be estimated.
+        '''
+        h = self.histogram
+        if h is None or len(h) < 2:
+            return None
+        if value <= h[0]:
+            return 0.0
+        if value > h[-1]:
+            return 1.0
+        # Bucket containing the value, and linear interpolation inside it
+        i = max(bisect_left(h, value), 1)
+        low, high = h[i - 1], h[i]
+        inside = (value - low) / (high - low) if high > low else 0.0
+        return (i - 1 + inside) / (len(h) - 1)
+
+    def scaled(self, rows: float) -> 'ColumnStatistics':
+        '''Returns the statistics for a subset of rows tuples.'''
+        if self.distinct <= rows:
+            return self
+        return ColumnStatistics(rows, min(self.nulls, rows), self.min, self.max, self.histogram)
+
+
+@dataclass(frozen=True)
+class Statistics:
+    '''
+    Statistics on a relation: the amount of tuples, and the
+    statistics on every attribute.
+    '''
+    rows: float
+    columns: Dict[str, ColumnStatistics]
+
+    def column(self, attribute: str) -> ColumnStatistics:
+        '''
+        Returns the statistics of an attribute, assuming all
+        different values if they are not known.
+        '''
+        try:
+            return self.columns[attribute]
+        except KeyError:
+            return ColumnStatistics(self.rows, 0)
+
+    def scaled(self, rows: float) -> 'Statistics':
+        '''Returns the statistics for a subset of rows tuples.'''
+        return Statistics(rows, {k: v.scaled(rows) for k, v in self.columns.items()})
+
+
+def compute(rel: Relation, buckets: int = HISTOGRAM_BUCKETS) -> Statistics:
+    '''
+    Computes the statistics of a relation.
+
+    buckets is the amount of buckets of the histograms,
+    0 to not compute them.
+    '''
+    columns = {}
+    for i, attribute in enumerate(rel.header):
+        values = [v for v in map(itemgetter(i), rel.content) if v is not None]
+        nulls = len(rel.content) - len(values)
+        distinct = set(values)
+        try:
+            low = min(distinct) if distinct else None
+            high = max(distinct) if distinct else None
+        except TypeError:
+            # Values that can't be compared
+            low = high = None
+
+        histogram = None
+        if buckets and values and all(type(v) in (int, float) for v in distinct):
+            values.sort()
+            last = len(values) - 1
+            histogram = tuple(float(values[last * j // buckets]) for j in range(buckets + 1))
+
+        columns[attribute] = ColumnStatistics(len(distinct), nulls, low, high, histogram)
+    return Statistics(len(rel.content), columns)
+
+
+def of(rel: Relation) -> Statistics:
+    '''
+    Returns the statistics of a relation.
+
+    They are computed on the first call and then kept
+    with the relation.
+    '''
+    stats = getattr(rel, '_statistics', None)
+    if stats is None:
+        stats = compute(rel)
+        object.__setattr__(rel, '_statistics', stats)
+    return stats
+
+
+class CostModel:
+    '''
+    Estimates the size of the results of the expressions
+    on some relations.
+
+    The estimations are kept, so the relations must not
+    change while the same CostModel is used.
+    '''
+
+    def __init__(self, rels: Dict[str, Relation]) -> None:
+        self.rels = rels
+        self._estimates: Dict[Node, Statistics] = {}
+        self._costs: Dict[Node, float] = {}
+
+    def cost(self, node: Node) -> float:
+        '''
+        Returns the cost of the expression, which is the sum of
+        the estimated sizes of all its intermediate results.
+        '''
+        r = self._costs.get(node)
+        if r is not None:
+            return r
+
+        costs = self._costs
+
+        def done(i: Node) -> bool:
+            if i in costs:
+                return True
+            if is_false(i):
+                # The executor does not compute the child
+                costs[i] = 0.0
+                return True
+            return False
+
+        # The children first, so deep trees don't need recursion
+        for i in node._walk(done):
+            if isinstance(i, Unary):
+                r = costs[i.child] + self.size(i)
+            elif isinstance(i, Binary):
+                r = costs[i.left] + costs[i.right] + self.size(i)
+            else:
+                r = 0.0
+            costs[i] = r
+        return costs[node]
+
+    def size(self, node: Node) -> float:
+        '''Returns the estimated amount of values in the result.'''
+        stats = self.estimate(node)
+        return stats.rows * max(len(stats.columns), 1)
+
+    def estimate(self, node: Node) -> Statistics:
+        '''Returns the estimated statistics of the result of the expression.'''
+        r = self._estimates.get(node)
+        if r is None:
+            # The children first, so deep trees don't need recursion
+            for i in node._walk(self._estimates.__contains__):
+                self._estimates[i] = self._estimate(i)
+            r = self._estimates[node]
+        return r
+
+    def _estimate(self, node: Node) -> Statistics:
+        if isinstance(node, Variable):
+            return of(self.rels[node.name])
+        elif isinstance(node, Unary):
+            child = self.estimate(node.child)
+            if node.name == SELECTION:
+                return child.scaled(child.rows * self.selectivity(node.prop, child))
+            elif node.name == PROJECTION:
+                attributes = node.get_projection_prop()
+                rows = 1.0
+                for i in attributes:
+                    rows *= max(child.column(i).distinct, 1)
+                return Statistics(min(rows, child.rows), {i: child.column(i) for i in attributes})
+            elif node.name == RENAME:
+                renames = node.get_rename_prop()
+                return Statistics(child.rows, {renames.get(k, k): v for k, v in child.columns.items()})
+            elif node.name == GROUP:
+                groups, aggregates = node.get_aggregate_prop()
+                rows = min(1.0, child.rows)
+                for i in groups:
+                    rows *= max(child.column(i).distinct, 1)
+                rows = min(rows, child.rows)
+                columns = {i: child.column(i).scaled(rows) for i in groups}
+                for name, function, attribute in aggregates:
+                    if function in ('min', 'max') and attribute is not None:
+                        # Some of the values of the attribute
+                        columns[name] = child.column(attribute).scaled(rows)
+                    else:
+                        columns[name] = ColumnStatistics(rows, 0)
+                return Statistics(rows, columns)
+        elif isinstance(node, Binary):
+            left = self.estimate(node.left)
+            right = self.estimate(node.right)
+            columns = {**right.columns, **left.columns}
+            if node.name == PRODUCT:
+                return Statistics(left.rows * right.rows, columns)
+            elif node.name in (JOIN, JOIN_LEFT, JOIN_RIGHT, JOIN_FULL):
+                rows = left.rows * right.rows
+                for i in set(left.columns).intersection(right.columns):
+                    rows /= max(left.column(i).distinct, right.column(i).distinct, 1)
+                    columns[i] = min(left.column(i), right.column(i), key=lambda c: c.distinct)
+                if node.name == JOIN_LEFT:
+                    rows = max(rows, left.rows)
+                elif node.name == JOIN_RIGHT:
+                    rows = max(rows, right.rows)
+                elif node.name == JOIN_FULL:
+                    rows = max(rows, left.rows + right.rows - rows)
+                return Statistics(rows, columns).scaled(rows)
+            elif node.name in (SEMIJOIN, ANTIJOIN):
+                # Fraction of the tuples of left that have a corrispondence
+                matched = 1.0 if right.rows else 0.0
+                for i in set(left.columns).intersection(right.columns):
+                    matched *= min(right.column(i).distinct / max(left.column(i).distinct, 1), 1.0)
+                if node.name == ANTIJOIN:
+                    matched = 1.0 - matched
+                return left.scaled(left.rows * matched)
+            elif node.name == UNION:
+                return Statistics(left.rows + right.rows, columns)
+            elif node.name == INTERSECTION:
+                return left.scaled(min(left.rows, right.rows))
+            elif node.name == DIFFERENCE:
+                return left
+            elif node.name == DIVISION:
+                rows = 1.0
+                quotient = {k: v for k, v in left.columns.items() if k not in right.columns}
+                for c in quotient.values():
+                    rows *= max(c.distinct, 1)
+                rows = min(rows, left.rows / max(right.rows, 1))
+                return Statistics(rows, quotient).scaled(rows)
+        raise ValueError('What kind of alien object is this?')
+
+    def selectivity(self, expr: str, stats: Statistics) -> float:
+        '''
+        Returns the estimated fraction of the tuples that
+        satisfy the condition of a selection.
+        '''
+        try:
+            tree = ast.parse(expr.strip(), mode='eval')
+        except SyntaxError:
+            return DEFAULT_SELECTIVITY
+        return _Selectivity(stats).visit(tree.body)
+
+
+class _Selectivity:
+    '''Estimates the selectivity of the nodes of the ast of a condition.'''
+
+    def __init__(self, stats: Statistics) -> None:
+        self.stats = stats
+
+    def visit(self, node: ast.AST) -> float:
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            return DEFAULT_SELECTIVITY
+        return method(node)
+
+    def visit_Constant(self, node: ast.Constant) -> float:
+        return 1.0 if node.value else 0.0
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> float:
+        if isinstance(node.op, ast.Not):
+            return 1.0 - self.visit(node.operand)
+        return DEFAULT_SELECTIVITY
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> float:
+        values = [self.visit(i) for i in node.values]
+        r = values[0]
+        for i in values[1:]:
+            if isinstance(node.op, ast.And):
+                r *= i
+            else:
+                r = r + i - r * i
+        return r
+
+    def visit_Compare(self, node: ast.Compare) -> float:
+        r = 1.0
+        for op, left, right in zip(node.ops, [node.left] + node.comparators, node.comparators):
+            r *= self._compare(op, left, right)
+        return r
+
+    def _compare(self, op: ast.cmpop, left: ast.expr, right: ast.expr) -> float:
+        # The attribute on the left
+        if isinstance(right, ast.Name) and not isinstance(left, ast.Name):
+            left, right = right, left
+            op = {ast.Lt: ast.Gt(), ast.Gt: ast.Lt(), ast.LtE: ast.GtE(), ast.GtE: ast.LtE()}.get(type(op), op)
+        if not isinstance(left, ast.Name) or left.id not in self.stats.columns:
+            return DEFAULT_SELECTIVITY
+        column = self.stats.column(left.id)
+        valued = 1 - column.nulls / self.stats.rows if self.stats.rows else 0.0
+
+        if isinstance(right, ast.Name):
+            other = self.stats.column(right.id)
+            if isinstance(op, ast.Eq):
+                return valued / max(column.distinct, other.distinct, 1)
+            elif isinstance(op, ast.NotEq):
+                return valued * (1 - 1 / max(column.distinct, other.distinct, 1))
+            return DEFAULT_SELECTIVITY
+
+        if isinstance(op, ast.Eq):
+            return valued / max(column.distinct, 1)
+        elif isinstance(op, ast.NotEq):
+            return valued * (1 - 1 / max(column.distinct, 1))
+
+        if not isinstance(right, ast.Constant) or \
+                isinstance(right.value, bool) or \
+                not isinstance(right.value, (int, float)):
+            return DEFAULT_SELECTIVITY
+        below = column.fraction_below(right.value)
+        if below is None:
+            return DEFAULT_SELECTIVITY
+        if isinstance(op, (ast.Lt, ast.LtE)):
+            return valued * below
+        elif isinstance(op, (ast.Gt, ast.GtE)):
+            return valued * (1 - below)
+        return DEFAULT_SELECTIVITY
@@ -0,0 +1,263 @@
+# Relational
+# Copyright (C) 2008-2023  Salvo "LtWorf" Tomaselli
+#
+# Relational is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# author Salvo "LtWorf" Tomaselli <tiposchi@tiscali.it>
+#
+# This module evaluates selections on whole columns using numpy.
+#
+# Only a subset of python is supported: comparisons, and, or, not,
+# numeric constants, and attributes that are int, float or Rdate
+# without None values. For Rdate, the year, month, day and weekday
+# properties are also supported.
+#
+# numpy is optional. If it is missing, or the expression is not supported,
+# selection() returns None and the selection must be done tuple by tuple.
+
+import ast
+from array import array
+from functools import lru_cache
+from itertools import compress
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from relational.relation import Relation
+from relational.rtypes import Rdate
+from relational.columnar import TYPECODES
+
+try:
+    import numpy  # type: ignore
+except ImportError:
+    numpy = None  # type: ignore
+
+
+__all__ = [
+    'supported',
+    'selection',
+]
+
+
+# Date.toordinal() of 1970-01-01
+_EPOCH = 719163
+
+_COMPARISONS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+}
+
+# Value types of the translated expressions
+_BOOL = 'bool'
+_NUMBER = 'number'
+_DATE = 'date'
+
+# A translated expression takes the dictionary of the
+# columns and returns a numpy array.
+Translated = Tuple[str, Callable[[Dict[str, Any]], Any]]
+
+
+class Unsupported(Exception):
+    pass
+
+
+def supported(rel: Relation, expr: str) -> bool:
+    '''
+    True if numpy is available and the expression can be evaluated
+    on the columns of the relation.
+
+    It does not create the columns, so the types of the attributes
+    come from Relation.types(). The attributes with None values
+    are only found when creating the columns.
+    '''
+    return _function(rel, expr) is not None
+
+
+def _function(rel: Relation, expr: str) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    '''Returns the translated expression, or None if it is not supported.'''
+    if numpy is None:
+        return None
+
+    attributes = _attributes(expr, tuple(rel.header))
+    if attributes is None:
+        return None
+
+    types = dict(zip(rel.header, rel.types()))
+    kinds = []
+    for attribute in sorted(attributes):
+        kind = types[attribute]
+        if kind not in TYPECODES:
+            return None
+        kinds.append((attribute, kind))
+    return _translate(expr, tuple(kinds))
+
+
+def selection(rel: Relation, expr: str) -> Optional[Relation]:
+    '''
+    Performs the selection on the columns of the relation.
+
+    The columns are created, and kept with the relation, the first
+    time an expression that can use them is found.
+
+    Returns None if numpy is not available or the expression
+    can't be evaluated on whole columns.
+    '''
+    function = _function(rel, expr)
+    if function is None:
+        return None
+
+    store = rel.columns()
+    arrays = {}
+    for attribute in _attributes(expr, tuple(rel.header)) or ():
+        column = store.column(attribute)
+        if not isinstance(column.values, array) or column.nullcount:
+            return None
+        arrays[attribute] = numpy.frombuffer(column.values, dtype=numpy.dtype(column.values.typecode))
+
+    mask = function(arrays)
+    if numpy.shape(mask) == ():
+        # The expression does not depend on any attribute
+        return rel if mask else Relation(rel.header, frozenset())
+    if store.ordered:
+        # Takes the tuples directly from the relation
+        return Relation(rel.header, frozenset(compress(rel.content, mask.tolist())))
+    return store.take(numpy.flatnonzero(mask).tolist()).to_relation()
+
+
+@lru_cache(maxsize=256)
+def _attributes(expr: str, header: Tuple[str, ...]) -> Optional[Tuple[str, ...]]:
+    '''
+    Returns the attributes used in the expression, or None if the
+    expression is not valid or uses names that are not attributes.
+    '''
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return None
+    attributes = {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+    if not attributes.issubset(header):
+        return None
+    return tuple(attributes)
+
+
+@lru_cache(maxsize=256)
+def _translate(expr: str, kinds: Tuple[Tuple[str, type], ...]) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    '''
+    Translates the expression into a function that takes the
+    dictionary of the columns and returns the mask of the
+    selected tuples.
+
+    kinds contains the type of every attribute used in the
+    expression.
+
+    Returns None if the expression is not supported.
+    '''
+    tree = ast.parse(expr.strip(), mode='eval')
+    try:
+        kind, function = _Translator(dict(kinds)).visit(tree.body)
+    except Unsupported:
+        return None
+    if kind != _BOOL:
+        return None
+    return function
+
+
+class _Translator:
+    '''
+    Translates an ast into a function working on the columns.
+
+    Every visit method returns the type of the value and
+    the function.
+    '''
+
+    def __init__(self, kinds: Dict[str, type]) -> None:
+        self.kinds = kinds
+
+    def visit(self, node: ast.AST) -> Translated:
+        method = getattr(self, 'visit_' + node.__class__.__name__, None)
+        if method is None:
+            raise Unsupported()
+        return method(node)
+
+    def visit_Constant(self, node: ast.Constant) -> Translated:
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise Unsupported()
+        if isinstance(value, int) and abs(value) >= 2 ** 63:
+            raise Unsupported()
+        return _NUMBER, lambda c: value
+
+    def visit_Name(self, node: ast.Name) -> Translated:
+        name = node.id
+        kind = _DATE if self.kinds[name] is Rdate else _NUMBER
+        return kind, lambda c: c[name]
+
+    def visit_Attribute(self, node: ast.Attribute) -> Translated:
+        if not isinstance(node.value, ast.Name) or self.kinds[node.value.id] is not Rdate:
+            raise Unsupported()
+        name = node.value.id
+
+        def dates(c):
+            return (c[name] - _EPOCH).astype('datetime64[D]')
+
+        if node.attr == 'year':
+            return _NUMBER, lambda c: dates(c).astype('datetime64[Y]').astype(numpy.int64) + 1970
+        elif node.attr == 'month':
+            return _NUMBER, lambda c: dates(c).astype('datetime64[M]').astype(numpy.int64) % 12 + 1
+        elif node.attr == 'day':
+            return _NUMBER, lambda c: (dates(c) - dates(c).astype('datetime64[M]')).astype(numpy.int64) + 1
+        elif node.attr == 'weekday':
+            # Ordinal 1 is a monday
+            return _NUMBER, lambda c: (c[name].astype(numpy.int64) + 6) % 7
+        raise Unsupported()
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> Translated:
+        kind, operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not) and kind == _BOOL:
+            return _BOOL, lambda c: numpy.logical_not(operand(c))
+        elif isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+            return _NUMBER, lambda c: -operand(c)
+        raise Unsupported()
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> Translated:
+        values = [self.visit(i) for i in node.values]
+        if any(kind != _BOOL for kind, _ in values):
+            raise Unsupported()
+        functions = [f for _, f in values]
+        combine = numpy.logical_and if isinstance(node.op, ast.And) else numpy.logical_or
+
+        def boolop(c):
+            r = functions[0](c)
+            for f in functions[1:]:
+                r = combine(r, f(c))
+            return r
+        return _BOOL, boolop
+
+    def visit_Compare(self, node: ast.Compare) -> Translated:
+        values = [self.visit(i) for i in [node.left] + node.comparators]
+        comparisons = []
+        for op, (lkind, left), (rkind, right) in zip(node.ops, values, values[1:]):
+            if type(op) not in _COMPARISONS or lkind == _BOOL or lkind != rkind:
+                # Dates can only be compared with dates
+                raise Unsupported()
+            comparisons.append((_COMPARISONS[type(op)], left, right))
+
+        def compare(c):
+            result = True
+            for op, left, right in comparisons:
+                result = numpy.logical_and(result, op(left(c), right(c)))
+            return result
+        return _BOOL, compare
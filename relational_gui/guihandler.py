@@ -169,15 +169,9 @@ class relForm(QtWidgets.QMainWindow):
 
         res_rel,query = self.user_interface.split_query(self.ui.txtQuery.text(),None)
         try:
-            trace = []
-            result = optimizer.optimize_all(
-                query,
-                self.user_interface.relations,
-                debug=trace
-            )
+            result, steps = self.optimizationSteps(query)
             print('==== Optimization steps ====')
-            print(query)
-            print('\n'.join(trace))
+            print(steps)
             print('========')
 
             if res_rel:
@@ -186,6 +180,57 @@ class relForm(QtWidgets.QMainWindow):
         except Exception as e:
             self.error(e)
 
+    def optimizationSteps(self, query):
+        '''
+        Optimizes the query, and returns the result and
+        the description of the steps.
+        '''
+        trace = []
+        stats = {}
+        result = optimizer.optimize_all(
+            query,
+            self.user_interface.relations,
+            debug=trace,
+            stats=stats
+        )
+        steps = '\n'.join([query] + trace)
+        steps += '\n%d steps in %.3fs' % (stats['applications'], stats['time'])
+        return result, steps
+
+    def explain(self):
+        '''
+        Executes the query, and shows the time spent in every operation,
+        together with the steps that the optimizer would do.
+        '''
+        query = self.user_interface.split_query(self.ui.txtQuery.text(), None)[1]
+        if not query.strip():
+            return
+        try:
+            steps = self.optimizationSteps(query)[1]
+            plan = self.user_interface.explain(query)
+        except Exception as e:
+            return self.error(e)
+
+        text = '\n'.join((
+            _('==== Execution plan ===='),
+            str(plan),
+            '',
+            _('==== Optimization steps ===='),
+            steps,
+        ))
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle(_('Explain'))
+        view = QtWidgets.QPlainTextEdit(dialog)
+        view.setReadOnly(True)
+        view.setLineWrapMode(QtWidgets.QPlainTextEdit.NoWrap)
+        view.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        view.setPlainText(text)
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(view)
+        dialog.resize(800, 400)
+        dialog.show()
+
     def resumeHistory(self, item):
         if item is None:
             return
@@ -456,6 +501,12 @@ class relForm(QtWidgets.QMainWindow):
     def addOuter(self):
         self.addSymbolInQuery(parser.JOIN_FULL)
 
+    def addSemiJoin(self):
+        self.addSymbolInQuery(parser.SEMIJOIN)
+
+    def addAntiJoin(self):
+        self.addSymbolInQuery(parser.ANTIJOIN)
+
     def addProjection(self):
         self.addSymbolInQuery(parser.PROJECTION)
 
@@ -465,6 +516,9 @@ class relForm(QtWidgets.QMainWindow):
     def addRename(self):
         self.addSymbolInQuery(parser.RENAME)
 
+    def addGroup(self):
+        self.addSymbolInQuery(parser.GROUP)
+
     def addArrow(self):
         self.addSymbolInQuery(parser.ARROW)
 
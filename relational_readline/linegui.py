@@ -109,8 +109,8 @@ class SimpleCompleter:
 
 ui = maintenance.UserInterface()
 completer = SimpleCompleter(
-    ['SURVEY', 'LIST', 'LOAD ', 'UNLOAD ', 'HELP ', 'QUIT', 'SAVE ', '_PRODUCT ', '_UNION ', '_INTERSECTION ',
-     '_DIFFERENCE ', '_JOIN ', '_LJOIN ', '_RJOIN ', '_FJOIN ', '_PROJECTION ', '_RENAME_TO ', '_SELECTION ', '_RENAME ', '_DIVISION '])
+    ['SURVEY', 'LIST', 'LOAD ', 'UNLOAD ', 'HELP ', 'QUIT', 'SAVE ', 'EXPLAIN ', 'ANALYZE ', 'INDEX ', 'UNINDEX ', 'CACHE', '_PRODUCT ', '_UNION ', '_INTERSECTION ',
+     '_DIFFERENCE ', '_JOIN ', '_LJOIN ', '_RJOIN ', '_FJOIN ', '_SEMIJOIN ', '_ANTIJOIN ', '_PROJECTION ', '_RENAME_TO ', '_SELECTION ', '_RENAME ', '_GROUP ', '_DIVISION '])
 
 
 def load_relation(filename: str, defname: Optional[str]) -> Optional[str]:
@@ -192,6 +192,14 @@ def help(command: str) -> None:
         'SAVE': _('SAVE filename relationame\nSaves a relation in a file'),
         'HELP': _('Prints the help on a command'),
         'SURVEY': _('Fill and send a survey'),
+        'EXPLAIN': _('EXPLAIN query\nShows the operations of the query, with the estimated amount of tuples'),
+        'ANALYZE': _('ANALYZE query\nExecutes the query and shows, for every operation, the amount of tuples and the time spent'),
+        'INDEX': _('INDEX relationame [attribute [hash|sorted]]\nCreates an index on an attribute, used by selections and joins.\n'
+                   'hash indexes are for equality, sorted indexes also for ranges on numbers.\n'
+                   'Without an attribute, lists the indexes of the relation.\n'
+                   'The indexes are lost when a different relation is given the same name'),
+        'UNINDEX': _('UNINDEX relationame [attribute]\nRemoves the indexes on an attribute, or all of them'),
+        'CACHE': _('CACHE [CLEAR]\nShows the statistics of the cache of the results of the queries, or empties it'),
     }
     print(cmdhelp.get(cmd, _('Unknown command: %s') % cmd))
 
@@ -216,6 +224,42 @@ def exec_line(command: str) -> None:
                 print(i)
     elif command == 'SURVEY':
         survey()
+    elif command.startswith('EXPLAIN '):
+        explain_query(command[len('EXPLAIN '):], False)
+    elif command.startswith('ANALYZE '):
+        explain_query(command[len('ANALYZE '):], True)
+    elif command.startswith('INDEX '):
+        pars = command.split()
+        if len(pars) > 4:
+            print(colorize(_("Too many parameter"), ERROR_COLOR))
+            return
+        try:
+            if len(pars) == 2:
+                for i in ui.indexes(pars[1]):
+                    print('%s %s' % (i.attribute, i.kind))
+            else:
+                ui.create_index(*pars[1:])
+        except KeyError:
+            print(colorize(_("No such relation %s") % pars[1], ERROR_COLOR))
+        except Exception as e:
+            print(colorize(str(e), ERROR_COLOR))
+    elif command.startswith('UNINDEX '):
+        pars = command.split()
+        if len(pars) > 3:
+            print(colorize(_("Too many parameter"), ERROR_COLOR))
+            return
+        try:
+            ui.drop_index(*pars[1:])
+        except KeyError:
+            print(colorize(_("No such relation %s") % pars[1], ERROR_COLOR))
+    elif command == 'CACHE':
+        cache = ui.result_cache
+        print(_('Results: %d') % len(cache))
+        print(_('Size: %d/%d bytes') % (cache.bytes, cache.max_bytes))
+        print(_('Hits: %d  Misses: %d  Evictions: %d') % (cache.hits, cache.misses, cache.evictions))
+        print(_('Saved: %d bytes') % cache.bytes_saved)
+    elif command == 'CACHE CLEAR':
+        ui.result_cache.clear()
     elif command.startswith('LOAD '):  # Loads a relation
         pars = command.split(' ')
         if len(pars) == 1:
@@ -267,9 +311,12 @@ def replacements(query: str) -> str:
         ('_LJOIN', parser.JOIN_LEFT),
         ('_RJOIN', parser.JOIN_RIGHT),
         ('_FJOIN', parser.JOIN_FULL),
+        ('_SEMIJOIN', parser.SEMIJOIN),
+        ('_ANTIJOIN', parser.ANTIJOIN),
         ('_PROJECTION', parser.PROJECTION),
         ('_RENAME_TO', parser.ARROW),
         ('_SELECTION', parser.SELECTION),
+        ('_GROUP', parser.GROUP),
         ('_RENAME', parser.RENAME),
         ('_DIVISION', parser.DIVISION),
     )
@@ -278,6 +325,14 @@ def replacements(query: str) -> str:
     return query
 
 
+def explain_query(query: str, analyze: bool) -> None:
+    '''Prints the plan of a query, executing it if analyze is True.'''
+    try:
+        print(ui.explain(replacements(query), analyze))
+    except Exception as e:
+        print(colorize(str(e), ERROR_COLOR))
+
+
 def exec_query(command: str) -> None:
     '''
     Executes a query and prints the result on the screen
@@ -302,17 +357,14 @@ def exec_query(command: str) -> None:
 
     # Execute query
     try:
-        pyquery = parser.parse(query)
-        result = pyquery(ui.relations)
+        result = ui.execute(query, relname)
 
-        printtty(colorize("-> query: %s" % pyquery, COLOR_GREEN))
+        printtty(colorize("-> query: %s" % query, COLOR_GREEN))
 
         if printrel:
             print()
             print(result.pretty_string(tty=True))
 
-        ui.relations[relname] = result
-
         completer.add_completion(relname)
     except Exception as e:
         print(colorize(str(e), ERROR_COLOR))
@@ -0,0 +1,51 @@
+from relational import parser, optimizer
+from relational.executor import execute
+from relational.relation import Relation, Header
+
+r = Relation(Header(('g', 'v')), frozenset({(1, 2), (1, 4), (2, None), (2, 3), (3, None)}))
+
+result = r.aggregate(['g'], [('n', 'count', None), ('c', 'count', 'v'), ('s', 'sum', 'v'), ('lo', 'min', 'v'), ('hi', 'max', 'v'), ('a', 'avg', 'v')])
+assert result.header == ('g', 'n', 'c', 's', 'lo', 'hi', 'a')
+assert result.content == {(1, 2, 2, 6, 2, 4, 3.0), (2, 2, 1, 3, 3, 3, 3.0), (3, 1, 0, None, None, None, None)}
+
+# Without groups, one tuple unless the relation is empty
+assert r.aggregate([], [('n', 'count', None)]).content == {(5, )}
+assert len(r.selection('False').aggregate([], [('n', 'count', None)])) == 0
+
+# Grammar
+node = parser.tree('γ chief, max(age)➡oldest, count(*) (people)')
+assert node.name == parser.GROUP and node.child == parser.Variable('people')
+assert node.get_aggregate_prop() == (['chief'], [('oldest', 'max', 'age'), ('count', 'count', None)])
+assert parser.tree('γ sum( age ) (people)').get_aggregate_prop() == ([], [('sum_age', 'sum', 'age')])
+assert parser.tree(str(node)) == node
+assert parser.Unary.aggregate(['chief'], [('oldest', 'max', 'age'), ('count', 'count', None)], node.child).get_aggregate_prop() == node.get_aggregate_prop()
+assert node.result_format({'people': people}) == ['chief', 'oldest', 'count']
+assert node.schema({'people': people}).types == (int, int, int)
+assert execute(node, {'people': people}) == people.aggregate(['chief'], [('oldest', 'max', 'age'), ('count', 'count', None)])
+assert parser.tree('γ max(age)➡a (people) ⋈ skills').name == parser.JOIN
+for wrong in ('γ median(age) (people)', 'γ sum(*) (people)'):
+    try:
+        parser.tree(wrong).get_aggregate_prop()
+        assert False
+    except parser.ParserException:
+        pass
+
+# The highest and lowest values without γ
+rels = {'people': people, 'dates': dates}
+for query, expected in (
+        ('dates - π date (σ d > date (ρ date➡d (dates) * dates))', 'γ max(date)➡date (dates)'),
+        ('dates - π date (σ date < d (dates * ρ date➡d (dates)))', 'γ max(date)➡date (dates)'),
+        ('dates - π date (σ d < date (ρ date➡d (dates) * dates))', 'γ min(date)➡date (dates)'),
+        ('people - π id,name,chief,age (σ a > age (ρ id➡i,age➡a (π id,age (people)) * people))', 'people⋈γ max(age)➡age (people)'),
+        ):
+    optimized = optimizer.optimize_all(query, rels)
+    assert optimized == expected, optimized
+    assert execute(parser.tree(optimized), rels) == execute(parser.tree(query), rels)
+
+# Not the same thing
+for query in (
+        'dates - π date (σ d >= date (ρ date➡d (dates) * dates))',
+        'dates - π date (σ d > date (ρ date➡d (σ True (dates)) * dates))',
+        'people - π id,name,chief,age (σ a > age and i != id (ρ id➡i,age➡a (π id,age (people)) * people))',
+        ):
+    assert parser.GROUP not in optimizer.optimize_all(query, rels), query
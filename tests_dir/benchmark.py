@@ -0,0 +1,32 @@
+import os
+
+import benchmark
+
+# The relations only depend on scale and seed
+rels = benchmark.generate(100)
+assert rels == benchmark.generate(100)
+assert rels != benchmark.generate(100, seed=1)
+assert len(rels['people']) == 100 and len(rels['rooms']) == 10
+assert rels['people'].header == people.header
+assert set(rels['skills'].projection('id').content) <= set(rels['people'].projection('id').content)
+
+benchmark.benchmarks(rels)
+tmpdir = benchmark._tmpdir
+assert os.listdir(tmpdir)
+report = benchmark.run([100], repeat=1, verbose=False)
+results = report['results']['100']
+# The temporary files are removed
+assert benchmark._tmpdir is None and not os.path.exists(tmpdir)
+assert {'operator.' + i for i in ('selection', 'join', 'division', 'semijoin', 'antijoin', 'outer')} <= set(results)
+assert {'load.csv', 'load.json'} <= set(results)
+assert {'optimize.' + i for i in benchmark.QUERIES} <= set(results)
+assert {'query.' + i for i in benchmark.QUERIES} <= set(results)
+assert results['load.csv']['rows'] == 100
+assert results['query.select_join']['rows'] == len(benchmark.executor.execute(
+    benchmark.parser.tree(benchmark.QUERIES['select_join']), rels))
+
+# Regressions are the benchmarks slower than the threshold
+old = {'results': {'100': {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 0.0001}}}}
+new = {'results': {'100': {'a': {'seconds': 1.1}, 'b': {'seconds': 2.0}, 'c': {'seconds': 0.0009}, 'd': {'seconds': 5.0}}}}
+assert benchmark.compare(old, new) == [('100', 'b', 1.0, 2.0)]
+assert benchmark.compare(old, new, threshold=1.05) == [('100', 'a', 1.0, 1.1), ('100', 'b', 1.0, 2.0)]
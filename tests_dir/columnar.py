@@ -0,0 +1,58 @@
+import pickle
+from relational import statistics
+from relational.columnar import ColumnStore
+from relational.rtypes import Rdate
+
+# Conversion in both directions
+for rel in (people, dates, ratings, skills, people.outer_left(person_room.selection('id != 0'))):
+    store = rel.columns()
+    assert len(store) == len(rel)
+    assert store is rel.columns()
+    assert store.to_relation() is rel
+    assert ColumnStore.from_rows(rel.header, rel.content).to_relation() == rel
+
+assert people.columns().column('age').is_typed()
+assert ratings.columns().column('rating').is_typed()
+assert dates.columns().column('date').is_typed()
+assert not people.columns().column('name').is_typed()
+
+# Nulls are kept in typed columns
+room = people.outer_left(person_room.selection('id != 0')).columns().column('room')
+assert room.is_typed() and room.nullcount == 1
+assert None in list(room)
+
+# Attributes with only None values
+store = ColumnStore.from_rows(('a', 'b'), [(1, None), (2, None), (3, None)])
+column = store.column('b')
+assert column.nullcount == 3 and all(column.is_null(i) for i in range(3))
+assert list(column) == [None, None, None]
+assert store.to_relation() == ColumnStore.from_rows(('a', 'b'), [(3, None), (2, None), (1, None)]).to_relation()
+column = ColumnStore.from_relation(store.to_relation()).column('b')
+assert column.nullcount == 3 and all(column.is_null(i) for i in range(3))
+assert list(column) == [None, None, None]
+
+# Uniqueness
+store = ColumnStore(('a', 'b'))
+assert store.add((1, Rdate(2020, 1, 1)))
+assert not store.add((1, Rdate(2020, 1, 1)))
+assert store.add((None, None))
+assert not store.add((None, None))
+assert store.add((2 ** 70, 'x'))
+assert len(store) == 3
+assert (2 ** 70, 'x') in store
+assert not store.column('a').is_typed()
+assert store.take([0, 2]).to_relation() == store.to_relation().selection('b != None')
+
+# Relations built from a store stay consistent when the store changes
+rel = store.to_relation()
+store.add((3, None))
+assert len(rel) == 3 and len(store.to_relation()) == 4
+assert rel.columns() is not store
+
+# The cache is not saved
+people.types()
+statistics.of(people)
+loaded = pickle.loads(pickle.dumps(people))
+for i in ('_columns', '_statistics', '_types'):
+    assert i not in loaded.__dict__
+assert loaded.types() == people.types() and statistics.of(loaded) == statistics.of(people)
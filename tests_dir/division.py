@@ -0,0 +1,23 @@
+from relational.relation import Relation
+
+skill = skills.projection('skill')
+for divisor in (
+        skill,
+        skill.selection('skill == "C"'),
+        skill.selection('skill in ("C", "Python")'),
+        skill.selection('False'),
+        Relation(skill.header, frozenset({('Cobol', )})),
+        ):
+    assert skills.division(divisor) == skills._division_reference(divisor)
+
+a = people.join(person_room)
+assert a.division(a.projection('room', 'chief')) == a._division_reference(a.projection('room', 'chief'))
+
+for divisor in (skills, people):
+    try:
+        skills.division(divisor)
+        assert False
+    except AssertionError:
+        raise
+    except Exception:
+        pass
@@ -0,0 +1,102 @@
+from relational import optimizer, optimizations, parser
+from relational.executor import Executor, execute
+from relational.physical import Empty
+
+rels = parser.Relations({'people': people, 'skills': skills, 'rooms': rooms})
+
+# Constant folding
+assert optimizations.fold_constants('1 > 2') == 'False'
+assert optimizations.fold_constants('"a" in "abc"') == 'True'
+assert optimizations.fold_constants('age > 2 and 1 == 1') == 'age > 2'
+assert optimizations.fold_constants('3 > 1 or age > 2') == 'True'
+assert optimizations.fold_constants('(1 > 2 or 0) and age > 2') == 'False'
+# The operands before the constant are still evaluated, and can fail
+assert optimizations.fold_constants('age > 2 and (1 > 2 or 0)') == 'age > 2 and False'
+assert optimizations.fold_constants('age > 2 or 1 or name') == 'age > 2 or True'
+assert optimizations.fold_constants('age > 2 or name == "a"') == 'age > 2 or name == "a"'
+assert optimizations.fold_constants('age > 2 and (name == "a" or 1 > 2)') == 'age > 2 and (name == "a" or 1 > 2)'
+# Errors are left for the execution
+assert optimizations.fold_constants('1 / 0 == 1') == '1 / 0 == 1'
+
+# Known empty results are propagated
+for query, expected in (
+        ('σ True (people)', 'people'),
+        ('σ 1 > 2 (people) ⋈ skills', 'σ False (people⋈skills)'),
+        ('skills ∪ π id, skill (σ False (people) ⋈ skills)', 'skills'),
+        ('(people - people) * rooms', 'σ False (people*rooms)'),
+        ('people ▷ σ 2 < 1 (people)', 'people'),
+        ('people ⋉ σ False (skills)', 'σ False (people)'),
+        ('people ∩ σ 1 == 0 (people)', 'σ False (people)'),
+        ('(people ⋈ skills) - (people ⋈ skills)', 'σ False (people⋈skills)')):
+    debug = []
+    optimized = optimizer.optimize_all(query, rels, tostr=False, debug=debug)
+    assert str(optimized) == expected, (query, str(optimized), debug)
+    assert execute(optimized, rels) == execute(parser.tree(query), rels)
+
+# Union of relations that are not compatible is left to fail
+assert optimizer.optimize_all('people ∪ σ False (skills)', rels) == 'people∪σ False (skills)'
+
+
+class Recorder(Executor):
+    '''Records the nodes that are actually computed'''
+
+    def __init__(self, rels):
+        super().__init__(rels)
+        self.computed = set()
+
+    def operator(self, node, inputs):
+        self.computed.add(str(node))
+        return super().operator(node, inputs)
+
+
+# The executor does not compute what is not needed
+e = Recorder(rels)
+assert e.execute(parser.tree('σ False (people ⋈ skills)')) == people.join(skills).selection('False')
+assert not e.computed
+assert isinstance(e.evaluate(parser.tree('σ False (people)')), Empty)
+
+e = Recorder(rels)
+result = e.execute(parser.tree('(people ∩ σ age > 100 (people)) * π room (rooms)'))
+assert len(result) == 0 and set(result.header) == {'id', 'name', 'chief', 'age', 'room'}
+assert 'room' not in ''.join(e.computed)
+
+# Known empty operands do not hide the errors
+failing = parser.Relations(rels, e=people.selection('age > 1000'))
+for query in (
+        'e - skills',
+        'e ∩ skills',
+        'e ∪ skills',
+        'e ÷ people',
+        'e * people',
+        'σ False (people) - nonexist',
+        'σ False (people) ⋈ nonexist',
+        'σ False (nonexist)',
+        'e ⋈ π nonexist (people)',
+        'σ 1 == 2 (people) ÷ skills',
+        'σ False (σ id > 3 and age < 30 (skills))',
+        'e ⋈ σ nonexist > 1 (skills)',
+        'σ 1 > 2 (people) * σ nonexist (rooms)'):
+    for optimize in (False, True):
+        try:
+            node = parser.tree(query)
+            if optimize:
+                node = optimizer.optimize_all(node, failing, tostr=False)
+            execute(node, failing)
+            assert False, query
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+try:
+    execute(parser.tree('σ False (people) ⋈ nonexist'), failing)
+    assert False
+except NameError:
+    pass
+assert execute(parser.tree('e ÷ π id (people)'), failing).header == ('name', 'chief', 'age')
+
+# The names used by the conditions are known
+for prop in ('abs(id) > 1', 'any(i > id for i in (1, 2))', '(lambda i: i)(skill)'):
+    node = parser.Unary(parser.SELECTION, 'False', parser.Unary(parser.SELECTION, prop, parser.Variable('skills')))
+    assert len(execute(node, rels)) == 0
+# The condition on an empty result is not evaluated
+assert len(execute(parser.tree('σ nonexist (σ False (skills))'), rels)) == 0
@@ -0,0 +1,67 @@
+from relational import parser, physical
+from relational.executor import Executor, execute
+from relational.relation import Relation
+
+rels = {k: v for k, v in globals().items() if isinstance(v, Relation)}
+
+# Streaming operators only produce tuples when iterated
+plan = Executor(rels).evaluate(parser.tree('π name (σ age > 25 (people ⋈ skills))'))
+assert isinstance(plan, physical.Projection)
+assert isinstance(plan.child, physical.Selection)
+assert isinstance(plan.child.child, physical.HashJoin)
+assert plan.relation() == people.join(skills).selection('age > 25').projection('name')
+
+# Selection on a product is a theta join
+plan = Executor(rels).evaluate(parser.tree('σ id == i (people * ρ id➡i (person_room))'))
+assert isinstance(plan, physical.Materialize) and plan.method == 'thetajoin'
+
+try:
+    execute(parser.tree('σ age > (people)'), rels)
+    assert False
+except AssertionError:
+    raise
+except Exception:
+    pass
+
+try:
+    execute(parser.tree('nonexisting'), rels)
+    assert False
+except AssertionError:
+    raise
+except Exception:
+    pass
+
+
+# The hooks are called for every node
+class Counting(Executor):
+    def __init__(self, rels):
+        super().__init__(rels)
+        self.nodes = []
+
+    def after(self, node, op):
+        self.nodes.append(str(node))
+        return op
+
+e = Counting(rels)
+assert e.execute(parser.tree('people ∪ people')) == people
+assert e.nodes == ['people', 'people', 'people∪people']
+
+
+# before() can replace the evaluation of a node
+class Replacing(Executor):
+    def before(self, node):
+        if isinstance(node, parser.Variable) and node.name == 'people':
+            return physical.Scan(people.selection('id < 3'))
+        return None
+
+assert Replacing(rels).execute(parser.tree('π id (people)')) == people.selection('id < 3').projection('id')
+
+# Selections on large relations are done on the columns only if they can be
+from relational import vectorized
+from relational.relation import VECTORIZED_SELECTION_MIN
+big = {'big': Relation(people.header, frozenset((i, str(i), i % 3, i % 50) for i in range(VECTORIZED_SELECTION_MIN)))}
+plan = Executor(big).evaluate(parser.tree('σ name == \'3\' (big)'))
+assert isinstance(plan, physical.Selection)
+assert getattr(big['big'], '_columns', None) is None
+plan = Executor(big).evaluate(parser.tree('σ age > 25 (big)'))
+assert isinstance(plan, physical.Materialize) == (vectorized.numpy is not None)
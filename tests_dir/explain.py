@@ -0,0 +1,40 @@
+from relational import parser
+from relational.explain import explain
+from relational.maintenance import UserInterface
+
+rels = {'people': people, 'skills': skills}
+
+query = parser.tree('π name (σ age > 25 (people) ⋈ skills)')
+plan = explain(query, rels)
+assert plan.analyzed and plan.result == people.selection('age > 25').join(skills).projection('name')
+
+steps = list(plan)
+assert [i.node for i in steps] == [query, query.child, query.child.left, query.child.left.child, query.child.right]
+assert [i.operator for i in steps] == ['Projection', 'HashJoin', 'Selection', 'Scan', 'Scan']
+assert [i.rows for i in steps] == [len(plan.result), len(people.selection('age > 25').join(skills)), len(people.selection('age > 25')), len(people), len(skills)]
+assert steps[1].input_rows == [steps[2].rows, steps[4].rows]
+assert all(i.estimated is not None and i.time >= i.own_time >= 0 for i in steps)
+assert plan.time >= steps[0].time
+assert steps[3].estimated == len(people)
+
+text = str(plan)
+assert text.splitlines()[0].startswith('π name [Projection]  estimated: ')
+assert text.splitlines()[3].startswith('      people [Scan]')
+assert 'Total time: ' in text
+
+# Without executing
+plan = explain(query, rels, analyze=False)
+assert not plan.analyzed and plan.result is None
+assert all(i.rows is None and i.operator is None for i in plan)
+assert 'rows' not in str(plan) and len(str(plan).splitlines()) == 5
+
+# Theta joins and empty results
+plan = explain(parser.tree('σ id == i (people * ρ id➡i (skills))'), rels)
+assert [i.operator for i in plan] == ['Materialize (thetajoin)', 'Scan', 'Rename', 'Scan']
+plan = explain(parser.tree('σ False (people ⋈ skills)'), rels)
+assert [i.operator for i in plan] == ['Empty'] and plan.result == people.join(skills).selection('False')
+
+ui = UserInterface()
+ui.set_relation('people', people)
+plan = ui.explain('people ∪ people')
+assert plan.result == people and 'last_' not in ui.relations
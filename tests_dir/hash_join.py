@@ -0,0 +1,17 @@
+# The hash table is built on the smaller relation, so both
+# orders must give the same result
+assert people.join(skills) == skills.join(people)
+assert people.join(skills) == people.product(skills.rename({'id': 'i'})).selection('id == i').projection('id', 'name', 'chief', 'age', 'skill')
+
+# No shared attributes behaves like the product
+assert people.join(rooms) == people.product(rooms)
+
+# Tuples without a match are padded with None on both sides
+assert len(people.outer_left(person_room)) == len(people)
+assert len(person_room.outer_left(people)) == len(person_room)
+assert people.outer_left(person_room).selection('room is None').projection('id') == people.projection('id').difference(person_room.projection('id'))
+
+# The full outer join is the union of the left and right ones
+for a, b in ((people, person_room.selection('id != 0')), (person_room.selection('id != 0'), people), (people, rooms), (people.selection('False'), skills)):
+    assert a.outer(b) == a.outer_left(b).union(a.outer_right(b))
+    assert a.outer(b).header == a.outer_right(b).header
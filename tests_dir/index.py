@@ -0,0 +1,67 @@
+import pickle
+
+from relational import index, parser
+from relational.executor import Executor, execute
+from relational.maintenance import UserInterface
+from relational.physical import IndexSelection, IndexJoin, HashJoin, Selection
+from relational.relation import Relation
+
+rel = Relation(people.header, people.content)
+rels = {'people': rel, 'skills': skills}
+
+hashed = index.create(rel, 'id')
+assert index.create(rel, 'id') is hashed
+assert index.find(rel, 'id') is hashed and index.find(rel, 'id', index.SORTED) is None
+assert hashed.equal(3) == [i for i in rel.content if i[0] == 3]
+assert hashed.equal(100) == []
+
+ages = index.create(rel, 'age', index.SORTED)
+assert set(ages.equal(30)) == {i for i in rel.content if i[3] == 30}
+assert set(ages.range(25, False, 30, True)) == {i for i in rel.content if 25 < i[3] <= 30}
+assert set(ages.range(high=25)) == {i for i in rel.content if i[3] <= 25}
+assert ages.range(40) == []
+try:
+    index.create(rel, 'name', index.SORTED)
+    assert False
+except Exception:
+    pass
+
+# Same results, using the indexes
+for query, operator in (
+        ('σ id == 3 (people)', IndexSelection),
+        ('σ 3 == id and age > 20 (people)', IndexSelection),
+        ('σ id == \'3\' (people)', IndexSelection),
+        ('σ age > 25 and age <= 30 (people)', IndexSelection),
+        ('σ 20 < age < 30 or age == 33 (people)', Selection),
+        ('σ name == \'eve\' (people)', Selection),
+        ('people ⋈ skills', IndexJoin),
+        ('skills ⋈ people', IndexJoin),
+        ('skills ⋈ ρ id➡i (people)', HashJoin),
+        ):
+    node = parser.tree(query)
+    executor = Executor(rels)
+    assert isinstance(executor.evaluate(node), operator), query
+    assert executor.execute(node) == execute(node, {'people': people, 'skills': skills}), query
+assert len(execute(parser.tree('σ age > 40 (people)'), rels)) == 0
+
+# The indexes are not saved
+assert not index.of(pickle.loads(pickle.dumps(rel)))
+
+index.drop(rel, 'id')
+assert index.of(rel) == [ages]
+index.drop(rel)
+assert index.of(rel) == []
+
+# They go away with the relation
+ui = UserInterface()
+ui.set_relation('people', Relation(people.header, people.content))
+ui.create_index('people', 'id')
+ui.create_index('people', 'age', index.SORTED)
+assert [(i.attribute, i.kind) for i in ui.indexes('people')] == [('id', 'hash'), ('age', 'sorted')]
+assert 'hash index on id' in str(ui.explain('σ id == 2 (people)'))
+ui.execute('σ id < 4 (people)', 'people')
+assert ui.indexes('people') == []
+assert 'index' not in str(ui.explain('σ id == 2 (people)'))
+ui.create_index('people', 'id')
+ui.drop_index('people')
+assert ui.indexes('people') == []
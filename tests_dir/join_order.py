@@ -0,0 +1,44 @@
+from relational import optimizer, parser, statistics
+from relational.relation import Relation, Header
+from relational.executor import execute
+
+rels = {'people': people, 'skills': skills, 'person_room': person_room, 'rooms': rooms}
+model = statistics.CostModel(rels)
+
+# The chain is reordered when it is cheaper
+for query in ('people ⋈ skills ⋈ person_room ⋈ rooms', 'skills ⋈ rooms ⋈ people ⋈ person_room'):
+    debug = []
+    optimized = optimizer.optimize_all(query, rels, tostr=False, debug=debug)
+    assert any(i.startswith('join_order: ') for i in debug)
+    assert model.cost(optimized) < model.cost(parser.tree(query))
+    assert execute(optimized, rels) == execute(parser.tree(query), rels)
+    assert optimizer.optimize_all(query, rels, cost_based=False) == str(parser.tree(query))
+
+# A product that is not needed is removed, and one with
+# attributes in common is left to fail
+assert '*' not in optimizer.optimize_all('people * rooms ⋈ person_room', rels)
+assert optimizer.optimize_all('people * people ⋈ skills', rels) == 'people*people⋈skills'
+
+# Chains of relations r0 ⋈ r1 ⋈ r2..., where only the
+# consecutive ones have an attribute in common
+chain = {}
+for i in range(12):
+    chain['r%d' % i] = Relation(Header(('a%d' % i, 'a%d' % (i + 1))), frozenset((j, (j * 7 + i) % (5 + i)) for j in range(3 + i * 2)))
+
+
+def products(node):
+    if isinstance(node, parser.Binary):
+        return (node.name == parser.PRODUCT) + products(node.left) + products(node.right)
+    elif isinstance(node, parser.Unary):
+        return products(node.child)
+    return 0
+
+
+# Dynamic programming, with two parts that are not connected,
+# and the greedy algorithm on the long chains
+for order in ((3, 0, 2, 1, 5), (4, 0, 2, 1, 3), (11, 0, 5, 1, 9, 2, 8, 3, 7, 4, 6, 10)):
+    query = parser.tree(' ⋈ '.join('r%d' % i for i in order))
+    optimized = optimizer.optimize_all(query, chain, tostr=False)
+    assert products(optimized) <= sum(abs(a - b) != 1 for a, b in zip(sorted(order), sorted(order)[1:]))
+    assert execute(optimized, chain) == execute(query, chain)
+    assert statistics.CostModel(chain).cost(optimized) < statistics.CostModel(chain).cost(query)
@@ -0,0 +1,75 @@
+import time
+from relational import parser
+from relational.executor import execute
+from relational.maintenance import UserInterface
+
+# Binary operators are left associative
+assert parser.tree('a ∪ b - c * d') == parser.tree('((a ∪ b) - c) * d')
+assert parser.tree('a ∪ σ x (b) - c') == parser.tree('(a ∪ σ x (b)) - c')
+
+for query in ('a b', '∪ a', 'a ∪', 'a ∪ ∪ b', 'σ x (a) (b)', 'a σ x (b)', '()'):
+    try:
+        parser.tree(query)
+        assert False, query
+    except (parser.ParserException, parser.TokenizerException):
+        pass
+
+# Parses an expression with 10^4 operators without recursion
+start = time.perf_counter()
+n = 10 ** 4 // 2
+node = parser.tree(' ∪ '.join(['σ id > %d (people)' % i for i in range(n)]))
+depth = 0
+while isinstance(node, parser.Binary):
+    assert isinstance(node.right, parser.Unary) and node.right.prop == 'id > %d' % (n - 1 - depth)
+    node = node.left
+    depth += 1
+assert depth == n - 1
+
+node = parser.tree('(' * 10 ** 4 + 'people' + ')' * 10 ** 4)
+assert node == parser.Variable('people')
+print('Parsed 10^4 operators in %.3fs' % (time.perf_counter() - start))
+
+# And prints and executes it, also without recursion
+query = ' ∪ '.join(['σ id == %d (people)' % i for i in range(n)])
+node = parser.tree(query)
+assert parser.tree(str(node)) is node
+assert execute(node, {'people': people}) == people
+ui = UserInterface()
+ui.set_relation('people', people)
+assert ui.execute(query) == people
+assert ui.explain(query).result == people
+for analyze in (False, True):
+    plan = ui.explain(query, analyze)
+    assert len(list(plan)) == 3 * n - 1
+    lines = str(plan).split('\n')
+    assert lines[0].startswith('∪') and lines[n - 1].startswith('  ' * (n - 1) + 'σ id == 0')
+
+# The other walks of the tree
+assert node.get_left_leaf() == parser.Variable('people')
+python = parser.parse(query)
+assert python.startswith('people.selection(\'id == 0\').union(') and python.count('.union(') == n - 1
+lines = node.printtree().split('\n')
+assert lines[1] == '∪' and lines[n - 1] == '  ' * (n - 2) + '∪'
+assert len([i for i in lines if i.strip() == 'people']) == n
+
+deep = parser.tree('π id (' * n + 'people' + ')' * n)
+assert deep.get_left_leaf() == parser.Variable('people')
+assert parser.parse(str(deep)).count('.projection([\'id\'])') == n
+assert deep.printtree().count('π') == n
+
+# And optimizes it, within the time limit, without recursion
+from relational import optimizer
+from relational.parser import Relations
+from relational.statistics import CostModel
+rels = Relations({'people': people})
+model = CostModel(rels)
+single = model.estimate(parser.tree('σ id == 0 (people)')).rows
+assert abs(model.estimate(node).rows - n * single) < 10 ** -6 * n * single
+assert model.cost(node) > 0
+assert node.schema(rels).attributes == tuple(people.header)
+assert optimizer.JoinOrder(rels, model).reorder(node) is node
+assert optimizer.Rewriter([], top_down=True).rewrite(node) is node
+stats = {}
+optimized = optimizer.optimize_all(node, rels, tostr=False, timeout=1, stats=stats)
+assert stats['applications'] > 0
+assert execute(optimized, rels) == people
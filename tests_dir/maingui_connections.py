@@ -0,0 +1,23 @@
+import xml.etree.ElementTree as ET
+
+ui = ET.parse('relational_gui/maingui.ui').getroot()
+
+connections = {}
+for connection in ui.iter('connection'):
+    # One slot for every connection
+    assert len(connection.findall('slot')) == 1, connection.find('sender').text
+    connections.setdefault(connection.find('sender').text, []).append(connection.find('slot').text)
+
+declared = {i.text for i in ui.find('slots').findall('slot')}
+
+# Every operator button has its own connection, to a declared slot
+for button in ui.iter('widget'):
+    if button.get('class') != 'QPushButton':
+        continue
+    name = button.get('name')
+    assert len(connections.get(name, [])) == 1, name
+    assert connections[name][0] in declared or connections[name][0] == 'clear()', name
+
+assert connections['cmdSemiJoin'] == ['addSemiJoin()']
+assert connections['cmdAntiJoin'] == ['addAntiJoin()']
+assert connections['cmdOuter'] == ['addOuter()']
@@ -0,0 +1,25 @@
+import pickle
+from relational import parser
+from relational.parser import Variable, Unary, Binary
+
+# Equal trees are the same object
+a = parser.tree('π name (σ id > 2 (people)) ∪ skills')
+b = parser.tree('(π name (σ id > 2 ((people)))) ∪ skills')
+assert a is b
+assert a.left is Unary(parser.PROJECTION, 'name', Unary(parser.SELECTION, 'id > 2', Variable('people')))
+assert a is not parser.tree('π name (σ id > 3 (people)) ∪ skills')
+assert hash(a) == hash(b)
+assert len({a, b, a.left}) == 2
+
+# Nodes can't be modified
+for attr, value in (('name', 'x'), ('left', Variable('x')), ('prop', 'x')):
+    try:
+        setattr(a, attr, value)
+        assert False
+    except AttributeError:
+        pass
+
+assert pickle.loads(pickle.dumps(a)) is a
+
+assert Unary.projection(['a', 'b'], a) is Unary(parser.PROJECTION, 'a,b', a)
+assert Unary.rename({'a': 'b'}, a).get_rename_prop() == {'a': 'b'}
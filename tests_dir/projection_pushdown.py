@@ -0,0 +1,75 @@
+from relational import optimizer, optimizations, parser, statistics
+from relational.executor import execute
+
+rels = parser.Relations({'people': people, 'skills': skills, 'person_room': person_room, 'rooms': rooms})
+
+
+def check(query, expected=None):
+    optimized = optimizer.optimize_all(query, rels, tostr=False)
+    assert execute(optimized, rels) == execute(parser.tree(query), rels)
+    if expected is not None:
+        assert str(optimized) == expected, str(optimized)
+    return optimized
+
+
+def widths(node):
+    '''Amount of attributes of every operand of the joins'''
+    if isinstance(node, parser.Binary):
+        r = widths(node.left) + widths(node.right)
+        if node.name in (parser.JOIN, parser.PRODUCT):
+            r += [len(node.left.result_format(rels)), len(node.right.result_format(rels))]
+        return r
+    elif isinstance(node, parser.Unary):
+        return widths(node.child)
+    return []
+
+
+# The join attributes and the attributes of the selections are kept
+n, changes = optimizations.projection_pushdown(parser.tree('π name (σ age > 25 (people ⋈ skills))'), rels)
+assert changes == 2
+assert str(n) == 'π name (σ age > 25 (π id,name,age (people)⋈π id (skills)))'
+
+n, changes = optimizations.projection_pushdown(parser.tree('π name (people ∪ people)'), rels)
+assert str(n) == 'π name (people)∪π name (people)'
+
+# Nothing to remove
+n, changes = optimizations.projection_pushdown(parser.tree('π id, skill (person_room ⋈ skills)'), rels)
+assert changes == 1
+n, changes = optimizations.projection_pushdown(parser.tree('π id, skill, room (person_room ⋈ skills)'), rels)
+assert changes == 0
+n, changes = optimizations.projection_pushdown(parser.tree('π name (π id,name (people) ⋈ skills)'), rels)
+assert changes == 1
+
+# Invalid projections are left to fail
+n, changes = optimizations.projection_pushdown(parser.tree('π nope (people ⋈ skills)'), rels)
+assert changes == 0
+for query in ('π id (people ∪ skills)', 'π id (people ∪ ρ skill➡name (skills))',
+              'π name,skill ((π room,phone,skill (σ id == 2 (skills))) ⧑ people)',
+              'π name,skill (people ⋈ π room,phone,skill (σ id == 2 (skills)))',
+              'π skill (π room,skill (skills) ∪ π skill,room (skills))'):
+    n, changes = optimizations.projection_pushdown(parser.tree(query), rels)
+    assert changes == 0
+    try:
+        execute(optimizer.optimize_all(query, rels, tostr=False), rels)
+        assert False, query
+    except AssertionError:
+        raise
+    except Exception:
+        pass
+
+# Also when the projection is replaced with a semijoin
+for query in ('π skill ((π room,phone,skill (σ id == 2 (skills))) ⋈ people)',
+              'π name (people ⋈ π room,skill (skills))'):
+    n, changes = optimizations.projection_and_join(parser.tree(query), rels)
+    assert changes == 0
+
+query = 'π name, room (people ⋈ person_room ⋈ rooms)'
+optimized = check(query)
+assert max(widths(optimized)) < max(widths(parser.tree(query)))
+model = statistics.CostModel(rels)
+assert model.cost(optimized) < model.cost(parser.tree(query))
+
+check('π name (σ age > 25 and skill == "C" (people ⋈ skills))')
+check('π name, skill (people * ρ id➡i (skills))', 'π name (people)*π skill (skills)')
+check('π name, age (ρ years➡age (σ years > 20 (ρ age➡years (people)) ⋈ skills))')
+check('π name, room (people ⧑ person_room)')
@@ -0,0 +1,40 @@
+from relational.maintenance import UserInterface, QueryCache
+from relational.relation import Relation
+
+ui = UserInterface()
+ui.set_relation('people', people)
+ui.set_relation('skills', skills)
+
+q = 'π name (σ age > 25 (people ⋈ skills))'
+r = ui.execute(q)
+assert ui.query_cache.misses == 1 and ui.query_cache.hits == 0
+assert ui.execute(' ' + q) == r
+assert ui.query_cache.misses == 1 and ui.query_cache.hits == 1
+
+# Each line of a program is cached
+ui.multi_execute('a = people\nb = σ id > 2 (a)')
+ui.multi_execute('a = people\nb = σ id > 2 (a)')
+assert ui.query_cache.hits == 3
+assert ui.get_relation('b') == people.selection('id > 2')
+
+# Errors are not cached
+for i in range(2):
+    try:
+        ui.execute('σ (people')
+        assert False
+    except AssertionError:
+        raise
+    except Exception:
+        pass
+assert len(ui.query_cache) == 3
+
+# Least recently used entries are dropped
+cache = QueryCache(2)
+a = cache.tree('people')
+cache.tree('skills')
+assert cache.tree('people') is a
+cache.tree('rooms')
+assert len(cache) == 2
+assert cache.tree('people') is a
+cache.tree('skills')
+assert cache.misses == 4 and cache.hits == 2
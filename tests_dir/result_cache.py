@@ -0,0 +1,77 @@
+from relational import parser
+import gc
+from relational.maintenance import UserInterface, ResultCache
+from relational.physical import Scan
+from relational.relation import Relation, Header
+
+ui = UserInterface()
+ui.set_relation('people', people)
+ui.set_relation('skills', skills)
+cache = ui.result_cache
+
+q = 'π name (σ age > 25 (people ⋈ skills))'
+r = ui.execute(q)
+assert cache.hits == 0 and len(cache) > 0
+assert ui.execute(q) is r
+assert cache.hits == 1 and cache.bytes_saved > 0
+
+# A different relation, even with the same content, is not the same input
+ui.set_relation('people', Relation(people.header, frozenset(list(people.content))))
+assert ui.execute(q) == r
+assert cache.hits == 1
+
+# Different content
+ui.set_relation('people', people.selection('age > 30'))
+assert ui.execute(q) == people.selection('age > 30').join(skills).selection('age > 25').projection('name')
+assert cache.hits == 1
+ui.set_relation('people', people)
+
+# Relations with the same header, size and hash
+ui.set_relation('R', Relation(Header(('a', )), frozenset({(-1, )})))
+assert ui.execute('π a (R)') == ui.get_relation('R')
+ui.set_relation('R', Relation(Header(('a', )), frozenset({(-2, )})))
+gc.collect()
+assert hash(frozenset({(-1, )})) == hash(frozenset({(-2, )}))
+assert ui.execute('π a (R)') == ui.get_relation('R')
+
+# Subqueries already seen are kept and used by other queries
+ui.execute('σ age > 20 (people) ⋈ skills')
+ui.execute('π name (σ age > 20 (people))')
+hits = cache.hits
+assert ui.execute('π id (σ age > 20 (people))') == people.selection('age > 20').projection('id')
+assert cache.hits == hits + 1
+
+# And so are the ones appearing twice in the same query
+node = parser.tree('π name (σ id > 2 (people)) ∪ π name (σ id > 2 (people) ⋈ skills)')
+hits = cache.hits
+cache.execute(node, ui.relations)
+assert cache.hits == hits + 1
+
+# Every line of a program
+ui.multi_execute('a = σ id > 3 (people)\nb = a ⋈ skills')
+hits = cache.hits
+ui.multi_execute('a = σ id > 3 (people)\nb = a ⋈ skills')
+assert cache.hits == hits + 2
+assert ui.get_relation('b') == people.selection('id > 3').join(skills)
+
+# Least recently used results are dropped when they take too much memory
+small = ResultCache()
+rels = {'people': people, 'skills': skills}
+a = small.execute(parser.tree('σ id > 3 (people)'), rels)
+small.execute(parser.tree('σ id < 3 (people)'), rels)
+assert small.execute(parser.tree('σ id > 3 (people)'), rels) is a
+small.max_bytes = small.bytes
+small.execute(parser.tree('σ id == 5 (people)'), rels)
+assert small.evictions == 1 and len(small) == 2 and small.bytes <= small.max_bytes
+hits = small.hits
+assert small.execute(parser.tree('σ id > 3 (people)'), rels) is a
+assert small.execute(parser.tree('σ id < 3 (people)'), rels) == people.selection('id < 3')
+assert small.hits == hits + 1
+
+# Too large to be kept
+tiny = ResultCache(max_bytes=10)
+tiny.execute(parser.tree('σ id > 3 (people)'), rels)
+assert len(tiny) == 0 and tiny.bytes == 0
+
+cache.clear()
+assert len(cache) == 0 and cache.hits == 0 and cache.bytes == 0
@@ -0,0 +1,29 @@
+from relational import optimizer, parser
+from relational.executor import execute
+
+rels = {'people': people, 'skills': skills}
+query = 'σ age > 25 (σ id > 1 (people)) ∪ σ age > 25 (σ id > 1 (people) ∪ σ id > 3 (people))'
+
+stats = {}
+debug = []
+result = optimizer.optimize_all(query, rels, stats=stats, debug=debug)
+assert stats['complete']
+assert stats['applications'] == len(debug) > 0
+assert execute(parser.tree(result), rels) == execute(parser.tree(query), rels)
+
+# Repeated subtrees are rewritten once, so there is one
+# duplicated_select and one futile_union_intersection_subtraction
+# for every union
+q = ' ∪ '.join(['σ id > 1 (σ age > 20 (people))'] * 50)
+stats = {}
+assert optimizer.optimize_all(q, rels, stats=stats) == 'σ age > 20 and id > 1 (people)'
+assert stats['applications'] == 50
+
+# Out of time, the query is returned as it is
+stats = {}
+assert optimizer.optimize_all(query, rels, timeout=0, stats=stats) == str(parser.tree(query))
+assert not stats['complete'] and stats['applications'] == 0
+
+stats = {}
+result = optimizer.optimize_all(query, rels, max_passes=1, stats=stats)
+assert execute(parser.tree(result), rels) == execute(parser.tree(query), rels)
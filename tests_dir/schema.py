@@ -0,0 +1,31 @@
+from relational import parser
+from relational.parser import Schema, Relations
+from relational.rtypes import Rdate
+
+rels = Relations({'people': people, 'skills': skills, 'dates': dates})
+
+assert people.types() == (int, str, int, int)
+assert dates.types() == (Rdate, )
+
+s = parser.tree('π name, id (people ⋈ skills)').schema(rels)
+assert s == Schema(('name', 'id'), (str, int))
+
+s = parser.tree('ρ id➡i (people ⋈ skills)').schema(rels)
+assert s.attributes == ('i', 'name', 'chief', 'age', 'skill')
+assert s.type_of('skill') == str and s.type_of('id') is None
+
+s = parser.tree('people * ρ date➡id (dates)').schema(rels)
+assert s.type_of('name') == str and s.types[-1] == Rdate
+
+# Different types in union
+s = parser.tree('π id (people) ∪ ρ date➡id (dates)').schema(rels)
+assert s == Schema(('id', ), (None, ))
+
+assert parser.tree('people ÷ π id (people)').result_format(rels) == ['name', 'chief', 'age']
+
+# Schemas are kept in the nodes only for Relations
+node = parser.tree('σ id > 2 (people ⋈ skills)')
+assert node.schema(rels) is node.schema(rels)
+plain = {'people': people, 'skills': skills}
+assert node.schema(plain) is not node.schema(plain)
+assert node.schema(plain) == node.schema(rels)
@@ -0,0 +1,15 @@
+# Attributes are visible from nested scopes and builtins are available
+assert people.selection('len(name) == 4') == people.selection('any(len(name) == l for l in (4, ))')
+assert people.selection('age > 20') == people.selection('age > min(20, 30)')
+
+# The same expression on a different header is compiled again
+assert len(people.rename({'age': 'a'}).selection('a > 20')) == len(people.selection('age > 20'))
+
+for expr in ('age >', 'unknown_name', 'name > 3'):
+    try:
+        people.selection(expr)
+        assert False, expr
+    except AssertionError:
+        raise
+    except Exception:
+        pass
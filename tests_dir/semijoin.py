@@ -0,0 +1,54 @@
+from relational import optimizer, optimizations, parser
+from relational.executor import execute
+from relational.physical import Scan, SemiJoin
+
+rels = parser.Relations({'people': people, 'skills': skills, 'rooms': rooms, 'person_room': person_room})
+
+# Same as projecting the join, or removing that projection
+for a, b in ((people, skills), (skills, people), (people, person_room), (people, skills.selection('False'))):
+    joined = a.join(b).projection(*a.header)
+    assert a.semijoin(b) == joined
+    assert a.antijoin(b) == a.difference(joined)
+    assert a.semijoin(b).header == a.header
+    assert SemiJoin(Scan(a), Scan(b)).relation() == a.semijoin(b)
+    assert SemiJoin(Scan(a), Scan(b), anti=True).relation() == a.antijoin(b)
+
+# No shared attributes
+assert people.semijoin(rooms) == people
+assert people.antijoin(rooms) == people.selection('False')
+assert people.semijoin(rooms.selection('False')) == people.selection('False')
+
+# Grammar
+assert str(parser.tree('people ⋉ skills ▷ rooms')) == 'people⋉skills▷rooms'
+assert parser.tree('people ⋉ skills').result_format(rels) == list(people.header)
+assert parser.parse('people ▷ skills') == 'people.antijoin(skills)'
+
+# Rewrites
+query = 'π id,name,chief,age (people ⋈ skills)'
+n, changes = optimizations.projection_and_join(parser.tree(query), rels)
+assert str(n) == 'π id,name,chief,age (people⋉skills)'
+n, changes = optimizations.projection_and_join(parser.tree('π skill (people ⋈ skills)'), rels)
+assert str(n) == 'π skill (skills⋉people)'
+n, changes = optimizations.projection_and_join(parser.tree('π name, skill (people ⋈ skills)'), rels)
+assert changes == 0
+
+n, changes = optimizations.difference_and_semijoin(parser.tree('people - (people ⋉ skills)'), rels)
+assert str(n) == 'people▷skills'
+n, changes = optimizations.difference_and_semijoin(parser.tree('people - ' + query), rels)
+assert str(n) == 'people▷skills'
+n, changes = optimizations.difference_and_semijoin(parser.tree('people ∩ ' + query), rels)
+assert str(n) == 'people⋉skills'
+n, changes = optimizations.difference_and_semijoin(parser.tree('people - π id,name (people ⋈ skills)'), rels)
+assert changes == 0
+
+n, changes = optimizations.selection_and_semijoin(parser.tree('σ age > 25 (people ▷ skills)'))
+assert str(n) == 'σ age > 25 (people)▷skills'
+
+for query, expected in (
+        ('π id,name,chief,age (people ⋈ skills)', 'people⋉skills'),
+        ('people - π id,name,chief,age (people ⋈ skills)', 'people▷skills'),
+        ('π room (rooms ⋈ person_room)', 'π room (rooms⋉person_room)'),
+        ('σ age > 25 (people ⋉ skills)', 'σ age > 25 (people)⋉skills')):
+    optimized = optimizer.optimize_all(query, rels, tostr=False)
+    assert str(optimized) == expected, str(optimized)
+    assert execute(optimized, rels) == execute(parser.tree(query), rels)
@@ -0,0 +1,34 @@
+from relational import optimizer, parser, statistics
+from relational.maintenance import UserInterface
+
+rels = {'people': people, 'skills': skills}
+
+s = statistics.of(people)
+assert s is statistics.of(people)
+assert s.rows == len(people)
+assert s.column('id').distinct == 8 and s.column('chief').distinct == 3
+assert s.column('age').min == 20 and s.column('age').max == 33
+assert s.column('age').histogram[0] == 20 and s.column('age').histogram[-1] == 33
+assert s.column('name').histogram is None
+assert s.column('age').fraction_below(20) == 0 and s.column('age').fraction_below(40) == 1
+
+# Statistics are computed when a relation is added
+ui = UserInterface()
+ui.set_relation('skills', skills)
+assert getattr(skills, '_statistics', None) is not None
+
+model = statistics.CostModel(rels)
+assert model.estimate(parser.tree('σ False (people)')).rows == 0
+assert model.estimate(parser.tree('σ id == 2 (people)')).rows == 1
+assert model.estimate(parser.tree('σ age > 40 or age < 15 (people)')).rows == 0
+assert 0 < model.estimate(parser.tree('σ age > 25 (people)')).rows < len(people)
+assert model.estimate(parser.tree('people * skills')).rows == len(people) * len(skills)
+assert model.estimate(parser.tree('people ⋈ skills')).rows < len(people) * len(skills)
+assert model.estimate(parser.tree('π chief (people)')).rows == 3
+assert model.cost(parser.tree('σ age > 25 (people) ⋈ skills')) < model.cost(parser.tree('σ age > 25 (people ⋈ skills)'))
+
+# The projection removes most of the tuples, so the selection
+# is not moved inside it
+query = 'σ chief > 0 (π chief (people))'
+assert optimizer.optimize_all(query, rels) == query
+assert optimizer.optimize_all(query, rels, cost_based=False) == 'π chief (σ chief > 0 (people))'
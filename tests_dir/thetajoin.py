@@ -0,0 +1,23 @@
+boss = people.rename({'id': 'i', 'name': 'n', 'chief': 'c', 'age': 'a'})
+
+# Equalities are executed as hash join, the rest is filtered afterwards
+for expr in (
+        'i == chief',
+        'chief == i',
+        'i == chief and age > a',
+        'age > a and (i == chief and n != name)',
+        'i == chief or age > a',
+        'i == chief and c == id',
+        'i == 3',
+        ):
+    assert people.thetajoin(boss, expr) == people.product(boss).selection(expr), expr
+    assert boss.thetajoin(people, expr) == boss.product(people).selection(expr), expr
+
+# Colliding attributes are still an error
+try:
+    people.thetajoin(people, 'id == id')
+    assert False
+except AssertionError:
+    raise
+except Exception:
+    pass
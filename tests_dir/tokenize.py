@@ -0,0 +1,19 @@
+from relational import parser
+
+tokens = parser.tokenize("σ name == '(' (people) ⋈ (skills)")
+assert tokens == ['σ', "name == '('", ['people'], '⋈', ['skills']]
+assert [tokens[0].offset, tokens[1].offset, tokens[2][0].offset, tokens[3].offset, tokens[4][0].offset] == [0, 2, 15, 23, 26]
+
+assert parser.tokenize('π (a, b) (people)') == ['π', '(a, b)', ['people']]
+assert parser.tokenize('((a))*b2') == [[['a']], '*', 'b2']
+
+for query in ('(people', 'people)', 'σ a > 1', 'π a (b ∪ π c)'):
+    try:
+        parser.tokenize(query)
+        assert False, query
+    except parser.TokenizerException:
+        pass
+
+# Long expressions are tokenized in linear time
+query = ' ⋈ '.join(['σ id > 1 (people)'] * 20000)
+assert len(parser.tokenize(query)) == 20000 * 3 + 19999
@@ -0,0 +1,47 @@
+from relational import vectorized
+from relational.relation import Relation
+from relational.rtypes import Rdate
+
+supported = (
+    'age > 21',
+    'age > 21 and chief == 0',
+    'not (age >= 30 or id < 2)',
+    '-1 < id <= 5 and age != 30.0',
+    '1 > 2',
+    '1 < 2',
+)
+unsupported = (
+    'name == "john"',
+    'age + 1 > 21',
+    'age',
+    'age > 20 and name',
+    'len(name) > 3',
+)
+
+for expr in supported:
+    r = vectorized.selection(people, expr)
+    assert r is None or r == people.selection(expr), expr
+    assert (r is None) == (vectorized.numpy is None), expr
+for expr in unsupported:
+    assert vectorized.selection(people, expr) is None, expr
+
+for expr in ('date.year == 2008', 'date.month > 6 and date.day < 13', 'date.weekday == 4'):
+    r = vectorized.selection(dates, expr)
+    assert r is None or r == dates.selection(expr), expr
+assert vectorized.selection(dates, 'date > 2008') is None
+
+# Columns with None are not supported
+assert vectorized.selection(people.outer_left(person_room.selection('id != 0')), 'room > 1') is None
+
+r = vectorized.selection(ratings, 'rating > 5.5')
+assert r is None or r == ratings.selection('rating > 5.5')
+
+# Large relations use it automatically, and only get the
+# columns when an expression can use them
+big = Relation(people.header, frozenset((i, str(i), i % 3, i % 50) for i in range(20000)))
+assert vectorized.supported(big, 'age > 25') == (vectorized.numpy is not None)
+assert not vectorized.supported(big, 'name == "1"')
+assert len(big.selection('name == "1" or age == 3')) == len([i for i in big if i[1] == '1' or i[3] == 3])
+assert getattr(big, '_columns', None) is None
+assert len(big.selection('age > 25 and chief == 1')) == len([i for i in big if i[3] > 25 and i[2] == 1])
+assert (getattr(big, '_columns', None) is None) == (vectorized.numpy is None)